@@ -0,0 +1,293 @@
+import heapq
+import itertools
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class Throttled(Exception):
+    """Request refused by admission control; retry_after is a hint in seconds, reason a metrics label"""
+
+    def __init__(self, message, retry_after, reason='overload'):
+        super().__init__(message)
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+        self.reason = reason
+
+
+def _refill(tokens, updated, now, rate, burst):
+    return min(burst, tokens + (now - updated) * rate)
+
+
+class TokenBuckets:
+    """Per-key token buckets held in this process.
+
+    Each key starts with ``burst`` tokens and refills at ``rate`` tokens per
+    second. At most ``max_keys`` buckets are kept, and the least recently
+    used are dropped (a dropped key simply starts full again).
+    """
+
+    def __init__(self, rate, burst, max_keys=100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, cost=1.0):
+        """Spend cost tokens; returns 0 if allowed, else the seconds until enough tokens refill"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = _refill(tokens, updated, now, self.rate, self.burst)
+            wait = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def available(self, key):
+        """Tokens key could spend right now, without spending any"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.burst, now))
+            return _refill(tokens, updated, now, self.rate, self.burst)
+
+    def stats(self):
+        with self._lock:
+            return {'keys': len(self._buckets), 'rate': self.rate, 'burst': self.burst}
+
+
+class SQLiteTokenBuckets:
+    """Token buckets in a SQLite file shared by every gunicorn worker on the host"""
+
+    def __init__(self, path, rate, burst):
+        self.path = path
+        self.rate = rate
+        self.burst = burst
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS token_buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL
+            )
+        """)
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def take(self, key, cost=1.0):
+        # Wall clock, since the timestamps are compared across processes
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM token_buckets WHERE key = ?", (key,)).fetchone()
+            tokens = self.burst if row is None else _refill(row[0], row[1], now, self.rate, self.burst)
+            wait = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / self.rate
+            conn.execute("INSERT OR REPLACE INTO token_buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                         (key, tokens, now))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    def available(self, key):
+        row = self._conn().execute("SELECT tokens, updated FROM token_buckets WHERE key = ?", (key,)).fetchone()
+        return self.burst if row is None else _refill(row[0], row[1], time.time(), self.rate, self.burst)
+
+    def purge_idle(self):
+        """Drop buckets that have been full for a while (they would start full anyway)"""
+        conn = self._conn()
+        cutoff = time.time() - self.burst / self.rate
+        deleted = conn.execute("DELETE FROM token_buckets WHERE updated < ?", (cutoff,)).rowcount
+        return deleted
+
+    def stats(self):
+        count = self._conn().execute("SELECT COUNT(*) FROM token_buckets").fetchone()[0]
+        return {'keys': count, 'rate': self.rate, 'burst': self.burst}
+
+
+class AdaptiveLimit:
+    """Concurrency limit that follows the upstream latency trend (a gradient limit, as in Netflix's Gradient2).
+
+    Two moving averages of call latency are kept: a short one over about
+    the last ``short_window`` calls and a long one over about
+    ``long_window`` (``baseline``). The gradient ``tolerance`` x long /
+    short, capped at 1, only drops below 1 when recent calls are markedly
+    slower than usual, so ordinary latency variance leaves the limit alone.
+    Each sample moves the limit ``smoothing`` of the way towards
+    limit x gradient + sqrt(limit): it grows while the upstream keeps pace
+    and settles where recent latency starts to climb. An error or timeout
+    multiplies it by ``backoff``, at most once per ``cooldown`` seconds.
+    """
+
+    def __init__(self, initial=16, min_limit=2, max_limit=64, tolerance=1.5, short_window=10, long_window=500,
+                 smoothing=0.2, backoff=0.9, cooldown=1.0):
+        self.value = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.short_alpha = 2 / (short_window + 1)
+        self.long_alpha = 2 / (long_window + 1)
+        self.smoothing = smoothing
+        self.backoff = backoff
+        self.cooldown = cooldown
+        self.short = None
+        self.baseline = None
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        self.increases = 0
+        self.decreases = 0
+
+    def observe(self, latency, ok=True):
+        """Feed one upstream call; latency may be None when only the outcome is known"""
+        with self._lock:
+            if not ok:
+                now = time.monotonic()
+                if now - self._last_decrease >= self.cooldown:
+                    self.value = max(self.min_limit, self.value * self.backoff)
+                    self._last_decrease = now
+                    self.decreases += 1
+                return
+            gradient = 1.0
+            if latency is not None:
+                if self.baseline is None:
+                    self.short = self.baseline = latency
+                else:
+                    self.short += self.short_alpha * (latency - self.short)
+                    self.baseline += self.long_alpha * (latency - self.baseline)
+                    # Once an overload passes, don't keep measuring against the inflated average
+                    if self.baseline > 2 * self.short:
+                        self.baseline *= 0.95
+                gradient = max(0.5, min(1.0, self.tolerance * self.baseline / self.short))
+            target = self.value * gradient + math.sqrt(self.value)
+            value = min(self.max_limit, max(self.min_limit, self.value + self.smoothing * (target - self.value)))
+            if value > self.value:
+                self.increases += 1
+            elif value < self.value:
+                self.decreases += 1
+            self.value = value
+
+    @property
+    def current(self):
+        return max(self.min_limit, int(self.value))
+
+
+class _Waiter:
+    __slots__ = ('priority', 'seq', 'event', 'granted', 'cancelled')
+
+    def __init__(self, priority, seq):
+        self.priority = priority
+        self.seq = seq
+        self.event = threading.Event()
+        self.granted = False
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class AdmissionController:
+    """Admits at most ``limit.current`` concurrent requests; the rest wait in a bounded priority queue.
+
+    Lower priority numbers go first (logged-in users are 0, anonymous
+    callers 1). When the queue is full, a new request evicts the
+    lowest-priority waiter if it outranks it, otherwise it is refused.
+    Waiters give up after ``max_wait`` seconds. Refusals raise Throttled.
+    """
+
+    def __init__(self, limit, max_queue=64, max_wait=5.0):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._waiters = []
+        self._waiting = 0
+        self._in_flight = 0
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.queued = 0
+        self.shed = 0
+
+    def _retry_after(self):
+        return max(1.0, self.limit.baseline or 1.0)
+
+    def acquire(self, priority=1):
+        with self._lock:
+            if self._in_flight < self.limit.current and not self._waiting:
+                self._in_flight += 1
+                self.admitted += 1
+                return
+            if self._waiting >= self.max_queue:
+                worst = max((w for w in self._waiters if not w.cancelled), default=None)
+                if worst is None or worst.priority <= priority:
+                    self.shed += 1
+                    raise Throttled("Server is busy, please retry shortly", self._retry_after())
+                worst.cancelled = True
+                self._waiting -= 1
+                self.shed += 1
+                worst.event.set()
+            waiter = _Waiter(priority, next(self._seq))
+            heapq.heappush(self._waiters, waiter)
+            self._waiting += 1
+            self.queued += 1
+
+        waiter.event.wait(self.max_wait)
+        with self._lock:
+            if waiter.granted:
+                self.admitted += 1
+                return
+            if not waiter.cancelled:
+                waiter.cancelled = True
+                self._waiting -= 1
+                self.shed += 1
+        raise Throttled("Server is busy, please retry shortly", self._retry_after())
+
+    def release(self):
+        with self._lock:
+            self._in_flight -= 1
+            while self._waiters and self._in_flight < self.limit.current:
+                waiter = heapq.heappop(self._waiters)
+                if waiter.cancelled:
+                    continue
+                waiter.granted = True
+                self._waiting -= 1
+                self._in_flight += 1
+                waiter.event.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'limit': self.limit.current,
+                'baseline_latency': round(self.limit.baseline or 0.0, 3),
+                'recent_latency': round(self.limit.short or 0.0, 3),
+                'in_flight': self._in_flight,
+                'waiting': self._waiting,
+                'max_queue': self.max_queue,
+                'admitted': self.admitted,
+                'queued': self.queued,
+                'shed': self.shed,
+                'limit_increases': self.limit.increases,
+                'limit_decreases': self.limit.decreases
+            }
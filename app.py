@@ -1,78 +1,211 @@
 import os
-from flask import Flask, request, jsonify, render_template
-import google.generativeai as genai
-import traceback
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context
+import logging
+import uuid
 from flask_cors import CORS
-from database import Database
-from flask import session, redirect, url_for
+from flask import session, redirect, url_for, g
+from werkzeug.middleware.proxy_fix import ProxyFix
 import mysql.connector
 from mysql.connector import Error
-from mysql.connector import pooling
-from database import Database
+from database import create_database
+from model_backends import create_model
+from cache import AnalysisCache, normalize_symptoms, cache_key
+from semantic_cache import SemanticCache
+from triage import TriageEngine
+from llm_gateway import LLMGateway, GatewayBusy, GatewayTimeout, GatewayUnavailable
+from resilience import CircuitBreaker
+from singleflight import SingleFlight
+from write_behind import HistoryWriter
+from conversations import ConversationStore
+from page_cache import PageCache
+from lazy import PerProcess
+from logging_setup import setup_logging
+from admission import AdaptiveLimit, AdmissionController, SQLiteTokenBuckets, TokenBuckets, Throttled
+from reminders import ReminderScheduler, create_notifier, parse_reminder_time, parse_schedule
+from dashboard_cache import DashboardCache, SQLiteUserVersions, UserVersions
+from archive import HistoryArchive
+from export import FORMATS as EXPORT_FORMATS, export_stream
+from compression import DEFAULT_MIMETYPES as COMPRESSIBLE_MIMETYPES, Compressor
+import metrics
+import images
+import time
 import json
 import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 import hashlib
+import base64
+import tempfile
+import threading
+import click
+from datetime import datetime
 from dotenv import load_dotenv
 load_dotenv()
 
 
 app = Flask(__name__)
+# Structured JSON logs written by a background thread (see logging_setup.py)
+log_handler = setup_logging()
+log = logging.getLogger('app')
+access_log = logging.getLogger('app.access')
 app.secret_key = os.getenv('FLASK_SECRET_KEY')
 CORS(app, resources={r"/api/*": {"origins": "*"}}, supports_credentials=True)
+# Behind a load balancer (e.g. Heroku's router) set TRUSTED_PROXY_COUNT=1 so
+# request.remote_addr is the client from X-Forwarded-For, not the proxy
+if int(os.getenv('TRUSTED_PROXY_COUNT', '0')):
+    proxies = int(os.getenv('TRUSTED_PROXY_COUNT'))
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies)
 
 
-db = Database()
+def instrument_db(database):
+    # Per-method DB latency histograms for /metrics
+    metrics.instrument(database, [
+        'register_user', 'check_login', 'get_user_stats', 'add_symptom_check', 'add_symptom_checks',
+        'add_ai_consultation', 'add_history_batch', 'get_conversation_turns',
+        'get_symptom_history', 'get_consultation_history', 'add_reminder', 'get_reminders',
+        'update_reminder', 'delete_reminder', 'get_active_reminders_between', 'get_reminders_by_ids',
+        'get_reminders_changed_since', 'mark_reminders_sent', 'get_dashboard_snapshot'
+    ], metrics.DB_CALL_DURATION)
+
+# The DB layer and the model client are built on first use in each process (see lazy.py),
+# so importing the app is cheap and safe in a gunicorn --preload master
+db = PerProcess(create_database, setup=instrument_db)
+
+# History rows are queued and written in batches off the request path (HISTORY_WRITE_BEHIND=0 to disable)
+history_writer = HistoryWriter(
+    db,
+    max_batch=int(os.getenv('HISTORY_FLUSH_BATCH', '200')),
+    flush_interval=float(os.getenv('HISTORY_FLUSH_INTERVAL', '0.5')),
+    max_queue=int(os.getenv('HISTORY_QUEUE_SIZE', '10000')),
+    enabled=os.getenv('HISTORY_WRITE_BEHIND', '1') != '0'
+)
+
+# Symptom analyses keyed on normalized symptoms + prompt version.
+# Set ANALYSIS_CACHE_DB to a file path to share entries across gunicorn workers.
+analysis_cache = AnalysisCache(
+    max_entries=int(os.getenv('ANALYSIS_CACHE_SIZE', '1024')),
+    ttl=int(os.getenv('ANALYSIS_CACHE_TTL', str(24 * 3600))),
+    sqlite_path=os.getenv('ANALYSIS_CACHE_DB')
+)
+
+# Answers for /api/chat and /ask, matched by TF-IDF weighted concept overlap (see semantic_cache.py)
+answer_cache = SemanticCache(
+    threshold=float(os.getenv('ANSWER_CACHE_THRESHOLD', '0.8')),
+    max_entries=int(os.getenv('ANSWER_CACHE_SIZE', '10000'))
+)
+
+# Offline first pass for /api/symptoms/check: routine, confidently recognised symptom sets are
+# answered locally in microseconds; red flags and anything uncertain still go to Gemini.
+# TRIAGE_ENABLED=0 sends everything to the model.
+triage_engine = TriageEngine(
+    threshold=float(os.getenv('TRIAGE_MIN_CONFIDENCE', '0.75')),
+    min_margin=float(os.getenv('TRIAGE_MIN_MARGIN', '0.1')),
+    min_symptoms=int(os.getenv('TRIAGE_MIN_SYMPTOMS', '2'))
+) if os.getenv('TRIAGE_ENABLED', '1') == '1' else None
+
+# Medicine reminders fired from an index-backed time window and a heap (see reminders.py).
+# REMINDER_SCHEDULER=1 runs it in the web workers; the file lock keeps it to one worker per host.
+# Alternatively run `flask run-reminders` as its own process.
+reminder_scheduler = ReminderScheduler(
+    db,
+    create_notifier(),
+    window=int(os.getenv('REMINDER_WINDOW_SECONDS', '300')),
+    batch_size=int(os.getenv('REMINDER_BATCH_SIZE', '500')),
+    poll_interval=float(os.getenv('REMINDER_POLL_INTERVAL', '5')),
+    lock_path=os.getenv('REMINDER_LOCK_FILE') or os.path.join(tempfile.gettempdir(), 'health-advisor-reminders.lock')
+)
+REMINDER_SCHEDULER_IN_WEB = os.getenv('REMINDER_SCHEDULER', '0') == '1'
+
+# History months older than the retention window live in compressed files here (`flask archive-history`)
+history_archive = HistoryArchive(os.getenv('HISTORY_ARCHIVE_DIR', 'archive'))
+HISTORY_RETENTION_MONTHS = int(os.getenv('HISTORY_RETENTION_MONTHS', '12'))
+
+# Responsive image variants built by `flask build-images` (picture()/background_image() in templates)
+image_manifest = images.ImageManifest()
+images.init_app(app, image_manifest)
+
+# Pages that only vary by login state are rendered once per worker and served with ETags
+pages = PageCache(app, version_fn=image_manifest.generation)
+
+# gzip/brotli for text responses, including SSE and NDJSON streams (COMPRESSION_ENABLED=0 to leave it to
+# a proxy). brotli is only offered when the Brotli package is installed.
+compressor = Compressor(
+    app,
+    min_size=int(os.getenv('COMPRESSION_MIN_SIZE', '500')),
+    gzip_level=int(os.getenv('COMPRESSION_GZIP_LEVEL', '6')),
+    brotli_quality=int(os.getenv('COMPRESSION_BROTLI_QUALITY', '4')),
+    mimetypes=os.getenv('COMPRESSION_MIMETYPES', ','.join(COMPRESSIBLE_MIMETYPES)).split(','),
+    encodings=os.getenv('COMPRESSION_ENCODINGS', 'br,gzip').split(',')
+) if os.getenv('COMPRESSION_ENABLED', '1') == '1' else None
+
+_REQUEST_ID = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    # Reuse the caller's X-Request-ID (e.g. Heroku's router) so logs correlate across hops
+    request_id = request.headers.get('X-Request-ID', '')
+    g.request_id = request_id if _REQUEST_ID.fullmatch(request_id) else uuid.uuid4().hex
+    metrics.REGISTRY.start_flusher()
+    if REMINDER_SCHEDULER_IN_WEB:
+        reminder_scheduler.start()
+
+@app.after_request
+def observe_request(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        elapsed = time.perf_counter() - started
+        route = request.url_rule.rule if request.url_rule else '<unmatched>'
+        metrics.HTTP_REQUEST_DURATION.observe(
+            elapsed, route=route, method=request.method, status=response.status_code
+        )
+        access_log.info("request", extra={
+            'route': route, 'path': request.path, 'status': response.status_code,
+            'duration_ms': round(elapsed * 1000, 2)
+        })
+    if 'request_id' in g:
+        response.headers['X-Request-ID'] = g.request_id
+    return response
 
 @app.after_request
 def after_request(response):
     response.headers.add('Access-Control-Allow-Origin', 'http://127.0.0.1:5000')
     response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-    response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
+    response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,PATCH,POST,DELETE,OPTIONS')
     response.headers.add('Access-Control-Allow-Credentials', 'true')
     return response
 
 @app.route('/')
 def home():
-    return render_template("index.html")
+    return pages.render("index.html")
 
 @app.route('/login')
 def login():
-    return render_template("login.html")
+    return pages.render("login.html")
 
 @app.route('/register')
 def register():
-    return render_template("registration.html")
+    return pages.render("registration.html")
 
 @app.route('/symptoms')
 def symptoms():
-    return render_template('symptoms.html')
+    return pages.render('symptoms.html')
 
 @app.route('/dashboard')
 def dashboard():
-    print(f"\n=== DASHBOARD ACCESS ATTEMPT ===")
-    print(f"Session data: {dict(session)}")
-    print(f"User ID in session: {session.get('user_id')}")
-    
     if 'user_id' not in session:
-        print("REDIRECT: No user_id in session, redirecting to login")
+        log.debug("dashboard redirect to login, no session")
         return redirect(url_for('login'))
     
-    print(f"ACCESS GRANTED: User {session.get('user_name')} accessing dashboard")
+    log.debug("dashboard access", extra={'user_id': session.get('user_id')})
     return render_template('dashboard.html', user_name=session.get('user_name'))
 
 @app.route('/contact')
 def contact():
-    return render_template('contact.html')
-
+    return pages.render('contact.html')
 
 
 
-# Load API key from environment variables for security
-api_key = os.getenv("GOOGLE_API_KEY")
-if not api_key:
-    raise EnvironmentError("Please set the GOOGLE_API_KEY environment variable")
-
-genai.configure(api_key=api_key)
 
 # Define the system instruction for the model
 system_instruction = """You are a doctor. You must only reply to health-related questions.
@@ -85,13 +218,139 @@ If you are asked about anything else, just say 'I am a doctor, I can only answer
 
 Else if a user asks about health-related problems, you must reply in a very polite, simple, and easy-to-understand way."""
 
-# Initialize the model with system instruction
-model = genai.GenerativeModel(
-    model_name="gemini-2.5-flash",
-    system_instruction=system_instruction
+# Gemini by default; MODEL_BACKEND=fake or replay runs fully offline (see model_backends.py)
+model = PerProcess(lambda: create_model(system_instruction))
+
+# Opens when most recent Gemini calls fail or time out; calls then fail fast until a probe succeeds
+breaker = CircuitBreaker(
+    failure_threshold=float(os.getenv('LLM_BREAKER_FAILURE_RATE', '0.5')),
+    min_calls=int(os.getenv('LLM_BREAKER_MIN_CALLS', '10')),
+    window=float(os.getenv('LLM_BREAKER_WINDOW', '30')),
+    open_seconds=float(os.getenv('LLM_BREAKER_OPEN_SECONDS', '15'))
+)
+
+# Every model call goes through the gateway: bounded I/O pool, global concurrency cap, deadlines,
+# jittered retries within the deadline and (with LLM_HEDGE_AFTER) hedged requests for slow calls
+llm = LLMGateway(
+    model,
+    max_concurrency=int(os.getenv('LLM_MAX_CONCURRENCY', '32')),
+    max_pending=int(os.getenv('LLM_MAX_PENDING', '256')),
+    default_timeout=float(os.getenv('LLM_TIMEOUT', '30')),
+    breaker=breaker,
+    max_retries=int(os.getenv('LLM_MAX_RETRIES', '2')),
+    min_attempt_seconds=float(os.getenv('LLM_RETRY_MIN_SECONDS', '2')),
+    hedge_after=float(os.getenv('LLM_HEDGE_AFTER')) if os.getenv('LLM_HEDGE_AFTER') else None
+)
+# Identical in-flight prompts share one upstream call.
+# Set SINGLEFLIGHT_DIR to coalesce across gunicorn workers on the same host too.
+flights = SingleFlight(
+    lock_dir=os.getenv('SINGLEFLIGHT_DIR'),
+    wait_timeout=float(os.getenv('LLM_TIMEOUT', '30')) * 2
+)
+
+# Admission control for AI endpoints: per-user / per-IP token buckets, then a
+# concurrency limit that shrinks when Gemini slows down or fails and grows back
+# when it recovers. Logged-in users jump the wait queue; refusals are 429s.
+# Set RATE_LIMIT_DB to a file path to share the buckets across gunicorn workers.
+def make_buckets(rate_per_minute, burst):
+    path = os.getenv('RATE_LIMIT_DB')
+    if path:
+        return SQLiteTokenBuckets(path, rate_per_minute / 60, burst)
+    return TokenBuckets(rate_per_minute / 60, burst)
+
+user_buckets = make_buckets(float(os.getenv('RATE_LIMIT_USER_PER_MINUTE', '30')),
+                            float(os.getenv('RATE_LIMIT_USER_BURST', '10')))
+ip_buckets = make_buckets(float(os.getenv('RATE_LIMIT_IP_PER_MINUTE', '10')),
+                          float(os.getenv('RATE_LIMIT_IP_BURST', '5')))
+admission = AdmissionController(
+    AdaptiveLimit(
+        initial=int(os.getenv('ADMISSION_INITIAL_LIMIT', '32')),
+        min_limit=int(os.getenv('ADMISSION_MIN_LIMIT', '4')),
+        max_limit=int(os.getenv('ADMISSION_MAX_LIMIT', '128'))
+    ),
+    max_queue=int(os.getenv('ADMISSION_QUEUE_SIZE', '64')),
+    max_wait=float(os.getenv('ADMISSION_MAX_WAIT', '5'))
+)
+
+def observe_upstream(kind, seconds, outcome):
+    if outcome == 'circuit_open':
+        # Never reached Gemini, so it says nothing new about its health
+        return
+    # Stream durations depend on answer length, so only their outcome counts
+    admission.limit.observe(None if kind == 'stream' else seconds, ok=outcome == 'ok')
+
+llm.add_listener(observe_upstream)
+
+# Server-side chat memory for logged-in users, backed by ai_consultations
+conversations = ConversationStore(
+    db,
+    max_conversations=int(os.getenv('CONVERSATION_CACHE_SIZE', '2000')),
+    window_turns=int(os.getenv('CONVERSATION_WINDOW_TURNS', '6')),
+    max_history_chars=int(os.getenv('CONVERSATION_MAX_CHARS', '6000'))
 )
+SYMPTOMS_TIMEOUT = float(os.getenv('LLM_TIMEOUT_SYMPTOMS', '45'))
+CHAT_TIMEOUT = float(os.getenv('LLM_TIMEOUT_CHAT', '30'))
+
+# Component gauges for /metrics
+metrics.REGISTRY.register_stats('db_pool', "Database connection pool state", lambda: db.pool_stats())
+metrics.REGISTRY.register_stats('history_writer', "Write-behind history queue state", history_writer.stats)
+metrics.REGISTRY.register_stats('analysis_cache', "Symptom analysis cache state", analysis_cache.stats)
+metrics.REGISTRY.register_stats('answer_cache', "Semantic answer cache state", answer_cache.stats)
+metrics.REGISTRY.register_stats('llm_gateway', "LLM gateway concurrency state", llm.stats)
+metrics.REGISTRY.register_stats('llm_breaker', "Gemini circuit breaker state", breaker.stats)
+metrics.REGISTRY.register_stats('singleflight', "Request coalescing state", flights.stats)
+metrics.REGISTRY.register_stats('conversations', "Conversation memory cache state", conversations.stats)
+metrics.REGISTRY.register_stats('page_cache', "Pre-rendered page cache state", pages.stats)
+metrics.REGISTRY.register_stats('admission', "AI admission control state", admission.stats)
+if triage_engine is not None:
+    metrics.REGISTRY.register_stats('triage', "Local symptom triage decisions", triage_engine.stats)
+metrics.REGISTRY.register_stats('reminders', "Medicine reminder scheduler state", reminder_scheduler.stats)
+metrics.REGISTRY.register_stats('history_archive', "Archived history files and reads", history_archive.stats)
+if compressor is not None:
+    metrics.REGISTRY.register_stats('compression', "Response compression counters", compressor.stats)
+metrics.REGISTRY.register_stats('logging', "Background log queue state",
+                                lambda: {**log_handler.stats(), 'sampled_out': log_handler.sampling.dropped})
 
 
+# Bump SYMPTOM_PROMPT_VERSION whenever SYMPTOM_PROMPT changes so cached analyses are not reused
+SYMPTOM_PROMPT_VERSION = 1
+SYMPTOM_PROMPT = """Analyze these symptoms: {symptoms}
+        
+        Provide the following information in JSON format:
+        1. Possible conditions with probability
+        2. Severity level (Low/Medium/High)
+        3. Recommendations
+        4. When to see a doctor
+        5. Home remedies
+        
+        Format: {{"conditions": [], "severity": "", "recommendations": "", "see_doctor": "", "home_remedies": ""}}
+        
+        IMPORTANT: Do not include any markdown formatting, code blocks, or backticks in your response.
+        Only return valid JSON format."""
+
+# Several short symptom descriptions packed into one model call by /api/symptoms/batch
+BATCH_SYMPTOM_PROMPT = """Analyze each of the following {count} numbered symptom descriptions independently:
+
+        {items}
+        
+        For each description provide the same information as a single-patient analysis:
+        possible conditions with probability, severity level (Low/Medium/High), recommendations,
+        when to see a doctor, and home remedies.
+        
+        Return a JSON array with exactly {count} objects, in the same order as the descriptions, each in the format:
+        {{"conditions": [], "severity": "", "recommendations": "", "see_doctor": "", "home_remedies": ""}}
+        
+        IMPORTANT: Do not include any markdown formatting, code blocks, or backticks in your response.
+        Only return valid JSON format."""
+
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '50'))
+BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', '8'))
+BATCH_PACK_SIZE = int(os.getenv('BATCH_PACK_SIZE', '5'))
+BATCH_PACK_MAX_CHARS = int(os.getenv('BATCH_PACK_MAX_CHARS', '200'))
+# How long a batch may wait for the caller's rate-limit tokens to refill; the default fits
+# BATCH_MAX_ITEMS uncached items into the default user bucket (burst 10, 30 per minute)
+BATCH_RATE_WAIT = float(os.getenv('BATCH_RATE_WAIT_SECONDS', '90'))
+
 
 @app.route('/ai')
 def ai():
@@ -102,7 +361,7 @@ def ai():
 @app.route('/logout')
 def logout():
     session.clear()
-    return render_template("index.html")
+    return pages.render("index.html")
 
 
 # API Routes for registration and login
@@ -110,19 +369,14 @@ def logout():
 def api_register():
     """API endpoint for user registration"""
     try:
-        # Log the incoming request
-        print(f"Incoming registration request headers: {request.headers}")
-        print(f"Incoming registration request data: {request.data}")
-        
         if not request.is_json:
-            print("Request is not JSON")
+            log.info("registration rejected, request is not JSON")
             return jsonify({"success": False, "message": "Request must be JSON"}), 400
             
         data = request.get_json()
-        print(f"Parsed JSON data: {data}")
         
         if not data:
-            print("No data in request")
+            log.info("registration rejected, no data")
             return jsonify({"success": False, "message": "No data provided"}), 400
             
         user_name = data.get('user_name', '').strip()
@@ -131,7 +385,7 @@ def api_register():
         password = data.get('password', '').strip()
         confirm_password = data.get('confirm_password', '').strip()
         
-        print(f"Extracted values - Name: {user_name}, Email: {email}, Contact: {contact_number}")
+        log.debug("registration request", extra={'email': email})
         
         # Validation
         validation_errors = []
@@ -162,7 +416,8 @@ def api_register():
         
         # Register user
         result = db.register_user(user_name, contact_number, email, password)
-        print(f"Database registration result: {result}")
+        log.info("registration", extra={'email': email, 'success': result['success'],
+                                        'user_id': result.get('user_id')})
         
         if result['success']:
             return jsonify(result), 201
@@ -170,43 +425,36 @@ def api_register():
             return jsonify(result), 400
             
     except Exception as e:
-        print(f"Registration error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        log.exception("registration failed")
         return jsonify({"success": False, "message": f"Registration failed: {str(e)}"}), 500
     
 @app.route('/api/login', methods=['POST'])
 def api_login():
     """API endpoint for user login"""
-    print("\n=== LOGIN ATTEMPT ===")
     try:
         if not request.is_json:
-            print("ERROR: Request is not JSON")
+            log.info("login rejected, request is not JSON")
             return jsonify({"success": False, "message": "Request must be JSON"}), 400
             
         data = request.get_json()
         email = data.get('email', '').strip().lower()
         password = data.get('password', '').strip()
         
-        print(f"Login attempt for email: {email}")
-        
         if not email or not password:
-            print("ERROR: Email or password missing")
+            log.info("login rejected, email or password missing")
             return jsonify({"success": False, "message": "Email and password are required"}), 400
         
         # Check credentials
         user = db.check_login(email, password)
         
         if user:
-            print(f"SUCCESS: User found - ID: {user['id']}, Name: {user['user_name']}")
+            log.info("login succeeded", extra={'user_id': user['id']})
             
             # Set session
             session['user_id'] = user['id']
             session['user_name'] = user['user_name']
             session['email'] = user['email']
             
-            print(f"Session set - User ID in session: {session.get('user_id')}")
-            
             return jsonify({
                 "success": True,
                 "message": "Login successful",
@@ -217,13 +465,11 @@ def api_login():
                 }
             }), 200
         else:
-            print(f"FAILED: Invalid credentials for email: {email}")
+            log.warning("login failed, invalid credentials", extra={'email': email})
             return jsonify({"success": False, "message": "Invalid email or password"}), 401
             
     except Exception as e:
-        print(f"Login error: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("login error")
         return jsonify({"success": False, "message": "Login failed"}), 500
     
 @app.route('/api/logout', methods=['POST'])
@@ -246,12 +492,7 @@ def debug_session():
 def debug_database():
     """Debug database users"""
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM users")
-        users = cursor.fetchall()
-        cursor.close()
-        conn.close()
+        users = db.get_users()
         return jsonify({
             'user_count': len(users),
             'users': users
@@ -259,6 +500,46 @@ def debug_database():
     except Exception as e:
         return jsonify({'error': str(e)})
 
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus scrape endpoint (aggregated across workers when METRICS_DIR is set)"""
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/debug/pool')
+def debug_pool():
+    """Debug database connection pool and history write queue counters for this worker"""
+    return jsonify({'pid': os.getpid(), 'pool': db.pool_stats(), 'history_writer': history_writer.stats()})
+
+@app.route('/debug/reminders')
+def debug_reminders():
+    """Debug reminder scheduler counters for this worker"""
+    return jsonify({'pid': os.getpid(), 'scheduler': reminder_scheduler.stats()})
+
+@app.route('/debug/cache')
+def debug_cache():
+    """Debug AI cache hit/miss counters for this worker"""
+    return jsonify({
+        'pid': os.getpid(),
+        'analysis_cache': analysis_cache.stats(),
+        'answer_cache': answer_cache.stats(),
+        'page_cache': pages.stats(),
+        'dashboard_cache': dashboard_cache.stats(),
+        'compression': compressor.stats() if compressor is not None else None
+    })
+
+@app.route('/debug/llm')
+def debug_llm():
+    """Debug LLM gateway concurrency, deadline and circuit breaker counters for this worker"""
+    return jsonify({
+        'pid': os.getpid(),
+        'llm': llm.stats(),
+        'breaker': breaker.stats(),
+        'singleflight': flights.stats(),
+        'conversations': conversations.stats(),
+        'admission': admission.stats(),
+        'rate_limits': {'user': user_buckets.stats(), 'ip': ip_buckets.stats()}
+    })
+
 @app.route('/api/check_session', methods=['GET'])
 def check_session():
     """Check if user is logged in"""
@@ -289,6 +570,372 @@ def get_user_stats():
         "stats": stats
     }), 200
 
+HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', '20'))
+HISTORY_MAX_PAGE_SIZE = 100
+
+def encode_cursor(row):
+    """Opaque pagination cursor for the (created_at, id) of a page's last row"""
+    return base64.urlsafe_b64encode(f"{row['created_at'].isoformat()}|{row['id']}".encode()).decode()
+
+def decode_cursor(cursor):
+    created_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.fromisoformat(created_at), int(row_id)
+
+def parse_datetime(value):
+    """ISO date or datetime query parameter as a naive local datetime (None if absent)"""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+def history_page(fetch_page, serialize, table):
+    """Shared handler of the keyset-paginated history endpoints.
+
+    Query parameters: limit (1-100), cursor (next_cursor of the previous
+    page), since (inclusive) and until (exclusive) as ISO dates or datetimes.
+    With include_archived=1, pages continue into the history archive once
+    the rows still in MySQL run out (archived months are always older).
+    """
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "Please login first"}), 401
+
+    try:
+        limit = min(max(int(request.args.get('limit', HISTORY_PAGE_SIZE)), 1), HISTORY_MAX_PAGE_SIZE)
+        cursor = request.args.get('cursor')
+        before = decode_cursor(cursor) if cursor else None
+        since = parse_datetime(request.args.get('since'))
+        until = parse_datetime(request.args.get('until'))
+    except ValueError:
+        return jsonify({"success": False, "message": "Invalid limit, cursor or date range"}), 400
+
+    try:
+        rows, has_more = fetch_page(session['user_id'], limit=limit, before=before, since=since, until=until)
+        if not has_more and request.args.get('include_archived') == '1':
+            archived, has_more = history_archive.user_page(
+                table, session['user_id'], limit - len(rows),
+                before=(rows[-1]['created_at'], rows[-1]['id']) if rows else before, since=since, until=until
+            )
+            rows = rows + archived
+    except Exception as e:
+        log.exception("history page failed")
+        return jsonify({"success": False, "message": "Could not load history"}), 500
+
+    return jsonify({
+        "success": True,
+        "items": [serialize(row) for row in rows],
+        "next_cursor": encode_cursor(rows[-1]) if has_more else None
+    }), 200
+
+def serialize_symptom_check(row):
+    try:
+        analysis = json.loads(row['analysis_result']) if row['analysis_result'] else None
+    except ValueError:
+        analysis = row['analysis_result']
+    return {
+        "id": row['id'],
+        "symptoms": row['symptoms'],
+        "analysis": analysis,
+        "created_at": row['created_at'].isoformat()
+    }
+
+def serialize_consultation(row):
+    return {
+        "id": row['id'],
+        "conversation_id": row['conversation_id'],
+        "question": row['question'],
+        "response": row['response'],
+        "created_at": row['created_at'].isoformat()
+    }
+
+@app.route('/api/history/symptoms', methods=['GET'])
+def symptom_history():
+    """The user's symptom checks, newest first, one page at a time"""
+    return history_page(db.get_symptom_history, serialize_symptom_check, 'symptoms_history')
+
+@app.route('/api/history/consultations', methods=['GET'])
+def consultation_history():
+    """The user's AI consultations, newest first, one page at a time"""
+    return history_page(db.get_consultation_history, serialize_consultation, 'ai_consultations')
+
+def serialize_reminder(row):
+    return {
+        "id": row['id'],
+        "medicine_name": row['medicine_name'],
+        "dosage": row['dosage'],
+        "schedule": row['schedule'],
+        "reminder_time": row['reminder_time'].strftime('%H:%M') if row['reminder_time'] else None,
+        "is_active": bool(row['is_active']),
+        "last_notified_at": row['last_notified_at'].isoformat() if row.get('last_notified_at') else None
+    }
+
+def reminder_fields(data, partial=False):
+    """Validated reminder columns from a request body; raises ValueError"""
+    fields = {}
+    if 'medicine_name' in data or not partial:
+        name = str(data.get('medicine_name') or '').strip()
+        if not name or len(name) > 255:
+            raise ValueError("Medicine name is required")
+        fields['medicine_name'] = name
+    if 'dosage' in data:
+        fields['dosage'] = str(data['dosage'] or '').strip()[:100] or None
+    if 'schedule' in data or not partial:
+        schedule = str(data.get('schedule') or 'daily').strip().lower()
+        parse_schedule(schedule)
+        fields['schedule'] = schedule
+    if 'reminder_time' in data or not partial:
+        fields['reminder_time'] = parse_reminder_time(data.get('reminder_time'))
+    if 'is_active' in data:
+        fields['is_active'] = bool(data['is_active'])
+    return fields
+
+@app.route('/api/reminders', methods=['GET'])
+def list_reminders():
+    """The user's medicine reminders"""
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "Please login first"}), 401
+    try:
+        rows = db.get_reminders(session['user_id'])
+    except Exception:
+        log.exception("listing reminders failed")
+        return jsonify({"success": False, "message": "Could not load reminders"}), 500
+    return jsonify({"success": True, "reminders": [serialize_reminder(row) for row in rows]}), 200
+
+@app.route('/api/reminders', methods=['POST'])
+def create_reminder():
+    """Add a reminder: medicine_name, dosage, schedule ('daily', 'weekdays', 'mon,wed'), reminder_time ('08:00')"""
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "Please login first"}), 401
+    try:
+        fields = reminder_fields(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    try:
+        row = db.add_reminder(session['user_id'], **fields)
+    except Exception:
+        log.exception("adding reminder failed")
+        return jsonify({"success": False, "message": "Could not save reminder"}), 500
+    dashboard_cache.invalidate([session['user_id']])
+    return jsonify({"success": True, "reminder": serialize_reminder(row)}), 201
+
+@app.route('/api/reminders/<int:reminder_id>', methods=['PATCH'])
+def edit_reminder(reminder_id):
+    """Change any of a reminder's fields, or pause it with is_active=false"""
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "Please login first"}), 401
+    try:
+        fields = reminder_fields(request.get_json(silent=True) or {}, partial=True)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    try:
+        row = db.update_reminder(session['user_id'], reminder_id, **fields)
+    except Exception:
+        log.exception("updating reminder failed")
+        return jsonify({"success": False, "message": "Could not save reminder"}), 500
+    if row is None:
+        return jsonify({"success": False, "message": "Reminder not found"}), 404
+    dashboard_cache.invalidate([session['user_id']])
+    return jsonify({"success": True, "reminder": serialize_reminder(row)}), 200
+
+@app.route('/api/reminders/<int:reminder_id>', methods=['DELETE'])
+def remove_reminder(reminder_id):
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "Please login first"}), 401
+    try:
+        deleted = db.delete_reminder(session['user_id'], reminder_id)
+    except Exception:
+        log.exception("deleting reminder failed")
+        return jsonify({"success": False, "message": "Could not delete reminder"}), 500
+    if not deleted:
+        return jsonify({"success": False, "message": "Reminder not found"}), 404
+    dashboard_cache.invalidate([session['user_id']])
+    return jsonify({"success": True}), 200
+
+DASHBOARD_RECENT_ITEMS = int(os.getenv('DASHBOARD_RECENT_ITEMS', '5'))
+
+def build_dashboard(user_id):
+    snapshot = db.get_dashboard_snapshot(user_id, recent=DASHBOARD_RECENT_ITEMS)
+    return {
+        "success": True,
+        "stats": snapshot['stats'],
+        "recent_symptom_checks": [serialize_symptom_check(row) for row in snapshot['symptom_checks']],
+        "recent_consultations": [serialize_consultation(row) for row in snapshot['consultations']],
+        "reminders": [serialize_reminder(row) for row in snapshot['reminders']]
+    }
+
+def make_user_versions():
+    path = os.getenv('DASHBOARD_VERSION_DB', os.path.join(tempfile.gettempdir(), 'health-advisor-dashboard.db'))
+    if path == 'memory':
+        return UserVersions()
+    return SQLiteUserVersions(path)
+
+# Per-user dashboard snapshots, rebuilt only after that user's history or reminders change.
+# The change counters live in a SQLite file by default so every worker on the host sees an
+# invalidation; DASHBOARD_VERSION_DB=memory keeps them per worker (then only the TTL bounds
+# staleness across workers).
+dashboard_cache = DashboardCache(
+    build_dashboard,
+    make_user_versions(),
+    max_entries=int(os.getenv('DASHBOARD_CACHE_SIZE', '10000')),
+    ttl=int(os.getenv('DASHBOARD_CACHE_TTL', '300'))
+)
+history_writer.on_flush = dashboard_cache.invalidate
+reminder_scheduler.on_sent = dashboard_cache.invalidate
+metrics.REGISTRY.register_stats('dashboard_cache', "Dashboard snapshot cache state", dashboard_cache.stats)
+
+@app.route('/api/dashboard/snapshot', methods=['GET'])
+def dashboard_snapshot():
+    """Stats, recent history and active reminders in one response; revalidate with If-None-Match"""
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "Please login first"}), 401
+    try:
+        body, etag = dashboard_cache.get(session['user_id'])
+    except Exception:
+        log.exception("dashboard snapshot failed")
+        return jsonify({"success": False, "message": "Could not load dashboard"}), 500
+
+    response = Response(body, mimetype='application/json')
+    if etag:
+        response.set_etag(etag)
+    # Per-user data: browsers may keep it but must revalidate, shared caches must not store it
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Cookie')
+    return response.make_conditional(request)
+
+# Downloads hold a DB connection per keyset chunk, so only a few may run at once per worker
+EXPORT_MAX_CONCURRENT = int(os.getenv('EXPORT_MAX_CONCURRENT', '2'))
+EXPORT_GZIP_LEVEL = int(os.getenv('EXPORT_GZIP_LEVEL', '6'))
+export_slots = threading.BoundedSemaphore(EXPORT_MAX_CONCURRENT)
+EXPORT_KINDS = {
+    'symptoms': ('symptoms_history', 'symptom_check', serialize_symptom_check),
+    'consultations': ('ai_consultations', 'consultation', serialize_consultation)
+}
+
+def export_records(user_id, kinds, since, until, fmt):
+    """The user's history records, archived months first, each kind oldest first"""
+    for kind in kinds:
+        table, record_type, serialize = EXPORT_KINDS[kind]
+        for rows in (history_archive.iter_user_rows(table, user_id, since, until),
+                     db.iter_user_history(table, user_id, since, until)):
+            for row in rows:
+                metrics.EXPORT_ROWS.inc(format=fmt)
+                yield {"type": record_type, **serialize(row)}
+
+def tracked_export(chunks, fmt, user_id):
+    try:
+        yield from chunks
+    except GeneratorExit:
+        metrics.EXPORTS.inc(format=fmt, outcome='aborted')
+        raise
+    except Exception:
+        # Headers are long gone; the client sees a truncated file
+        log.exception("export failed", extra={'user_id': user_id})
+        metrics.EXPORTS.inc(format=fmt, outcome='failed')
+        raise
+    metrics.EXPORTS.inc(format=fmt, outcome='completed')
+
+@app.route('/api/export', methods=['GET'])
+def export_history():
+    """Download the user's whole history, streamed in constant memory.
+
+    Query parameters: format (ndjson or csv), type (all, symptoms or
+    consultations), gzip=1 for a compressed file, since/until as for history.
+    """
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "Please login first"}), 401
+
+    fmt = request.args.get('format', 'ndjson')
+    kind = request.args.get('type', 'all')
+    try:
+        since = parse_datetime(request.args.get('since'))
+        until = parse_datetime(request.args.get('until'))
+    except ValueError:
+        return jsonify({"success": False, "message": "Invalid date range"}), 400
+    if fmt not in EXPORT_FORMATS or (kind != 'all' and kind not in EXPORT_KINDS):
+        return jsonify({"success": False, "message": "format must be ndjson or csv, "
+                                                    "type all, symptoms or consultations"}), 400
+
+    if not export_slots.acquire(blocking=False):
+        return throttled_response(Throttled("Too many exports in progress, please retry shortly", 10), 'export')
+    try:
+        user_id = session['user_id']
+        kinds = list(EXPORT_KINDS) if kind == 'all' else [kind]
+        chunks, mimetype, extension = export_stream(export_records(user_id, kinds, since, until, fmt), fmt,
+                                                    compress=request.args.get('gzip') == '1',
+                                                    level=EXPORT_GZIP_LEVEL)
+        response = Response(tracked_export(chunks, fmt, user_id), mimetype=mimetype)
+    except BaseException:
+        export_slots.release()
+        raise
+    response.call_on_close(export_slots.release)
+    filename = f"health-history-{kind}-{datetime.now():%Y%m%d}.{extension}"
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Cache-Control'] = 'no-store'
+    # Ask nginx-style proxies not to buffer the whole download
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def throttled_response(error, reason):
+    metrics.ADMISSION_REJECTIONS.inc(reason=reason)
+    response = jsonify({"success": False, "message": str(error), "retry_after": error.retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+def unavailable_response(error, key='error', **fields):
+    """503 for a call refused by the open circuit breaker, with a Retry-After hint"""
+    retry_after = max(1, int(error.retry_after + 0.999))
+    response = jsonify({**fields, key: str(error), "retry_after": retry_after})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+def degraded_answer(question):
+    """Cached answer for question while the breaker is open, or None.
+
+    Uses the normal cache threshold: a looser match can hand back the
+    answer about another drug or body part, so a miss is a 503 instead.
+    """
+    answer, _ = answer_cache.get(question)
+    return answer
+
+def caller_buckets():
+    """(token buckets, bucket key) that rate-limit the current caller"""
+    user_id = session.get('user_id')
+    if user_id:
+        return user_buckets, f"user:{user_id}"
+    return ip_buckets, f"ip:{request.remote_addr}"
+
+def acquire_ai_slot(tokens=1):
+    """Charge tokens to the caller's rate limit and take an admission slot for model calls.
+
+    Returns the function that frees the slot; raises Throttled. Cache hits
+    and local triage answers cost nothing, so only call this once a request
+    is known to need the model.
+    """
+    buckets, key = caller_buckets()
+    wait = buckets.take(key, tokens)
+    if wait:
+        raise Throttled("Too many AI requests, please slow down", wait, reason='rate_limit')
+    admission.acquire(priority=0 if 'user_id' in session else 1)
+    return admission.release
+
+@contextmanager
+def ai_slot(tokens=1):
+    release = acquire_ai_slot(tokens)
+    try:
+        yield
+    finally:
+        release()
+
+def with_ai_slot(fn):
+    """fn run inside ai_slot(), for single-flight leaders: followers only wait, so they cost nothing"""
+    def run():
+        with ai_slot():
+            return fn()
+    return run
+
 @app.route('/api/symptoms/check', methods=['POST'])
 def check_symptoms_api():
     """Check symptoms and save to history"""
@@ -304,66 +951,315 @@ def check_symptoms_api():
         
         user_id = session['user_id']
         
-        # Use Gemini AI to analyze symptoms
-        prompt = f"""Analyze these symptoms: {symptoms}
-        
-        Provide the following information in JSON format:
-        1. Possible conditions with probability
-        2. Severity level (Low/Medium/High)
-        3. Recommendations
-        4. When to see a doctor
-        5. Home remedies
-        
-        Format: {{"conditions": [], "severity": "", "recommendations": "", "see_doctor": "", "home_remedies": ""}}
-        
-        IMPORTANT: Do not include any markdown formatting, code blocks, or backticks in your response.
-        Only return valid JSON format."""
-        
-        # Call Gemini AI
-        response = model.generate_content(prompt)
-        analysis_result = response.text
-        
-        # Clean the response
-        clean_result = analysis_result.strip()
-        
-        # Remove any markdown code blocks
-        if clean_result.startswith('```'):
-            clean_result = clean_result.split('\n', 1)[1]  # Remove first line
-        if clean_result.endswith('```'):
-            clean_result = clean_result.rsplit('\n', 1)[0]  # Remove last line
-        
-        # Clean JSON string before parsing
-        clean_result = clean_result.replace('\\n', ' ')  # Replace escaped newlines
-        clean_result = ' '.join(clean_result.split())  # Remove extra whitespace
-        
-        # Try to parse as JSON
-        try:
-            result_data = json.loads(clean_result)
-        except json.JSONDecodeError as e:
-            print(f"JSON parsing error: {e}")
-            print(f"Raw response: {analysis_result}")
-            print(f"Cleaned response: {clean_result}")
-            # Fallback: Clean text without JSON structure
-            result_data = {
-                "analysis": analysis_result.replace('\n', '<br>').replace('\\n', '<br>'),
-                "severity": "Unknown",
-                "conditions": []
-            }
+        key = cache_key(normalize_symptoms(symptoms), SYMPTOM_PROMPT_VERSION)
+        result_data = analysis_cache.get(key)
+        cached = result_data is not None
+
+        triaged = False
+        if not cached:
+            result_data = local_triage(symptoms)
+            triaged = result_data is not None
+        if result_data is None:
+            result_data, _ = flights.do('symptoms:' + key, with_ai_slot(lambda: analyze_symptoms(symptoms, key)))
         
         # Save cleaned result to database
-        db.add_symptom_check(user_id, symptoms, json.dumps(result_data))
+        history_writer.add_symptom_check(user_id, symptoms, json.dumps(result_data))
         
         return jsonify({
             "success": True,
             "symptoms": symptoms,
-            "analysis": result_data
+            "analysis": result_data,
+            "cached": cached,
+            "triaged": triaged
         }), 200
         
+    except Throttled as e:
+        return throttled_response(e, e.reason)
+    except GatewayUnavailable as e:
+        return unavailable_response(e, key='message', success=False)
+    except GatewayBusy as e:
+        return jsonify({"success": False, "message": str(e)}), 503
+    except (GatewayTimeout, TimeoutError) as e:
+        return jsonify({"success": False, "message": str(e)}), 504
     except Exception as e:
-        print(f"Symptoms check error: {str(e)}")
-        traceback.print_exc()
+        log.exception("symptoms check failed")
         return jsonify({"success": False, "message": f"Error analyzing symptoms: {str(e)}"}), 500
 
+def local_triage(symptoms):
+    """The local triage engine's analysis when it is confident, else None (ask the model)"""
+    if triage_engine is None:
+        return None
+    analysis, confidence, reason = triage_engine.triage(symptoms)
+    if analysis is None:
+        log.debug("triage escalated", extra={'reason': reason, 'confidence': round(confidence, 3)})
+    return analysis
+
+def analyze_symptoms(symptoms, key):
+    """Ask the model for a symptom analysis and cache it under key"""
+    # Use Gemini AI to analyze symptoms
+    prompt = SYMPTOM_PROMPT.format(symptoms=symptoms)
+
+    # Call Gemini AI
+    result_data = parse_analysis(llm.generate(prompt, timeout=SYMPTOMS_TIMEOUT))
+
+    # Only cache well-formed analyses; fallbacks should be retried next time
+    if "analysis" not in result_data:
+        analysis_cache.set(key, result_data)
+    return result_data
+
+def parse_analysis(analysis_result):
+    """Turn the model's symptom analysis text into a dict, with a plain-text fallback"""
+    # Clean the response
+    clean_result = analysis_result.strip()
+    
+    # Remove any markdown code blocks
+    if clean_result.startswith('```'):
+        clean_result = clean_result.split('\n', 1)[1]  # Remove first line
+    if clean_result.endswith('```'):
+        clean_result = clean_result.rsplit('\n', 1)[0]  # Remove last line
+    
+    # Clean JSON string before parsing
+    clean_result = clean_result.replace('\\n', ' ')  # Replace escaped newlines
+    clean_result = ' '.join(clean_result.split())  # Remove extra whitespace
+    
+    # Try to parse as JSON
+    try:
+        return json.loads(clean_result)
+    except json.JSONDecodeError as e:
+        log.warning("symptom analysis is not valid JSON", extra={'error': str(e), 'raw': analysis_result[:500]})
+        # Fallback: Clean text without JSON structure
+        return {
+            "analysis": analysis_result.replace('\n', '<br>').replace('\\n', '<br>'),
+            "severity": "Unknown",
+            "conditions": []
+        }
+
+def analyze_symptom_group(group):
+    """Analyze a group of (symptoms, key) items, in one packed model call when possible.
+
+    Returns one analysis per item, in order. If the packed answer does not
+    line up with the inputs, every item is retried with its own call.
+    """
+    if len(group) == 1:
+        symptoms, key = group[0]
+        return [analyze_symptoms(symptoms, key)]
+
+    items = '\n        '.join(f"{n}. {symptoms}" for n, (symptoms, _) in enumerate(group, 1))
+    prompt = BATCH_SYMPTOM_PROMPT.format(count=len(group), items=items)
+    results = parse_analysis(llm.generate(prompt, timeout=SYMPTOMS_TIMEOUT))
+
+    if isinstance(results, list) and len(results) == len(group) and all(isinstance(r, dict) for r in results):
+        for (_, key), result_data in zip(group, results):
+            analysis_cache.set(key, result_data)
+        return results
+
+    log.warning("packed analysis did not match inputs, falling back to single calls", extra={'items': len(group)})
+    return [analyze_symptoms(symptoms, key) for symptoms, key in group]
+
+def plan_batch(symptoms_list):
+    """Split a batch into answers available now and descriptions that need the model.
+
+    Returns (ready, pending): ready lists (index, analysis, cached) for cache
+    hits and confident local triage answers, and pending maps each distinct
+    missing cache key to (symptoms, [indices]).
+    """
+    ready, pending = [], {}
+    for index, symptoms in enumerate(symptoms_list):
+        key = cache_key(normalize_symptoms(symptoms), SYMPTOM_PROMPT_VERSION)
+        result_data = analysis_cache.get(key)
+        if result_data is not None:
+            ready.append((index, result_data, True))
+            continue
+        if key in pending:
+            pending[key][1].append(index)
+            continue
+        result_data = local_triage(symptoms)
+        if result_data is not None:
+            ready.append((index, result_data, False))
+        else:
+            pending[key] = (symptoms, [index])
+    return ready, pending
+
+def batch_charger(buckets, key, deadline):
+    """charge(cost) for a batch: spends cost tokens one at a time, sleeping for refills until deadline.
+
+    Raises Throttled once a token would only arrive after the deadline.
+    """
+    lock = threading.Lock()
+
+    def charge(cost):
+        # One group at a time, so the batch's own workers don't race each other for each refill
+        with lock:
+            _charge(cost)
+
+    def _charge(cost):
+        for _ in range(cost):
+            while True:
+                wait = buckets.take(key)
+                if not wait:
+                    break
+                if time.monotonic() + wait > deadline:
+                    raise Throttled("Rate limit reached before this item was analysed", wait, reason='rate_limit')
+                time.sleep(wait)
+    return charge
+
+def iter_batch_analyses(ready, pending, charge=None):
+    """Yield (index, analysis, cached) for each description as soon as it is ready.
+
+    The ready answers from plan_batch() come first. The pending misses have
+    short ones packed BATCH_PACK_SIZE to a prompt, and the groups are fanned
+    out over at most BATCH_MAX_WORKERS threads. Each group calls
+    charge(len(group)) when it starts, so rate-limit tokens are spent as
+    items are dispatched. A failed group yields error analyses for its items
+    instead of failing the whole batch.
+    """
+    yield from ready
+
+    packable, groups = [], []
+    for key, (symptoms, _) in pending.items():
+        if len(symptoms) <= BATCH_PACK_MAX_CHARS:
+            packable.append((symptoms, key))
+        else:
+            groups.append([(symptoms, key)])
+    groups.extend(packable[i:i + BATCH_PACK_SIZE] for i in range(0, len(packable), BATCH_PACK_SIZE))
+
+    if not groups:
+        return
+
+    def run(group):
+        if charge is not None:
+            charge(len(group))
+        return analyze_symptom_group(group)
+
+    with ThreadPoolExecutor(max_workers=min(BATCH_MAX_WORKERS, len(groups))) as executor:
+        futures = {executor.submit(run, group): group for group in groups}
+        for future in as_completed(futures):
+            group = futures[future]
+            try:
+                results = future.result()
+            except Exception as e:
+                log.warning("batch symptoms group failed", extra={'error': f"{type(e).__name__}: {e}"})
+                results = [{"error": str(e), "severity": "Unknown", "conditions": []}] * len(group)
+            for (_, key), result_data in zip(group, results):
+                for index in pending[key][1]:
+                    yield index, result_data, False
+
+@app.route('/api/symptoms/batch', methods=['POST'])
+def check_symptoms_batch_api():
+    """Analyze a list of symptom descriptions concurrently and save them all to history.
+
+    Returns {"results": [...]} in input order, or with ?stream=1 (or an
+    Accept: application/x-ndjson header) one NDJSON line per item as it completes.
+    Each distinct description that needs the model costs one rate-limit token,
+    spent when it is dispatched. When the bucket runs dry the batch waits for
+    refills, up to BATCH_RATE_WAIT seconds; a batch that could not get its
+    tokens within that is refused up front with 429 and Retry-After.
+    """
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "Please login first"}), 401
+
+    data = request.get_json(silent=True) or {}
+    symptoms_list = data.get('symptoms')
+    if not isinstance(symptoms_list, list) or not symptoms_list:
+        return jsonify({"success": False, "message": "symptoms must be a non-empty list"}), 400
+    if len(symptoms_list) > BATCH_MAX_ITEMS:
+        return jsonify({"success": False, "message": f"At most {BATCH_MAX_ITEMS} items per batch"}), 400
+
+    symptoms_list = [str(s).strip() for s in symptoms_list]
+    if not all(symptoms_list):
+        return jsonify({"success": False, "message": "Every item must contain symptoms"}), 400
+
+    user_id = session['user_id']
+
+    ready, pending = plan_batch(symptoms_list)
+    release = charge = None
+    if pending:
+        buckets, bucket_key = caller_buckets()
+        wait = (len(pending) - buckets.available(bucket_key)) / buckets.rate
+        if wait > BATCH_RATE_WAIT:
+            return throttled_response(Throttled(
+                f"Too many AI requests: {len(pending)} descriptions need the model, retry later or send fewer",
+                wait - BATCH_RATE_WAIT, reason='rate_limit'), 'rate_limit')
+        try:
+            admission.acquire(priority=0)
+        except Throttled as e:
+            return throttled_response(e, e.reason)
+        release = admission.release
+        charge = batch_charger(buckets, bucket_key, time.monotonic() + BATCH_RATE_WAIT)
+
+    def save(results):
+        checks = [(symptoms_list[i], result_data) for i, result_data in sorted(results.items())
+                  if "error" not in result_data]
+        history_writer.add_symptom_checks(user_id, checks)
+
+    stream = request.args.get('stream') == '1' or 'application/x-ndjson' in request.headers.get('Accept', '')
+    if stream:
+        def generate():
+            results = {}
+            try:
+                for index, result_data, cached in iter_batch_analyses(ready, pending, charge):
+                    results[index] = result_data
+                    yield json.dumps({
+                        "index": index,
+                        "symptoms": symptoms_list[index],
+                        "analysis": result_data,
+                        "cached": cached
+                    }) + "\n"
+            finally:
+                # Also on a client disconnect: what was already analysed (and billed) is kept
+                save(results)
+
+        response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        if release is not None:
+            # The slot is held until the last line is sent
+            response.call_on_close(release)
+        return response
+
+    try:
+        results, cached_flags = {}, {}
+        for index, result_data, cached in iter_batch_analyses(ready, pending, charge):
+            results[index] = result_data
+            cached_flags[index] = cached
+        save(results)
+
+        return jsonify({
+            "success": True,
+            "count": len(symptoms_list),
+            "results": [{
+                "symptoms": symptoms_list[i],
+                "analysis": results[i],
+                "cached": cached_flags[i]
+            } for i in range(len(symptoms_list))]
+        }), 200
+
+    except Exception as e:
+        log.exception("batch symptoms check failed")
+        return jsonify({"success": False, "message": f"Error analyzing symptoms: {str(e)}"}), 500
+    finally:
+        if release is not None:
+            release()
+
+def current_conversation(data):
+    """The logged-in user's conversation (from the request or session), or None for anonymous chats.
+
+    Pass "new_conversation": true to start over.
+    """
+    if 'user_id' not in session:
+        return None
+    conversation_id = data.get('conversation_id') or session.get('conversation_id')
+    is_new = data.get('new_conversation') or not ConversationStore.valid_id(conversation_id)
+    if is_new:
+        conversation_id = ConversationStore.new_id()
+    session['conversation_id'] = conversation_id
+    return conversations.get(session['user_id'], conversation_id, load=not is_new)
+
+def remember_turn(conversation, question, answer):
+    """Keep the turn in the conversation window and queue it for ai_consultations"""
+    if conversation is None:
+        return
+    conversations.record(conversation, question, answer)
+    history_writer.add_ai_consultation(conversation.user_id, question, answer, conversation.id)
+
 @app.route('/api/chat', methods=['POST'])
 def ai_chat():  # Changed function name
     try:
@@ -372,21 +1268,107 @@ def ai_chat():  # Changed function name
         if not question:
             return jsonify({"error": "No question provided"}), 400
 
-        chat = model.start_chat(history=[])
-        response = chat.send_message(question)
+        conversation = current_conversation(data)
+        history = conversations.history(conversation) if conversation else []
+        cached = False
 
-        return jsonify({"response": response.text})
+        if history:
+            # Follow-ups depend on earlier turns, so shared caches do not apply
+            with ai_slot():
+                answer = llm.chat(question, history=history, timeout=CHAT_TIMEOUT)
+        else:
+            answer, _ = answer_cache.get(question)
+            cached = answer is not None
+            if not cached:
+                flight_key = 'chat:' + ' '.join(question.lower().split())
+                answer, _ = flights.do(flight_key, with_ai_slot(lambda: llm.chat(question, timeout=CHAT_TIMEOUT)))
+                answer_cache.set(question, answer)
+
+        remember_turn(conversation, question, answer)
+
+        result = {"response": answer}
+        if cached:
+            result["cached"] = True
+        if conversation:
+            result["conversation_id"] = conversation.id
+        return jsonify(result)
+    except Throttled as e:
+        return throttled_response(e, e.reason)
+    except GatewayUnavailable as e:
+        answer = None if history else degraded_answer(question)
+        if answer is not None:
+            return jsonify({"response": answer, "cached": True, "degraded": True})
+        return unavailable_response(e)
+    except GatewayBusy as e:
+        return jsonify({"error": str(e)}), 503
+    except (GatewayTimeout, TimeoutError) as e:
+        return jsonify({"error": str(e)}), 504
     except Exception as e:
-        print("=" * 50)
-        print(f"ERROR TYPE: {type(e).__name__}")
-        print(f"ERROR MESSAGE: {str(e)}")
-        print("FULL TRACEBACK:")
-        traceback.print_exc()
-        print("=" * 50)
-        
+        log.exception("chat failed")
         return jsonify({"error": str(e)}), 500
 
 
+def sse_event(data, event=None):
+    """Format one Server-Sent Events message"""
+    message = f"data: {json.dumps(data)}\n\n"
+    if event:
+        message = f"event: {event}\n{message}"
+    return message
+
+@app.route('/api/chat/stream', methods=['POST'])
+def ai_chat_stream():
+    """Same as /api/chat but forwards model chunks as SSE 'chunk' events, then a 'done' event"""
+    data = request.get_json(silent=True) or {}
+    question = data.get('question', '')
+    if not question:
+        return jsonify({"error": "No question provided"}), 400
+
+    # Resolve the conversation before streaming starts, while the session can still be saved
+    conversation = current_conversation(data)
+    history = conversations.history(conversation) if conversation else []
+    done_extra = {"conversation_id": conversation.id} if conversation else {}
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+    answer = None if history else answer_cache.get(question)[0]
+    if answer is not None:
+        remember_turn(conversation, question, answer)
+        return Response(sse_event({"response": answer, "cached": True, **done_extra}, event="done"),
+                        mimetype='text/event-stream', headers=headers)
+
+    try:
+        release = acquire_ai_slot()
+    except Throttled as e:
+        return throttled_response(e, e.reason)
+
+    def generate():
+        parts = []
+        try:
+            for text in llm.stream_chat(question, history=history, timeout=CHAT_TIMEOUT):
+                parts.append(text)
+                yield sse_event({"text": text}, event="chunk")
+        except GatewayUnavailable as e:
+            answer = None if history else degraded_answer(question)
+            if answer is not None:
+                yield sse_event({"response": answer, "cached": True, "degraded": True, **done_extra}, event="done")
+            else:
+                yield sse_event({"error": str(e), "retry_after": max(1, int(e.retry_after + 0.999))}, event="error")
+            return
+        except Exception as e:
+            log.exception("chat stream failed")
+            yield sse_event({"error": str(e)}, event="error")
+            return
+
+        full_text = ''.join(parts)
+        if not history:
+            answer_cache.set(question, full_text)
+        remember_turn(conversation, question, full_text)
+        yield sse_event({"response": full_text, **done_extra}, event="done")
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
+    # The slot is held until the last event is sent
+    response.call_on_close(release)
+    return response
+
 
 @app.route('/ask', methods=['POST'])
 def ask_question():
@@ -396,19 +1378,85 @@ def ask_question():
         if not question:
             return jsonify({"error": "No question provided"}), 400
 
-        chat = model.start_chat(history=[])
-        response = chat.send_message(question)
+        answer, _ = answer_cache.get(question)
+        if answer is not None:
+            return jsonify({"response": answer, "cached": True})
 
-        return jsonify({"response": response.text})
+        flight_key = 'chat:' + ' '.join(question.lower().split())
+        answer, _ = flights.do(flight_key, with_ai_slot(lambda: llm.chat(question, timeout=CHAT_TIMEOUT)))
+        answer_cache.set(question, answer)
+
+        return jsonify({"response": answer})
+    except Throttled as e:
+        return throttled_response(e, e.reason)
+    except GatewayUnavailable as e:
+        answer = degraded_answer(question)
+        if answer is not None:
+            return jsonify({"response": answer, "cached": True, "degraded": True})
+        return unavailable_response(e)
+    except GatewayBusy as e:
+        return jsonify({"error": str(e)}), 503
+    except (GatewayTimeout, TimeoutError) as e:
+        return jsonify({"error": str(e)}), 504
     except Exception as e:
-        print("=" * 50)
-        print(f"ERROR TYPE: {type(e).__name__}")
-        print(f"ERROR MESSAGE: {str(e)}")
-        print("FULL TRACEBACK:")
-        traceback.print_exc()
-        print("=" * 50)
-        
+        log.exception("ask failed")
         return jsonify({"error": str(e)}), 500
+@app.cli.command('rebuild-stats')
+def rebuild_stats_command():
+    """Rebuild the user_stats counters from the history and reminder tables (and the history archive)"""
+    rows = db.rebuild_user_stats(archived=history_archive.user_counts())
+    print(f"user_stats rebuilt ({rows} rows affected)")
+
+@app.cli.command('run-reminders')
+def run_reminders_command():
+    """Run the medicine reminder scheduler in the foreground (Ctrl+C to stop)"""
+    print("Reminder scheduler running")
+    try:
+        reminder_scheduler.run()
+    except KeyboardInterrupt:
+        reminder_scheduler.stop()
+
+@app.cli.command('partition-history')
+@click.option('--months-ahead', default=3, show_default=True, help="Empty future months to create")
+def partition_history_command(months_ahead):
+    """Convert the history tables to monthly partitions, or add upcoming months (run monthly)"""
+    for table, names in db.partition_history_tables(months_ahead).items():
+        print(f"{table}: added {', '.join(names)}")
+
+@app.cli.command('archive-history')
+@click.option('--retention-months', default=HISTORY_RETENTION_MONTHS, show_default=True,
+              help="Months kept in MySQL, besides the current one")
+@click.option('--keep-partitions', is_flag=True, help="Write the archive but do not drop the partitions")
+@click.option('--verify', is_flag=True, help="Only check archived files against their manifest checksums")
+def archive_history_command(retention_months, keep_partitions, verify):
+    """Move history partitions older than the retention window into compressed NDJSON files"""
+    if verify:
+        bad = history_archive.verify()
+        print(f"{len(history_archive.entries())} archived files, {len(bad)} damaged" +
+              ''.join(f"\n  {path}" for path in bad))
+        raise SystemExit(1 if bad else 0)
+    db.ensure_history_partitions()
+    for entry in history_archive.archive(db, retention_months, drop=not keep_partitions):
+        print(f"{entry['path']}: {entry['rows']} rows, {entry['users']} users, {entry['bytes']} bytes")
+    print(f"archive at {history_archive.root}: {history_archive.stats()}")
+
+@app.cli.command('build-images')
+def build_images_command():
+    """Generate resized WebP/AVIF/JPEG variants of the static/img images templates use, and their manifest"""
+    manifest = images.build()
+    print(f"{len(manifest['images'])} images built into static/img/{images.BUILD_SUBDIR}")
+
+def create_app():
+    """WSGI entry point: gunicorn -c gunicorn.conf.py 'app:create_app()'
+
+    Safe to call in a --preload master. Importing this module opens no
+    connections and starts no threads. The DB pool, the model client, the
+    history writer thread and the metrics flusher are all created per
+    worker on first use.
+    """
+    return app
+
+
 if __name__ == '__main__':
     # Initialize database tables
     print("Starting Health Advisor Application...")
@@ -416,5 +1464,5 @@ if __name__ == '__main__':
     db.create_tables()
     print("Database initialized")
     print(f"Secret key configured: {bool(app.secret_key)}")
-    print(f"Database config: Host={db.host}, Database={db.database}")
+    print(f"Database config: Host={getattr(db, 'host', None)}, Database={getattr(db, 'database', None)}")
     app.run(debug=True)
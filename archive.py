@@ -0,0 +1,293 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import date, datetime
+
+
+log = logging.getLogger(__name__)
+
+# History tables that can be archived, and the user_stats column counting each
+STATS_COLUMNS = {'symptoms_history': 'symptom_checks', 'ai_consultations': 'ai_consultations'}
+MANIFEST = 'manifest.json'
+FORMAT_VERSION = 1
+
+
+def months_back(today, months):
+    """First day of the month ``months`` months before today's"""
+    index = today.year * 12 + today.month - 1 - months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _encode_row(row):
+    return (json.dumps({k: v.isoformat() if isinstance(v, datetime) else v for k, v in row.items()},
+                       ensure_ascii=False) + '\n').encode('utf-8')
+
+
+def _decode_row(line):
+    row = json.loads(line)
+    row['created_at'] = datetime.fromisoformat(row['created_at'])
+    return row
+
+
+def _fsync_replace(tmp_path, path):
+    with open(tmp_path, 'rb+') as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class HistoryArchive:
+    """Monthly history partitions moved out of MySQL into compressed NDJSON files.
+
+    Layout under ``root``::
+
+        manifest.json                   one entry per archived file
+        <table>/<YYYY-MM>.ndjson.gz     rows ordered by user_id, created_at, id
+        <table>/<YYYY-MM>.index.json    user_id -> [byte offset, byte length, rows]
+
+    Each user's rows are a separate gzip member. Concatenated members are
+    still one valid gzip file (zcat works), and the index lets user_rows()
+    seek to and decompress just one user's slice. Files are written under
+    temporary names, fsynced and renamed, and the manifest is replaced
+    last. A partition is only dropped once its file is listed and its row
+    count matches, so a crash at any point loses nothing.
+    """
+
+    def __init__(self, root, compresslevel=6):
+        self.root = root
+        self.compresslevel = compresslevel
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._mtime = None
+        self._indexes = {}
+        self.reads = 0
+        self.rows_read = 0
+
+    def _load(self):
+        """Manifest entries by path, reloaded whenever manifest.json changes"""
+        try:
+            mtime = os.stat(os.path.join(self.root, MANIFEST)).st_mtime_ns
+        except FileNotFoundError:
+            return {}
+        with self._lock:
+            if mtime != self._mtime:
+                with open(os.path.join(self.root, MANIFEST), encoding='utf-8') as f:
+                    files = json.load(f)['files']
+                for entry in files:
+                    entry['first_created_at'] = datetime.fromisoformat(entry['first_created_at'])
+                    entry['last_created_at'] = datetime.fromisoformat(entry['last_created_at'])
+                self._entries = {entry['path']: entry for entry in files}
+                self._indexes = {}
+                self._mtime = mtime
+            return self._entries
+
+    def entries(self, table=None):
+        """Archived files (of one table), newest rows first"""
+        entries = [e for e in self._load().values() if table is None or e['table'] == table]
+        return sorted(entries, key=lambda e: e['last_created_at'], reverse=True)
+
+    def _save(self, entries):
+        files = [{**e, 'first_created_at': e['first_created_at'].isoformat(),
+                  'last_created_at': e['last_created_at'].isoformat()}
+                 for e in sorted(entries.values(), key=lambda e: (e['table'], e['month'], e['path']))]
+        path = os.path.join(self.root, MANIFEST)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'format': FORMAT_VERSION, 'updated_at': datetime.now().isoformat(timespec='seconds'),
+                       'files': files}, f, indent=1)
+        _fsync_replace(path + '.tmp', path)
+
+    def archive_partition(self, db, table, name, month):
+        """Write one partition to disk and list it in the manifest; returns its manifest entry"""
+        entries = dict(self._load())
+        directory = os.path.join(self.root, table)
+        os.makedirs(directory, exist_ok=True)
+        label = f"{month:%Y-%m}"
+        stem, copy = label, 1
+        # Rows that arrive for an already archived month get a file of their own
+        while os.path.join(table, f"{stem}.ndjson.gz") in entries:
+            copy += 1
+            stem = f"{label}.{copy}"
+        data_path = os.path.join(directory, f"{stem}.ndjson.gz")
+        index_path = os.path.join(directory, f"{stem}.index.json")
+
+        index = {}
+        rows = 0
+        first = last = None
+        with open(data_path + '.tmp', 'wb') as f:
+            user_id = member = None
+            start = count = 0
+            for row in db.iter_history_partition(table, name):
+                if row['user_id'] != user_id:
+                    if member is not None:
+                        member.close()
+                        index[str(user_id)] = [start, f.tell() - start, count]
+                    user_id, start, count = row['user_id'], f.tell(), 0
+                    member = gzip.GzipFile(fileobj=f, mode='wb', compresslevel=self.compresslevel, mtime=0)
+                member.write(_encode_row(row))
+                count += 1
+                rows += 1
+                first = row['created_at'] if first is None else min(first, row['created_at'])
+                last = row['created_at'] if last is None else max(last, row['created_at'])
+            if member is not None:
+                member.close()
+                index[str(user_id)] = [start, f.tell() - start, count]
+            size = f.tell()
+        if not rows:
+            os.remove(data_path + '.tmp')
+            return None
+
+        digest = hashlib.sha256()
+        with open(data_path + '.tmp', 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        with open(index_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(index, f, separators=(',', ':'))
+        _fsync_replace(data_path + '.tmp', data_path)
+        _fsync_replace(index_path + '.tmp', index_path)
+
+        entry = {
+            'table': table,
+            'month': label,
+            'partition': name,
+            'path': os.path.relpath(data_path, self.root),
+            'index': os.path.relpath(index_path, self.root),
+            'rows': rows,
+            'users': len(index),
+            'bytes': size,
+            'sha256': digest.hexdigest(),
+            'first_created_at': first,
+            'last_created_at': last,
+            'archived_at': datetime.now().isoformat(timespec='seconds')
+        }
+        entries[entry['path']] = entry
+        self._save(entries)
+        return entry
+
+    def archive(self, db, retention_months, today=None, drop=True):
+        """Archive (and drop) every history partition older than retention_months; returns the new entries"""
+        cutoff = months_back(today or date.today(), retention_months)
+        archived = []
+        for table in STATS_COLUMNS:
+            for name, month in db.history_partitions(table):
+                if month >= cutoff:
+                    continue
+                rows = db.count_history_partition(table, name)
+                if rows:
+                    # A previous run may have stopped between writing the file and dropping the partition
+                    entry = next((e for e in self.entries(table) if e['partition'] == name and e['rows'] == rows), None)
+                    if entry is None:
+                        entry = self.archive_partition(db, table, name, month)
+                        if entry is None:
+                            continue
+                        archived.append(entry)
+                        log.info("history partition archived", extra={
+                            'table': table, 'partition': name, 'rows': entry['rows'], 'bytes': entry['bytes']
+                        })
+                    if db.count_history_partition(table, name) != entry['rows']:
+                        log.error("partition changed while archiving, kept in MySQL",
+                                  extra={'table': table, 'partition': name})
+                        continue
+                if drop:
+                    db.drop_history_partition(table, name)
+        return archived
+
+    def _index(self, entry):
+        index = self._indexes.get(entry['index'])
+        if index is None:
+            with open(os.path.join(self.root, entry['index']), encoding='utf-8') as f:
+                index = json.load(f)
+            with self._lock:
+                self._indexes[entry['index']] = index
+        return index
+
+    def user_rows(self, entry, user_id):
+        """One user's rows of an archived file, oldest first (only their gzip member is read)"""
+        slot = self._index(entry).get(str(user_id))
+        if slot is None:
+            return []
+        offset, length, _ = slot
+        with open(os.path.join(self.root, entry['path']), 'rb') as f:
+            f.seek(offset)
+            data = gzip.decompress(f.read(length))
+        rows = [_decode_row(line) for line in data.splitlines()]
+        with self._lock:
+            self.reads += 1
+            self.rows_read += len(rows)
+        return rows
+
+    def user_page(self, table, user_id, limit, before=None, since=None, until=None):
+        """A page of a user's archived rows with the keyset semantics of Database._history_page.
+
+        Rows come newest first, and before is the (created_at, id) of the
+        previous page's last row. Returns (rows, has_more). Files whose
+        date range cannot match are skipped without being opened.
+        """
+        entries = self.entries(table)
+        collected = []
+        for i, entry in enumerate(entries):
+            if ((since is not None and entry['last_created_at'] < since)
+                    or (until is not None and entry['first_created_at'] >= until)
+                    or (before is not None and entry['first_created_at'] > before[0])):
+                continue
+            for row in self.user_rows(entry, user_id):
+                if ((since is None or row['created_at'] >= since)
+                        and (until is None or row['created_at'] < until)
+                        and (before is None or (row['created_at'], row['id']) < tuple(before))):
+                    row.pop('user_id', None)
+                    collected.append(row)
+            collected.sort(key=lambda r: (r['created_at'], r['id']), reverse=True)
+            # Done once the page is full and every remaining file is older than its last row
+            if len(collected) > limit and (i + 1 == len(entries)
+                                           or entries[i + 1]['last_created_at'] < collected[limit]['created_at']):
+                break
+        return collected[:limit], len(collected) > limit
+
+    def iter_user_rows(self, table, user_id, since=None, until=None):
+        """All of a user's archived rows of a table, oldest first, one file at a time"""
+        for entry in sorted(self.entries(table), key=lambda e: e['first_created_at']):
+            if ((since is not None and entry['last_created_at'] < since)
+                    or (until is not None and entry['first_created_at'] >= until)):
+                continue
+            for row in self.user_rows(entry, user_id):
+                if (since is None or row['created_at'] >= since) and (until is None or row['created_at'] < until):
+                    row.pop('user_id', None)
+                    yield row
+
+    def user_counts(self):
+        """{user_id: {user_stats column: archived rows}} across every archived file"""
+        counts = {}
+        for entry in self.entries():
+            column = STATS_COLUMNS[entry['table']]
+            for user_id, (_, _, rows) in self._index(entry).items():
+                user = counts.setdefault(int(user_id), {})
+                user[column] = user.get(column, 0) + rows
+        return counts
+
+    def verify(self):
+        """Paths of archived files whose checksum no longer matches the manifest"""
+        bad = []
+        for entry in self.entries():
+            digest = hashlib.sha256()
+            try:
+                with open(os.path.join(self.root, entry['path']), 'rb') as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b''):
+                        digest.update(chunk)
+            except OSError:
+                bad.append(entry['path'])
+                continue
+            if digest.hexdigest() != entry['sha256']:
+                bad.append(entry['path'])
+        return bad
+
+    def stats(self):
+        entries = self.entries()
+        with self._lock:
+            return {
+                'files': len(entries),
+                'rows': sum(e['rows'] for e in entries),
+                'bytes': sum(e['bytes'] for e in entries),
+                'reads': self.reads,
+                'rows_read': self.rows_read
+            }
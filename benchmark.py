@@ -0,0 +1,1116 @@
+"""Offline load tests and benchmarks for the Health Advisor app.
+
+    python benchmark.py load --concurrency 50 --duration 30
+    python benchmark.py load --compare bench_results/baseline.json
+    python benchmark.py startup --runs 10 --budget-ms 800
+    python benchmark.py history --rows 100000
+    python benchmark.py logging --threads 8
+    python benchmark.py resilience --hedge-after 1.5
+    python benchmark.py triage --samples 20000
+    python benchmark.py reminders --reminders 100000
+    python benchmark.py export --rows 1000000
+    python benchmark.py compression --repeat 200
+
+'load' starts app.py in-process on a threaded HTTP server, with the fake
+Gemini backend (MODEL_BACKEND=fake) and the in-memory database
+(DB_BACKEND=memory) unless told otherwise. It drives /api/login,
+/api/user/stats, /api/symptoms/check and /api/chat from many simulated
+users. It reports throughput and p50/p95/p99 latency per endpoint and saves
+the results as JSON for regression comparison.
+
+'startup' starts fresh interpreters that import app.py, call create_app()
+and serve the first page. It reports cold-start timings and the slowest
+imports, and fails when the median import time exceeds the budget.
+
+'history' seeds one user with many history rows and times
+/api/history-style keyset pages at increasing depths (and, on MySQL, the
+equivalent LIMIT/OFFSET query) to show that page latency stays flat.
+
+'logging' measures what one access-log line costs the request thread with
+the old print()+flush, a synchronous logging handler and the queue-backed
+BackgroundHandler from logging_setup.py.
+
+'resilience' drives the LLM gateway directly against FakeModel through a
+healthy phase, an outage and a recovery, with and without hedging. It
+reports latency and outcomes per phase so fail-fast, retry and hedge
+behaviour can be checked without Gemini. It ends with a probe drill: a
+client drops the half-open probe stream mid-answer, and the run fails
+unless the breaker still lets the next call through.
+
+'triage' measures the local symptom triage engine: descriptions per second
+(one at a time and vectorised), the share of requests it answers without
+the model at each confidence threshold, agreement with the condition a
+synthetic description was generated from, and red flags that slipped
+through (must be 0). Red flag cases include paraphrases the phrase table
+does not list ("lips are swollen", "neck is stiff") appended to routine
+symptoms. --input replays real descriptions, one per line.
+
+'reminders' seeds the in-memory database with reminders spread over the
+day and replays 24 hours of ReminderScheduler ticks on a simulated clock,
+plus a final tick that drains the last step. It reports reminders
+delivered (failing unless every active one was), how late they fired,
+database reads per tick and rows read, next to the rows a once-a-minute
+full scan would read.
+
+'export' pushes synthetic history records through the /api/export
+serializers (NDJSON, CSV, each with and without gzip). It reports time to
+first byte, rows per second, output size and peak traced memory at two
+row counts. Peak memory should not grow with the row count.
+
+'compression' captures real response bodies from the app (dashboard and
+contact pages, a symptom analysis, a chat answer, the dashboard snapshot
+and an SSE chat stream) with the fake backends, and compresses each one at
+several gzip levels and brotli qualities (when Brotli is installed). It
+reports CPU time per response and per KB next to the bytes saved; streams
+are compressed event by event with a sync flush, as Compressor does.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+
+
+SYMPTOM_POOL = [
+    "fever, headache, cough", "sore throat, runny nose", "headache, nausea",
+    "stomach pain, diarrhea", "fatigue, muscle pain", "cough, shortness of breath",
+    "dizziness, nausea, vomiting", "rash, itching", "back pain", "joint pain, swelling",
+    "chest pain", "insomnia, anxiety", "sneezing, itchy eyes", "fever, chills, body ache",
+]
+QUESTION_POOL = [
+    "How much water should I drink daily?", "What are the symptoms of dehydration?",
+    "How can I lower my blood pressure naturally?", "How many hours of sleep do adults need?",
+    "Is it safe to take ibuprofen with food?", "What foods are high in iron?",
+    "How do I know if I have the flu or a cold?", "What is a healthy resting heart rate?",
+]
+DEFAULT_MIX = "login=1,stats=3,symptoms=2,chat=2"
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(pct / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(latencies, errors, elapsed):
+    values = sorted(latencies)
+    return {
+        'requests': len(values) + errors,
+        'errors': errors,
+        'throughput_rps': round((len(values) + errors) / elapsed, 2) if elapsed else 0.0,
+        'mean_ms': round(sum(values) / len(values), 2) if values else 0.0,
+        'p50_ms': round(percentile(values, 50), 2),
+        'p95_ms': round(percentile(values, 95), 2),
+        'p99_ms': round(percentile(values, 99), 2),
+        'max_ms': round(values[-1], 2) if values else 0.0,
+    }
+
+
+class Client:
+    """Minimal keep-alive HTTP client that carries the Flask session cookie"""
+
+    def __init__(self, base_url):
+        url = urlparse(base_url)
+        self.host, self.port = url.hostname, url.port or 80
+        self.conn = None
+        self.cookie = None
+
+    def request(self, method, path, body=None):
+        headers = {'Content-Type': 'application/json'}
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        payload = json.dumps(body) if body is not None else None
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=120)
+            try:
+                self.conn.request(method, path, body=payload, headers=headers)
+                response = self.conn.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                # Server closed an idle keep-alive connection: reconnect once
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+        set_cookie = response.getheader('Set-Cookie')
+        if set_cookie:
+            self.cookie = set_cookie.split(';', 1)[0]
+        return response.status, data
+
+
+def start_server(app):
+    """Serve the Flask app on an ephemeral localhost port in a background thread"""
+    from werkzeug.serving import make_server, WSGIRequestHandler
+
+    class KeepAliveHandler(WSGIRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - {'login', 'stats', 'symptoms', 'chat'}
+    if unknown:
+        raise SystemExit(f"Unknown endpoints in --mix: {', '.join(sorted(unknown))}")
+    return mix
+
+
+def run_load(args):
+    os.environ.setdefault('MODEL_BACKEND', args.backend)
+    os.environ.setdefault('DB_BACKEND', args.db)
+    os.environ.setdefault('FLASK_SECRET_KEY', 'benchmark')
+    os.environ['FAKE_LLM_LATENCY_MS'] = str(args.llm_latency_ms)
+    os.environ['FAKE_LLM_LATENCY_SIGMA'] = str(args.llm_latency_sigma)
+    os.environ['FAKE_LLM_ERROR_RATE'] = str(args.llm_error_rate)
+    os.environ['FAKE_LLM_SEED'] = str(args.seed)
+    os.environ['DB_FAKE_LATENCY_MS'] = str(args.db_latency_ms)
+    # Each simulated user fires requests back to back, far beyond a person's rate limit;
+    # lift the limits so the run measures the app rather than 429s
+    for name in ('RATE_LIMIT_USER_PER_MINUTE', 'RATE_LIMIT_USER_BURST', 'RATE_LIMIT_IP_PER_MINUTE', 'RATE_LIMIT_IP_BURST'):
+        os.environ.setdefault(name, '1000000')
+    # Access logs for every request would drown the progress output
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    server = None
+    base_url = args.url
+    if not base_url:
+        import app as health_app
+        health_app.db.create_tables()
+        server, base_url = start_server(health_app.app)
+
+    mix = parse_mix(args.mix)
+    names, weights = list(mix), list(mix.values())
+    rng = random.Random(args.seed)
+    prompts = max(args.distinct_prompts, 1)
+    symptom_texts = [SYMPTOM_POOL[i % len(SYMPTOM_POOL)] + ('' if i < len(SYMPTOM_POOL) else f", variant {i}")
+                     for i in range(prompts)]
+    questions = [QUESTION_POOL[i % len(QUESTION_POOL)] + ('' if i < len(QUESTION_POOL) else f" (case {i})")
+                 for i in range(prompts)]
+
+    # One account per simulated user, created before the clock starts
+    run_id = f"{int(time.time())}{rng.randrange(10 ** 6)}"
+    users = []
+    for i in range(args.concurrency):
+        client = Client(base_url)
+        email = f"bench{run_id}-{i}@example.com"
+        status, body = client.request('POST', '/api/register', {
+            'user_name': f"bench{i}", 'contact_number': '0000000000', 'email': email,
+            'password': 'benchmark', 'confirm_password': 'benchmark'
+        })
+        if status not in (200, 201):
+            raise SystemExit(f"Could not register benchmark user ({status}): {body[:200]!r}")
+        client.request('POST', '/api/login', {'email': email, 'password': 'benchmark'})
+        users.append((client, email, random.Random(args.seed + i)))
+
+    results = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    lock = threading.Lock()
+    start = time.perf_counter()
+    warm_until = start + args.warmup
+    stop_at = warm_until + args.duration
+
+    def worker(client, email, user_rng):
+        while time.perf_counter() < stop_at:
+            name = user_rng.choices(names, weights)[0]
+            if name == 'login':
+                call = ('POST', '/api/login', {'email': email, 'password': 'benchmark'})
+            elif name == 'stats':
+                call = ('GET', '/api/user/stats', None)
+            elif name == 'symptoms':
+                call = ('POST', '/api/symptoms/check', {'symptoms': user_rng.choice(symptom_texts)})
+            else:
+                call = ('POST', '/api/chat', {'question': user_rng.choice(questions), 'new_conversation': True})
+            began = time.perf_counter()
+            try:
+                status, _ = client.request(*call)
+                ok = status < 400
+            except Exception:
+                ok = False
+            finished = time.perf_counter()
+            if began < warm_until:
+                continue
+            with lock:
+                if ok:
+                    results[name].append((finished - began) * 1000)
+                else:
+                    errors[name] += 1
+
+    threads = [threading.Thread(target=worker, args=user) for user in users]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - warm_until
+
+    if server is not None:
+        server.shutdown()
+
+    all_latencies = [v for values in results.values() for v in values]
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'git_commit': _git_commit(),
+            'target': args.url or 'in-process',
+            'backend': os.environ['MODEL_BACKEND'],
+            'db': os.environ['DB_BACKEND'],
+            'concurrency': args.concurrency,
+            'duration_s': args.duration,
+            'mix': args.mix,
+            'distinct_prompts': args.distinct_prompts,
+            'llm_latency_ms': args.llm_latency_ms,
+            'llm_latency_sigma': args.llm_latency_sigma,
+            'llm_error_rate': args.llm_error_rate,
+            'db_latency_ms': args.db_latency_ms,
+            'seed': args.seed,
+        },
+        'endpoints': {name: summarize(results[name], errors[name], elapsed) for name in names},
+        'total': summarize(all_latencies, sum(errors.values()), elapsed),
+    }
+    print_report(report)
+    save_report(report, args.output)
+    if args.compare:
+        return compare_reports(report, args.compare, args.max_regression)
+    return 0
+
+
+STARTUP_PROBE = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+application = app.create_app()
+created = time.perf_counter()
+status = application.test_client().get('/').status_code
+served = time.perf_counter()
+print(json.dumps({'import_ms': (imported - started) * 1000, 'create_app_ms': (created - imported) * 1000,
+                  'first_request_ms': (served - created) * 1000, 'status': status}))
+"""
+
+
+def slowest_imports(env, limit):
+    """Top-level modules by cumulative import time, from python -X importtime"""
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'],
+                          capture_output=True, text=True, env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+    modules = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Direct imports of app.py are indented by exactly three spaces
+        if name.startswith('   ') and not name.startswith('    '):
+            modules.append((int(cumulative) / 1000, name.strip()))
+    return [{'module': name, 'cumulative_ms': round(ms, 1)} for ms, name in sorted(modules, reverse=True)[:limit]]
+
+
+def run_startup(args):
+    env = dict(os.environ)
+    env.setdefault('MODEL_BACKEND', args.backend)
+    env.setdefault('DB_BACKEND', args.db)
+    env.setdefault('FLASK_SECRET_KEY', 'benchmark')
+    cwd = os.path.dirname(os.path.abspath(__file__))
+
+    runs = []
+    for i in range(args.runs):
+        started = time.perf_counter()
+        proc = subprocess.run([sys.executable, '-c', STARTUP_PROBE], capture_output=True, text=True, env=env, cwd=cwd)
+        total_ms = (time.perf_counter() - started) * 1000
+        if proc.returncode != 0:
+            raise SystemExit(f"Startup probe failed:\n{proc.stderr[-2000:]}")
+        run = json.loads(proc.stdout.strip().splitlines()[-1])
+        run['process_ms'] = total_ms
+        runs.append(run)
+
+    report = {
+        'meta': {
+            'benchmark': 'startup',
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'git_commit': _git_commit(),
+            'runs': args.runs,
+            'backend': env['MODEL_BACKEND'],
+            'db': env['DB_BACKEND'],
+            'budget_ms': args.budget_ms
+        },
+        'phases': {},
+        'slowest_imports': slowest_imports(env, args.top)
+    }
+    print(f"\n{'phase':<18}{'median ms':>12}{'max ms':>10}")
+    for phase in ('import_ms', 'create_app_ms', 'first_request_ms', 'process_ms'):
+        values = sorted(run[phase] for run in runs)
+        report['phases'][phase] = {'median': round(percentile(values, 50), 1), 'max': round(values[-1], 1)}
+        print(f"{phase:<18}{report['phases'][phase]['median']:>12}{report['phases'][phase]['max']:>10}")
+    print("\nSlowest imports:")
+    for entry in report['slowest_imports']:
+        print(f"  {entry['cumulative_ms']:>8} ms  {entry['module']}")
+
+    save_report(report, args.output, 'startup')
+    median_import = report['phases']['import_ms']['median']
+    if args.budget_ms and median_import > args.budget_ms:
+        print(f"\nImport time {median_import} ms exceeds the {args.budget_ms} ms budget")
+        return 1
+    return 0
+
+
+def run_history(args):
+    os.environ.setdefault('DB_BACKEND', args.db)
+    from database import create_database
+
+    db = create_database()
+    if os.environ['DB_BACKEND'] != 'memory':
+        conn = db.get_connection()
+        if conn is None:
+            print(f"Cannot connect to MySQL at {db.host} (database {db.database}). Set DB_HOST, DB_USER, "
+                  f"DB_PASSWORD and DB_NAME, or run with --db memory.", file=sys.stderr)
+            return 2
+        conn.close()
+    db.create_tables()
+    fetch = db.get_symptom_history if args.table == 'symptoms' else db.get_consultation_history
+
+    user_id = args.user_id
+    if user_id is None:
+        email = f"history-bench-{int(time.time())}@example.com"
+        db.register_user('history-bench', '0000000000', email, 'benchmark')
+        user_id = db.check_login(email, 'benchmark')['id']
+        start = datetime(2020, 1, 1)
+        print(f"Seeding {args.rows} {args.table} rows for user {user_id}...")
+        for offset in range(0, args.rows, 2000):
+            batch = range(offset, min(offset + 2000, args.rows))
+            # Several rows per second so the id tie-breaker is exercised
+            stamps = [start + timedelta(seconds=i // 3 * 60) for i in batch]
+            if args.table == 'symptoms':
+                db.add_history_batch([(user_id, f"symptom set {i}", '{}', t) for i, t in zip(batch, stamps)], [])
+            else:
+                db.add_history_batch([], [(user_id, None, f"question {i}", "answer", t)
+                                          for i, t in zip(batch, stamps)])
+
+    # Untimed walk in large pages to find a cursor at each depth
+    depths = [int(args.rows * p / 10) for p in range(10)]
+    cursors, before, seen = {}, None, 0
+    while True:
+        for depth in depths:
+            if depth not in cursors and seen >= depth:
+                cursors[depth] = before
+        rows, has_more = fetch(user_id, limit=1000, before=before)
+        if not rows or len(cursors) == len(depths):
+            break
+        seen += len(rows)
+        before = (rows[-1]['created_at'], rows[-1]['id'])
+        if not has_more:
+            break
+
+    offset_sql = None
+    if os.environ['DB_BACKEND'] == 'mysql':
+        table = 'symptoms_history' if args.table == 'symptoms' else 'ai_consultations'
+        offset_sql = (f"SELECT {db.HISTORY_COLUMNS[table]} FROM {table} WHERE user_id = %s "
+                      f"ORDER BY created_at DESC, id DESC LIMIT %s OFFSET %s")
+
+    report = {
+        'meta': {
+            'benchmark': 'history',
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'git_commit': _git_commit(),
+            'db': os.environ['DB_BACKEND'],
+            'table': args.table,
+            'user_id': user_id,
+            'page_size': args.page_size,
+            'repeat': args.repeat
+        },
+        'depths': []
+    }
+    print(f"\n{'depth':>10}{'keyset p50':>12}{'keyset p95':>12}{'offset p50':>12}")
+    for depth in sorted(cursors):
+        keyset = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            fetch(user_id, limit=args.page_size, before=cursors[depth])
+            keyset.append((time.perf_counter() - started) * 1000)
+        keyset.sort()
+        row = {'depth': depth, 'keyset_p50_ms': round(percentile(keyset, 50), 2),
+               'keyset_p95_ms': round(percentile(keyset, 95), 2), 'offset_p50_ms': None}
+        if offset_sql:
+            offset = []
+            with db.connection() as conn:
+                cursor = conn.cursor(dictionary=True)
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    cursor.execute(offset_sql, (user_id, args.page_size, depth))
+                    cursor.fetchall()
+                    offset.append((time.perf_counter() - started) * 1000)
+                cursor.close()
+            offset.sort()
+            row['offset_p50_ms'] = round(percentile(offset, 50), 2)
+        report['depths'].append(row)
+        print(f"{depth:>10}{row['keyset_p50_ms']:>12}{row['keyset_p95_ms']:>12}"
+              f"{row['offset_p50_ms'] if row['offset_p50_ms'] is not None else '-':>12}")
+
+    save_report(report, args.output, 'history')
+    return 0
+
+
+def run_logging(args):
+    import logging
+    from logging_setup import BackgroundHandler, JsonFormatter
+
+    sink = open(args.sink, 'w')
+    fields = {'route': '/api/user/stats', 'path': '/api/user/stats', 'status': 200, 'duration_ms': 3.2}
+
+    def legacy(i):
+        print(f"Request /api/user/stats status=200 duration=3.2ms n={i}", file=sink, flush=True)
+
+    def make_logger(name, handler):
+        logger = logging.getLogger(f"benchmark.{name}")
+        logger.handlers = [handler]
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        return lambda i: logger.info("request", extra=fields)
+
+    sync_handler = logging.StreamHandler(sink)
+    sync_handler.setFormatter(JsonFormatter())
+    target = logging.StreamHandler(sink)
+    target.setFormatter(JsonFormatter())
+    background = BackgroundHandler([target], max_queue=args.requests * args.threads)
+    modes = {'print': legacy, 'sync': make_logger('sync', sync_handler),
+             'background': make_logger('background', background)}
+
+    report = {'meta': {'git_commit': _git_commit(), 'threads': args.threads, 'requests': args.requests,
+                       'sink': args.sink}, 'modes': {}}
+    print(f"{'mode':<12}{'p50 us':>10}{'p99 us':>10}{'max us':>10}{'lines/s':>12}")
+    for name, emit in modes.items():
+        samples = []
+        lock = threading.Lock()
+
+        def worker():
+            local = []
+            for i in range(args.requests):
+                started = time.perf_counter()
+                emit(i)
+                local.append((time.perf_counter() - started) * 1e6)
+            with lock:
+                samples.extend(local)
+
+        threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+        if name == 'background':
+            # The writer thread still has to drain; that time is not on the request path
+            background.stop()
+        samples.sort()
+        row = {
+            'p50_us': round(percentile(samples, 50), 1),
+            'p99_us': round(percentile(samples, 99), 1),
+            'max_us': round(samples[-1], 1),
+            'lines_per_s': round(len(samples) / elapsed)
+        }
+        if name == 'background':
+            row['dropped'] = background.dropped
+        report['modes'][name] = row
+        print(f"{name:<12}{row['p50_us']:>10}{row['p99_us']:>10}{row['max_us']:>10}{row['lines_per_s']:>12}")
+    sink.close()
+
+    save_report(report, args.output, 'logging')
+    return 0
+
+
+def breaker_probe_drill(open_seconds=0.2):
+    """Abandon a half-open probe stream mid-answer; True if the next call still reaches the model"""
+    from llm_gateway import GatewayUnavailable, LLMGateway
+    from model_backends import FakeModel
+    from resilience import CircuitBreaker
+
+    breaker = CircuitBreaker(min_calls=1, open_seconds=open_seconds)
+    gateway = LLMGateway(FakeModel(latency_ms=5, latency_sigma=0, token_ms=1, seed=1), breaker=breaker)
+    breaker.record(False)
+    time.sleep(open_seconds)
+    stream = gateway.stream_chat("probe question")
+    next(stream)
+    # What the SSE view sees when the browser goes away
+    stream.close()
+    try:
+        gateway.generate("question after the disconnect")
+    except GatewayUnavailable:
+        return False
+    return breaker.stats()['state'] == 'closed'
+
+
+def run_resilience(args):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from llm_gateway import GatewayError, LLMGateway
+    from model_backends import FakeModel
+    from resilience import CircuitBreaker
+
+    phases = [('healthy', args.error_rate, 1.0), ('outage', 1.0, args.outage_slowdown),
+              ('recovery', args.error_rate, 1.0)]
+    report = {'meta': {'git_commit': _git_commit(), 'args': vars(args).copy()}, 'runs': {}}
+    report['meta']['args'].pop('func', None)
+
+    for hedge_after in ([None, args.hedge_after] if args.hedge_after else [None]):
+        label = f"hedge {hedge_after}s" if hedge_after else 'no hedge'
+        model = FakeModel(latency_ms=args.llm_latency_ms, latency_sigma=args.llm_latency_sigma, seed=args.seed)
+        breaker = CircuitBreaker(min_calls=args.breaker_min_calls, window=args.phase_seconds,
+                                 open_seconds=args.breaker_open_seconds)
+        gateway = LLMGateway(model, max_concurrency=args.concurrency * 2, default_timeout=args.timeout,
+                             breaker=breaker, max_retries=args.max_retries, min_attempt_seconds=args.min_attempt,
+                             hedge_after=hedge_after)
+        print(f"\n{label}")
+        print(f"{'phase':<10}{'calls':>7}{'ok':>6}{'fast fail':>11}{'errors':>8}{'p50 ms':>9}{'p99 ms':>9}"
+              f"{'fail p50 ms':>13}{'breaker':>10}")
+        rows = {}
+        for phase, error_rate, slowdown in phases:
+            model.error_rate = error_rate
+            model.latency_ms = args.llm_latency_ms * slowdown
+            outcomes = []
+            lock = threading.Lock()
+            stop_at = time.monotonic() + args.phase_seconds
+
+            def worker(n):
+                i = 0
+                while time.monotonic() < stop_at:
+                    started = time.perf_counter()
+                    try:
+                        gateway.generate(f"question {n}-{i}")
+                        outcome = 'ok'
+                    except GatewayError as e:
+                        outcome = 'fast_fail' if type(e).__name__ == 'GatewayUnavailable' else 'error'
+                    except Exception:
+                        outcome = 'error'
+                    with lock:
+                        outcomes.append((outcome, (time.perf_counter() - started) * 1000))
+                    i += 1
+                    if outcome == 'fast_fail':
+                        # Real clients back off too; avoids a hot loop while the breaker is open
+                        time.sleep(0.05)
+
+            with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                list(pool.map(worker, range(args.concurrency)))
+
+            ok = sorted(ms for outcome, ms in outcomes if outcome == 'ok')
+            failed = sorted(ms for outcome, ms in outcomes if outcome != 'ok')
+            row = {
+                'calls': len(outcomes),
+                'ok': len(ok),
+                'fast_fail': sum(1 for outcome, _ in outcomes if outcome == 'fast_fail'),
+                'errors': sum(1 for outcome, _ in outcomes if outcome == 'error'),
+                'p50_ms': round(percentile(ok, 50), 1),
+                'p99_ms': round(percentile(ok, 99), 1),
+                'fail_p50_ms': round(percentile(failed, 50), 1),
+                'breaker': breaker.stats()['state']
+            }
+            rows[phase] = row
+            print(f"{phase:<10}{row['calls']:>7}{row['ok']:>6}{row['fast_fail']:>11}{row['errors']:>8}"
+                  f"{row['p50_ms']:>9}{row['p99_ms']:>9}{row['fail_p50_ms']:>13}{row['breaker']:>10}")
+        rows['gateway'] = gateway.stats()
+        report['runs'][label] = rows
+        print(f"retries {rows['gateway']['retries']}, hedges {rows['gateway']['hedges']} "
+              f"({rows['gateway']['hedge_wins']} won), breaker opened {breaker.opened}x")
+
+    report['probe_drill_ok'] = breaker_probe_drill()
+    print(f"\nabandoned half-open probe: {'breaker recovered' if report['probe_drill_ok'] else 'BREAKER STUCK'}")
+    save_report(report, args.output, 'resilience')
+    return 0 if report['probe_drill_ok'] else 1
+
+
+# Red flags worded the way people write them rather than as listed in triage.SYMPTOMS
+RED_FLAG_PARAPHRASES = [
+    "lips are swollen", "my tongue feels swollen", "face is swelling up", "throat is swelling",
+    "neck is stiff", "my neck feels really stiff", "feeling faint", "I think I might faint",
+    "chest hurts", "my chest feels tight", "chest is sore when I cough", "can't catch my breath",
+    "hard to breathe", "it hurts to breathe", "lips look blue", "my arm went numb", "I collapsed earlier",
+    # Numbers: a high temperature or symptoms that have gone on too long
+    "fever 104", "temperature of 39.8C", "temp is 103.5 F", "40 degrees", "for 3 weeks", "going on for a month",
+    "had it for two weeks"
+]
+RED_FLAG = 'red flag'
+
+
+def triage_corpus(samples, rng):
+    """(text, intended condition, RED_FLAG or None) pairs: routine cases, red flags and vague text"""
+    from triage import CONDITIONS, RED_FLAGS, SYMPTOMS
+
+    fillers = ['', 'since yesterday', 'for two days', 'really bad', 'on and off', 'after work',
+               'my partner has it too', 'started this morning', 'getting worse']
+    vague = ["I just feel off", "something is wrong with my knee", "weird feeling in my arm when I type",
+             "not sure what's going on", "my skin looks different", "I keep forgetting things"]
+    corpus = []
+    for _ in range(samples):
+        roll = rng.random()
+        if roll < 0.05:
+            text = f"{rng.choice(SYMPTOMS[rng.choice(sorted(RED_FLAGS))])} and {rng.choice(SYMPTOMS['headache'])}"
+            corpus.append((text, RED_FLAG))
+        elif roll < 0.1:
+            # A routine, confidently scored case with a paraphrased red flag tacked on
+            _, _, weights, _, _, _ = rng.choice(CONDITIONS)
+            top = sorted(weights, key=weights.get, reverse=True)[:3]
+            text = ' and '.join(rng.choice(SYMPTOMS[s]) for s in top) + ', ' + rng.choice(RED_FLAG_PARAPHRASES)
+            corpus.append((text, RED_FLAG))
+        elif roll < 0.25:
+            corpus.append((rng.choice(vague), None))
+        else:
+            name, _, weights, _, _, _ = rng.choice(CONDITIONS)
+            symptoms = list(weights)
+            picked = set()
+            for _ in range(rng.randint(1, 4)):
+                picked.add(rng.choices(symptoms, weights=[weights[s] for s in symptoms])[0])
+            phrases = [rng.choice(SYMPTOMS[s]) for s in picked]
+            corpus.append((', '.join(phrases) + ' ' + rng.choice(fillers), name))
+    return corpus
+
+
+def run_triage(args):
+    from triage import RED_FLAGS, SymptomNormalizer, TriageEngine
+
+    rng = random.Random(args.seed)
+    if args.input:
+        with open(args.input, encoding='utf-8') as f:
+            corpus = [(line.strip(), None) for line in f if line.strip()]
+    else:
+        corpus = triage_corpus(args.samples, rng)
+    texts = [text for text, _ in corpus]
+    normalizer = SymptomNormalizer()
+    red_flag_ids = {normalizer.index[name] for name in RED_FLAGS}
+    # Canonical phrases found in the text, or a paraphrase the corpus put there
+    is_red_flag = [intended == RED_FLAG or bool(normalizer.parse(text)[0] & red_flag_ids) for text, intended in corpus]
+
+    engine = TriageEngine()
+    started = time.perf_counter()
+    for text in texts:
+        engine.triage(text)
+    single = time.perf_counter() - started
+    started = time.perf_counter()
+    for i in range(0, len(texts), args.batch):
+        engine.triage_many(texts[i:i + args.batch])
+    batched = time.perf_counter() - started
+
+    report = {
+        'meta': {'git_commit': _git_commit(), 'samples': len(texts), 'input': args.input, 'seed': args.seed},
+        'throughput': {
+            'single_per_s': round(len(texts) / single),
+            'single_us': round(single / len(texts) * 1e6, 1),
+            'batched_per_s': round(len(texts) / batched),
+            'batched_us': round(batched / len(texts) * 1e6, 1),
+            'batch_size': args.batch
+        },
+        'thresholds': {}
+    }
+    print(f"{len(texts)} descriptions: {report['throughput']['single_us']} us each one at a time, "
+          f"{report['throughput']['batched_us']} us each in batches of {args.batch}")
+
+    print(f"\n{'threshold':>10}{'answered':>10}{'agreement':>11}{'red flags':>11}  escalated by reason")
+    for threshold in [float(t) for t in args.thresholds.split(',')]:
+        engine = TriageEngine(threshold=threshold)
+        results = engine.triage_many(texts)
+        answered = [(i, intended, analysis) for i, ((_, intended), (analysis, _, _)) in enumerate(zip(corpus, results))
+                    if analysis is not None]
+        labelled = [(intended, analysis) for _, intended, analysis in answered if intended not in (None, RED_FLAG)]
+        agreement = (sum(1 for intended, analysis in labelled if analysis['conditions'][0]['name'] == intended)
+                     / len(labelled) if labelled else None)
+        leaked = sum(1 for i, _, _ in answered if is_red_flag[i])
+        stats = engine.stats()
+        reasons = {key[len('escalated_'):]: value for key, value in stats.items()
+                   if key.startswith('escalated_')}
+        report['thresholds'][str(threshold)] = {
+            'answer_rate': stats['answer_rate'], 'agreement': agreement, 'red_flags_answered': leaked,
+            'escalated': reasons
+        }
+        print(f"{threshold:>10}{stats['answer_rate']:>10.1%}"
+              f"{agreement if agreement is not None else float('nan'):>11.1%}{leaked:>11}  "
+              + ', '.join(f"{k} {v}" for k, v in sorted(reasons.items())))
+
+    save_report(report, args.output, 'triage')
+    return 1 if any(row['red_flags_answered'] for row in report['thresholds'].values()) else 0
+
+
+def run_reminders(args):
+    from datetime import datetime, time as dtime, timedelta
+    from memory_db import MemoryDatabase
+    from reminders import ReminderScheduler
+
+    rng = random.Random(args.seed)
+    db = MemoryDatabase(latency_ms=0)
+    for i in range(args.reminders):
+        seconds = rng.randrange(24 * 3600)
+        db.add_reminder(1 + i % 1000, f"medicine {i}",
+                        reminder_time=dtime(seconds // 3600, seconds // 60 % 60, seconds % 60),
+                        is_active=rng.random() >= args.paused)
+    active = sum(1 for row in db.medicine_reminders.values() if row['is_active'])
+
+    class Recorder:
+        def __init__(self):
+            self.delivered = 0
+            self.lateness = []
+
+        def send(self, reminders):
+            self.delivered += len(reminders)
+            for reminder in reminders:
+                self.lateness.append((clock[0] - datetime.fromisoformat(reminder['fire_at'])).total_seconds())
+
+    recorder = Recorder()
+    # Start on the next whole minute so the simulated day covers every reminder exactly once
+    clock = [datetime.now().replace(second=0, microsecond=0) + timedelta(minutes=1)]
+    end = clock[0] + timedelta(days=1)
+    scheduler = ReminderScheduler(db, recorder, window=args.window, batch_size=args.batch, poll_interval=0,
+                                  clock=lambda: clock[0])
+    reads = {'get_active_reminders_between': 0, 'get_reminders_by_ids': 0, 'get_reminders_changed_since': 0}
+    for name in reads:
+        def counted(*a, _name=name, _fn=getattr(db, name), **kw):
+            reads[_name] += 1
+            return _fn(*a, **kw)
+        setattr(db, name, counted)
+
+    tick_times = []
+    started = time.perf_counter()
+    while clock[0] < end:
+        tick_started = time.perf_counter()
+        scheduler.tick()
+        tick_times.append(time.perf_counter() - tick_started)
+        clock[0] += timedelta(seconds=args.step)
+    # Drain: reminders due after the last step would otherwise wait for a tick past the end. Times are
+    # whole seconds, so a tick just before the day wraps sends them without repeating the first minute
+    clock[0] = end - timedelta(microseconds=1)
+    scheduler.tick()
+    elapsed = time.perf_counter() - started
+    # Still scheduled and due inside the simulated day: lost by the scheduler, not merely pending
+    undelivered = sum(1 for fire_at, _, _ in scheduler._scheduled.values() if fire_at < end)
+
+    tick_times.sort()
+    lateness = sorted(recorder.lateness)
+    stats = scheduler.stats()
+    ticks = len(tick_times)
+    report = {
+        'meta': {'git_commit': _git_commit(), 'reminders': args.reminders, 'active': active, 'seed': args.seed,
+                 'step_s': args.step, 'window_s': args.window},
+        'delivered': recorder.delivered,
+        'undelivered_due': undelivered,
+        'lateness_s': {'p50': percentile(lateness, 50), 'p99': percentile(lateness, 99),
+                       'max': lateness[-1] if lateness else None},
+        'ticks': ticks,
+        'tick_ms': {'p50': round(percentile(tick_times, 50) * 1000, 3),
+                    'p99': round(percentile(tick_times, 99) * 1000, 3),
+                    'max': round(tick_times[-1] * 1000, 3)},
+        'db_reads': reads,
+        'rows_loaded': stats['loaded'],
+        'full_scan_rows': active * 24 * 60,
+        'scheduler': stats,
+        'elapsed_s': round(elapsed, 2)
+    }
+    print(f"{recorder.delivered}/{active} active reminders delivered in a simulated day "
+          f"({ticks} ticks, {elapsed:.1f}s wall); {undelivered} due but unsent, "
+          f"{stats['missed']} missed, {stats['skipped']} skipped")
+    print(f"lateness p50 {report['lateness_s']['p50']}s, p99 {report['lateness_s']['p99']}s; "
+          f"tick p50 {report['tick_ms']['p50']} ms, p99 {report['tick_ms']['p99']} ms")
+    print(f"rows loaded {stats['loaded']} vs {report['full_scan_rows']} for a per-minute full scan; "
+          f"db reads {reads}")
+    save_report(report, args.output, 'reminders')
+    return 0 if recorder.delivered == active else 1
+
+
+def export_records(rows, rng):
+    started = datetime.now() - timedelta(days=rows // 100)
+    analysis = {'conditions': [{'name': 'Common Cold', 'probability': '70%'}], 'severity': 'Low',
+                'recommendations': 'Rest and fluids', 'see_doctor': 'If symptoms last over a week',
+                'home_remedies': 'Warm tea with honey'}
+    for i in range(rows):
+        created_at = (started + timedelta(seconds=i * 864 // 10)).isoformat()
+        if i % 3:
+            yield {'type': 'symptom_check', 'id': i, 'symptoms': f"fever, cough, headache {rng.randrange(1000)}",
+                   'analysis': analysis, 'created_at': created_at}
+        else:
+            yield {'type': 'consultation', 'id': i, 'conversation_id': f"{i:032x}",
+                   'question': "Is it safe to take ibuprofen with paracetamol?",
+                   'response': "Generally yes, for short periods and at the recommended doses. " * 8,
+                   'created_at': created_at}
+
+
+def run_export(args):
+    import tracemalloc
+    from export import export_stream
+
+    report = {'meta': {'git_commit': _git_commit(), 'rows': args.rows, 'small_rows': args.small_rows}, 'formats': {}}
+    print(f"{'format':<12}{'ttfb ms':>9}{'rows/s':>10}{'MB out':>9}"
+          f"{'peak KB @' + str(args.small_rows):>16}{'peak KB @' + str(args.rows):>16}")
+    for fmt, compress in (('ndjson', False), ('ndjson', True), ('csv', False), ('csv', True)):
+        name = fmt + ('+gzip' if compress else '')
+        chunks, _, _ = export_stream(export_records(args.rows, random.Random(args.seed)), fmt, compress)
+        started = time.perf_counter()
+        first = None
+        size = 0
+        for chunk in chunks:
+            if first is None:
+                first = time.perf_counter() - started
+            size += len(chunk)
+        elapsed = time.perf_counter() - started
+
+        peaks = []
+        for rows in (args.small_rows, args.rows):
+            records = export_records(rows, random.Random(args.seed))
+            tracemalloc.start()
+            for _ in export_stream(records, fmt, compress)[0]:
+                pass
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+        report['formats'][name] = {
+            'ttfb_ms': round(first * 1000, 3), 'rows_per_s': round(args.rows / elapsed),
+            'bytes': size, 'peak_bytes_small': peaks[0], 'peak_bytes': peaks[1]
+        }
+        print(f"{name:<12}{first * 1000:>9.2f}{args.rows / elapsed:>10.0f}{size / 1e6:>9.1f}"
+              f"{peaks[0] / 1024:>16.0f}{peaks[1] / 1024:>16.0f}")
+
+    save_report(report, args.output, 'export')
+    return 0
+
+
+def compression_payloads():
+    """{name: (mimetype, [body chunks])} captured from the app with compression switched off"""
+    os.environ.setdefault('MODEL_BACKEND', 'fake')
+    os.environ.setdefault('DB_BACKEND', 'memory')
+    os.environ.setdefault('FLASK_SECRET_KEY', 'benchmark')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ['COMPRESSION_ENABLED'] = '0'
+    os.environ['TRIAGE_ENABLED'] = '0'
+    import app as health_app
+
+    health_app.db.create_tables()
+    client = health_app.app.test_client()
+    email = f"compression-bench-{int(time.time())}@example.com"
+    client.post('/api/register', json={'user_name': 'bench', 'contact_number': '0000000000', 'email': email,
+                                       'password': 'benchmark', 'confirm_password': 'benchmark'})
+    client.post('/api/login', json={'email': email, 'password': 'benchmark'})
+
+    payloads = {}
+    for name, method, path, body in (
+            ('dashboard.html', 'GET', '/dashboard', None),
+            ('contact.html', 'GET', '/contact', None),
+            ('symptoms_check', 'POST', '/api/symptoms/check', {'symptoms': SYMPTOM_POOL[0]}),
+            ('chat', 'POST', '/api/chat', {'question': QUESTION_POOL[0]}),
+            ('dashboard_snapshot', 'GET', '/api/dashboard/snapshot', None),
+            ('chat_stream', 'POST', '/api/chat/stream', {'question': QUESTION_POOL[1]})):
+        response = client.open(path, method=method, json=body, buffered=False)
+        chunks = [chunk for chunk in response.response if chunk]
+        response.close()
+        if response.status_code != 200:
+            print(f"  skipped {name}: HTTP {response.status_code}")
+            continue
+        payloads[name] = (response.mimetype, chunks)
+    return payloads
+
+
+def run_compression(args):
+    from compression import _BrotliEncoder, _GzipEncoder, brotli
+
+    payloads = compression_payloads()
+    settings = [('gzip', level) for level in args.gzip_levels]
+    if brotli is not None:
+        settings += [('br', quality) for quality in args.brotli_qualities]
+    else:
+        print("Brotli not installed, measuring gzip only")
+
+    report = {'meta': {'git_commit': _git_commit(), 'repeat': args.repeat}, 'payloads': {}}
+    print(f"\n{'payload':<20}{'codec':<8}{'bytes':>9}{'out':>8}{'saved':>8}{'us/resp':>10}{'us/KB':>8}")
+    for name, (mimetype, chunks) in payloads.items():
+        size = sum(len(chunk) for chunk in chunks)
+        # Buffered responses are compressed in one call; streams per chunk with a flush after each
+        parts = chunks if mimetype == 'text/event-stream' else [b''.join(chunks)]
+        results = report['payloads'][name] = {'mimetype': mimetype, 'bytes': size, 'chunks': len(parts)}
+        for encoding, level in settings:
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                encoder = _BrotliEncoder(level) if encoding == 'br' else _GzipEncoder(level)
+                out = sum(len(encoder.compress(part) + encoder.flush()) for part in parts)
+                out += len(encoder.finish())
+                timings.append(time.perf_counter() - started)
+            timings.sort()
+            us = percentile(timings, 50) * 1e6
+            results[f"{encoding}-{level}"] = {
+                'bytes': out, 'saved_pct': round((1 - out / size) * 100, 1),
+                'p50_us': round(us, 1), 'us_per_kb': round(us / (size / 1024), 2)
+            }
+            print(f"{name:<20}{encoding + '-' + str(level):<8}{size:>9}{out:>8}{(1 - out / size) * 100:>7.1f}%"
+                  f"{us:>10.1f}{us / (size / 1024):>8.2f}")
+
+    save_report(report, args.output, 'compression')
+    return 0
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return None
+
+
+def print_report(report):
+    print(f"\n{'endpoint':<12}{'reqs':>8}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    rows = list(report['endpoints'].items()) + [('TOTAL', report['total'])]
+    for name, r in rows:
+        print(f"{name:<12}{r['requests']:>8}{r['errors']:>8}{r['throughput_rps']:>10}"
+              f"{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}")
+
+
+def save_report(report, output, name='load'):
+    if output == '-':
+        return
+    if not output:
+        os.makedirs('bench_results', exist_ok=True)
+        output = os.path.join('bench_results', f"{name}-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults saved to {output}")
+
+
+def compare_reports(report, baseline_path, max_regression):
+    """Print p95/throughput deltas against a saved run; non-zero exit on regression"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} ({baseline['meta'].get('git_commit')}):")
+    regressed = False
+    names = list(report['endpoints']) + ['TOTAL']
+    for name in names:
+        current = report['total'] if name == 'TOTAL' else report['endpoints'][name]
+        before = baseline['total'] if name == 'TOTAL' else baseline['endpoints'].get(name)
+        if not before or not before['p95_ms']:
+            continue
+        p95_delta = (current['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100
+        rps_delta = ((current['throughput_rps'] - before['throughput_rps']) / before['throughput_rps'] * 100
+                     if before['throughput_rps'] else 0.0)
+        flag = ''
+        if p95_delta > max_regression:
+            flag = '  REGRESSION'
+            regressed = True
+        print(f"  {name:<12} p95 {p95_delta:+7.1f}%   throughput {rps_delta:+7.1f}%{flag}")
+    return 1 if regressed else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    load = commands.add_parser('load', help="drive the API endpoints at a given concurrency")
+    load.add_argument('--url', help="benchmark an already running server instead of starting app.py in-process")
+    load.add_argument('--concurrency', type=int, default=20)
+    load.add_argument('--duration', type=float, default=20, help="measured seconds")
+    load.add_argument('--warmup', type=float, default=2, help="seconds excluded from the results")
+    load.add_argument('--mix', default=DEFAULT_MIX, help=f"endpoint weights (default {DEFAULT_MIX})")
+    load.add_argument('--distinct-prompts', type=int, default=20,
+                      help="size of the symptom/question pool; smaller means more cache hits")
+    load.add_argument('--backend', default='fake', help="MODEL_BACKEND for the in-process app")
+    load.add_argument('--db', default='memory', help="DB_BACKEND for the in-process app")
+    load.add_argument('--llm-latency-ms', type=float, default=800)
+    load.add_argument('--llm-latency-sigma', type=float, default=0.5)
+    load.add_argument('--llm-error-rate', type=float, default=0.0)
+    load.add_argument('--db-latency-ms', type=float, default=1.0)
+    load.add_argument('--seed', type=int, default=1234)
+    load.add_argument('--output', help="result file (default bench_results/load-<time>.json, '-' to skip)")
+    load.add_argument('--compare', help="baseline result file to compare against")
+    load.add_argument('--max-regression', type=float, default=10.0,
+                      help="allowed p95 increase in percent before --compare fails")
+    load.set_defaults(func=run_load)
+
+    startup = commands.add_parser('startup', help="measure cold-start import, create_app() and first request")
+    startup.add_argument('--runs', type=int, default=5, help="fresh interpreters to start")
+    startup.add_argument('--budget-ms', type=float, default=float(os.getenv('STARTUP_BUDGET_MS', '1000')),
+                         help="fail when the median import of app.py is slower (0 disables)")
+    startup.add_argument('--top', type=int, default=10, help="slowest imports to list")
+    startup.add_argument('--backend', default='fake', help="MODEL_BACKEND for the probe")
+    startup.add_argument('--db', default='memory', help="DB_BACKEND for the probe")
+    startup.add_argument('--output', help="result file (default bench_results/startup-<time>.json, '-' to skip)")
+    startup.set_defaults(func=run_startup)
+
+    history = commands.add_parser('history', help="time keyset history pages at increasing depths")
+    history.add_argument('--db', default='memory', help="DB_BACKEND to benchmark (memory or mysql)")
+    history.add_argument('--table', choices=('symptoms', 'consultations'), default='symptoms')
+    history.add_argument('--rows', type=int, default=100000, help="rows to seed for a new benchmark user")
+    history.add_argument('--user-id', type=int, help="reuse an already seeded user instead of seeding")
+    history.add_argument('--page-size', type=int, default=20)
+    history.add_argument('--repeat', type=int, default=50, help="timed fetches per depth")
+    history.add_argument('--output', help="result file (default bench_results/history-<time>.json, '-' to skip)")
+    history.set_defaults(func=run_history)
+
+    logging_ = commands.add_parser('logging', help="per-call cost of print vs synchronous vs queued logging")
+    logging_.add_argument('--threads', type=int, default=8, help="concurrent request threads")
+    logging_.add_argument('--requests', type=int, default=5000, help="log lines per thread")
+    logging_.add_argument('--sink', default=os.devnull, help="file the log lines are written to")
+    logging_.add_argument('--output', help="result file (default bench_results/logging-<time>.json, '-' to skip)")
+    logging_.set_defaults(func=run_logging)
+
+    resilience = commands.add_parser('resilience', help="outage drill for deadlines, retries, breaker and hedging")
+    resilience.add_argument('--concurrency', type=int, default=8)
+    resilience.add_argument('--phase-seconds', type=float, default=10, help="length of each phase")
+    resilience.add_argument('--llm-latency-ms', type=float, default=300)
+    resilience.add_argument('--llm-latency-sigma', type=float, default=0.8)
+    resilience.add_argument('--error-rate', type=float, default=0.05, help="error rate outside the outage")
+    resilience.add_argument('--outage-slowdown', type=float, default=5.0, help="latency multiplier during the outage")
+    resilience.add_argument('--timeout', type=float, default=5.0, help="per-call deadline")
+    resilience.add_argument('--max-retries', type=int, default=2)
+    resilience.add_argument('--min-attempt', type=float, default=0.5, help="seconds a retry needs left to be tried")
+    resilience.add_argument('--hedge-after', type=float, help="also run with hedging after this many seconds")
+    resilience.add_argument('--breaker-min-calls', type=int, default=10)
+    resilience.add_argument('--breaker-open-seconds', type=float, default=3.0)
+    resilience.add_argument('--seed', type=int, default=1234)
+    resilience.add_argument('--output', help="result file (default bench_results/resilience-<time>.json, '-' to skip)")
+    resilience.set_defaults(func=run_resilience)
+
+    triage = commands.add_parser('triage', help="throughput and diversion rate of the local symptom triage")
+    triage.add_argument('--samples', type=int, default=20000, help="synthetic descriptions to generate")
+    triage.add_argument('--input', help="file of real symptom descriptions, one per line, instead")
+    triage.add_argument('--batch', type=int, default=256, help="descriptions per vectorised call")
+    triage.add_argument('--thresholds', default='0.6,0.7,0.75,0.8,0.9', help="confidence thresholds to compare")
+    triage.add_argument('--seed', type=int, default=1234)
+    triage.add_argument('--output', help="result file (default bench_results/triage-<time>.json, '-' to skip)")
+    triage.set_defaults(func=run_triage)
+
+    reminders = commands.add_parser('reminders', help="replay a day of the reminder scheduler on a simulated clock")
+    reminders.add_argument('--reminders', type=int, default=100000, help="reminders to seed")
+    reminders.add_argument('--paused', type=float, default=0.1, help="fraction of seeded reminders that are inactive")
+    reminders.add_argument('--step', type=int, default=5, help="simulated seconds between ticks")
+    reminders.add_argument('--window', type=int, default=300, help="scheduler load window in seconds")
+    reminders.add_argument('--batch', type=int, default=500, help="reminders per notifier call")
+    reminders.add_argument('--seed', type=int, default=1234)
+    reminders.add_argument('--output', help="result file (default bench_results/reminders-<time>.json, '-' to skip)")
+    reminders.set_defaults(func=run_reminders)
+
+    export = commands.add_parser('export', help="throughput and memory of the streaming history export")
+    export.add_argument('--rows', type=int, default=200000, help="records to export")
+    export.add_argument('--small-rows', type=int, default=10000, help="smaller run to compare peak memory against")
+    export.add_argument('--seed', type=int, default=1234)
+    export.add_argument('--output', help="result file (default bench_results/export-<time>.json, '-' to skip)")
+    export.set_defaults(func=run_export)
+
+    compression = commands.add_parser('compression', help="CPU cost vs bytes saved of response compression")
+    compression.add_argument('--repeat', type=int, default=100, help="compressions per payload and setting")
+    compression.add_argument('--gzip-levels', type=int, nargs='+', default=[1, 6, 9])
+    compression.add_argument('--brotli-qualities', type=int, nargs='+', default=[1, 4, 11])
+    compression.add_argument('--output', help="result file (default bench_results/compression-<time>.json, '-' to skip)")
+    compression.set_defaults(func=run_compression)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,170 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+log = logging.getLogger(__name__)
+
+
+# Phrases are split on commas, semicolons, slashes, newlines, '&' and the word 'and'
+_PHRASE_SPLIT = re.compile(r"[,;/\n&]+|\band\b")
+_NON_WORD = re.compile(r"[^a-z0-9\s]+")
+
+
+def normalize_symptoms(symptoms):
+    """Canonical form of a symptom string: lowercase, de-duplicated, order-independent.
+
+    "Fever, headache and cough" and "cough, FEVER, headache, fever" both become
+    "cough|fever|headache".
+    """
+    phrases = set()
+    for phrase in _PHRASE_SPLIT.split(symptoms.lower()):
+        words = _NON_WORD.sub(' ', phrase).split()
+        if words:
+            phrases.add(' '.join(words))
+    return '|'.join(sorted(phrases))
+
+
+def cache_key(normalized, version):
+    """Content address for a normalized input under a given prompt template version"""
+    return hashlib.sha256(f"{version}\x00{normalized}".encode()).hexdigest()
+
+
+class SQLiteTier:
+    """Shared on-disk tier so every gunicorn worker on the host sees the same entries"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS analysis_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute(
+            "SELECT value, expires_at FROM analysis_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None, None
+        value, expires_at = row
+        if expires_at <= time.time():
+            return None, None
+        return json.loads(value), expires_at
+
+    def set(self, key, value, expires_at):
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO analysis_cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value), expires_at)
+        )
+        conn.commit()
+
+    def purge_expired(self):
+        conn = self._conn()
+        deleted = conn.execute(
+            "DELETE FROM analysis_cache WHERE expires_at <= ?", (time.time(),)
+        ).rowcount
+        conn.commit()
+        return deleted
+
+
+class AnalysisCache:
+    """Two-tier TTL cache: in-process LRU in front of an optional SQLite file.
+
+    Values must be JSON-serializable. Lookups that miss the LRU but hit the
+    shared tier are promoted into the LRU.
+    """
+
+    def __init__(self, max_entries=1024, ttl=24 * 3600, sqlite_path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self.shared = SQLiteTier(sqlite_path) if sqlite_path else None
+        self.memory_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._lru.move_to_end(key)
+                    self.memory_hits += 1
+                    return value
+                del self._lru[key]
+
+        if self.shared is not None:
+            try:
+                value, expires_at = self.shared.get(key)
+            except sqlite3.Error as e:
+                log.warning("analysis cache read failed: %s", e)
+                value = None
+            if value is not None:
+                with self._lock:
+                    self._store(key, value, expires_at)
+                    self.shared_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, value):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._store(key, value, expires_at)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, value, expires_at)
+            except sqlite3.Error as e:
+                log.warning("analysis cache write failed: %s", e)
+
+    def _store(self, key, value, expires_at):
+        self._lru[key] = (value, expires_at)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+
+    def stats(self):
+        with self._lock:
+            hits = self.memory_hits + self.shared_hits
+            lookups = hits + self.misses
+            return {
+                'entries': len(self._lru),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'shared_tier': self.shared.path if self.shared else None,
+                'memory_hits': self.memory_hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'hit_ratio': round(hits / lookups, 4) if lookups else 0.0
+            }
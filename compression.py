@@ -0,0 +1,196 @@
+import logging
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+log = logging.getLogger(__name__)
+
+# Text types worth compressing; images, PDFs and gzip exports are already compressed
+DEFAULT_MIMETYPES = (
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript', 'text/event-stream',
+    'application/json', 'application/javascript', 'application/x-ndjson', 'application/xml', 'image/svg+xml'
+)
+
+
+class _GzipEncoder:
+    def __init__(self, level):
+        self._zlib = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._zlib.compress(data)
+
+    def flush(self):
+        return self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._zlib.flush()
+
+
+class _BrotliEncoder:
+    def __init__(self, quality):
+        self._brotli = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._brotli.process(data)
+
+    def flush(self):
+        return self._brotli.flush()
+
+    def finish(self):
+        return self._brotli.finish()
+
+
+def compress(data, encoding, level):
+    """data compressed with 'gzip' or 'br' in one go"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    encoder = _GzipEncoder(level)
+    return encoder.compress(data) + encoder.finish()
+
+
+class Compressor:
+    """gzip/brotli Content-Encoding for text responses, negotiated via Accept-Encoding.
+
+    Buffered bodies smaller than ``min_size`` are left alone. Streamed
+    bodies (SSE, NDJSON) are compressed chunk by chunk with a sync flush
+    after each one, so an event reaches the client as soon as the view
+    yields it. Compressed bodies of responses with a strong ETag are kept
+    in a small LRU keyed on that ETag, so cached pages and dashboard
+    snapshots are only compressed once. A compressed response's ETag is
+    made weak, which keeps If-None-Match revalidation working. brotli is
+    offered only when the module is installed.
+    """
+
+    def __init__(self, app, min_size=500, gzip_level=6, brotli_quality=4, mimetypes=DEFAULT_MIMETYPES,
+                 encodings=('br', 'gzip'), cache_entries=256):
+        self.min_size = min_size
+        self.levels = {'gzip': gzip_level, 'br': brotli_quality}
+        self.mimetypes = frozenset(m.strip() for m in mimetypes)
+        encodings = [e.strip() for e in encodings]
+        self.encodings = [e for e in encodings if e == 'gzip' or (e == 'br' and brotli is not None)]
+        self.cache_entries = cache_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.compressed = dict.fromkeys(self.encodings, 0)
+        self.streamed = 0
+        self.skipped_small = 0
+        self.cache_hits = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.seconds = 0.0
+        # Logged on the first response rather than here: a log call at import time would start
+        # the background log thread in a --preload master (see logging_setup.py)
+        self._warn_brotli = 'br' in encodings and brotli is None
+        app.after_request(self.after_request)
+
+    def _encoding(self, response):
+        if (not self.encodings or request.method == 'HEAD' or response.status_code < 200
+                or response.status_code in (204, 206, 304) or response.direct_passthrough
+                or 'Content-Encoding' in response.headers or response.mimetype not in self.mimetypes
+                or 'no-transform' in response.headers.get('Cache-Control', '')):
+            return None
+        response.vary.add('Accept-Encoding')
+        return request.accept_encodings.best_match(self.encodings)
+
+    def after_request(self, response):
+        if self._warn_brotli:
+            self._warn_brotli = False
+            log.info("brotli not installed, compressing with gzip only")
+        encoding = self._encoding(response)
+        if encoding is None:
+            return response
+        level = self.levels[encoding]
+
+        if response.is_streamed:
+            response.response = self._stream(response.response, encoding, level)
+            response.headers.pop('Content-Length', None)
+            with self._lock:
+                self.streamed += 1
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                with self._lock:
+                    self.skipped_small += 1
+                return response
+            etag, weak = response.get_etag()
+            key = (etag, encoding, level) if etag and not weak else None
+            with self._lock:
+                body = self._cache.get(key) if key else None
+                if body is not None:
+                    self._cache.move_to_end(key)
+                    self.cache_hits += 1
+            if body is None:
+                started = time.perf_counter()
+                body = compress(data, encoding, level)
+                elapsed = time.perf_counter() - started
+                with self._lock:
+                    self.seconds += elapsed
+                    self.compressed[encoding] += 1
+                    self.bytes_in += len(data)
+                    self.bytes_out += len(body)
+                    if key:
+                        self._cache[key] = body
+                        while len(self._cache) > self.cache_entries:
+                            self._cache.popitem(last=False)
+            if len(body) >= len(data):
+                return response
+            response.set_data(body)
+
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    def _stream(self, chunks, encoding, level):
+        encoder = _BrotliEncoder(level) if encoding == 'br' else _GzipEncoder(level)
+        size_in = size_out = 0
+        elapsed = 0.0
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                if not chunk:
+                    continue
+                started = time.perf_counter()
+                data = encoder.compress(chunk) + encoder.flush()
+                elapsed += time.perf_counter() - started
+                size_in += len(chunk)
+                size_out += len(data)
+                yield data
+            data = encoder.finish()
+            size_out += len(data)
+            yield data
+        finally:
+            # The wrapped generator may hold a DB connection or an export slot
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+            with self._lock:
+                self.compressed[encoding] += 1
+                self.bytes_in += size_in
+                self.bytes_out += size_out
+                self.seconds += elapsed
+
+    def stats(self):
+        with self._lock:
+            return {
+                **{f'compressed_{encoding}': count for encoding, count in self.compressed.items()},
+                'streamed': self.streamed,
+                'skipped_small': self.skipped_small,
+                'cache_hits': self.cache_hits,
+                'cache_entries': len(self._cache),
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'ratio': round(self.bytes_out / self.bytes_in, 4) if self.bytes_in else 0.0,
+                'cpu_seconds': round(self.seconds, 4)
+            }
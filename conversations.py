@@ -0,0 +1,174 @@
+import re
+import threading
+import uuid
+from collections import OrderedDict, deque
+
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def _first_sentence(text, limit):
+    text = ' '.join(text.split())
+    sentence = _SENTENCE_END.split(text, 1)[0]
+    if len(sentence) > limit:
+        sentence = sentence[:limit].rsplit(' ', 1)[0] + '...'
+    return sentence
+
+
+def summarize_turn(question, answer, limit=160):
+    """Extractive one-line summary of a question/answer pair (no model call)"""
+    return f"Q: {_first_sentence(question, limit)} A: {_first_sentence(answer, limit)}"
+
+
+class Conversation:
+    def __init__(self, conversation_id, user_id):
+        self.id = conversation_id
+        self.user_id = user_id
+        self.turns = deque()
+        self.summary = []
+        self.lock = threading.Lock()
+        # Highest ai_consultations id reflected in the window, and turns recorded here that
+        # the database has not shown back yet (write-behind)
+        self.last_id = 0
+        self.unconfirmed = deque()
+
+
+class ConversationStore:
+    """Recent chat turns per (user, conversation) in a bounded LRU backed by ai_consultations.
+
+    The prompt history sent to the model is capped. It holds at most
+    ``window_turns`` recent turns and ``max_history_chars`` characters of
+    them. Older turns are folded into a short local summary of at most
+    ``max_summary_chars`` characters. Prompt size therefore stays flat
+    however long the conversation grows.
+
+    Another gunicorn worker may answer turns of the same conversation, so a
+    cached window is checked against the database before each use. It reads
+    the rows newer than the last id the window reflects. Rows this worker
+    recorded itself are confirmed. Any other row means the window is stale,
+    and it is rebuilt from the database, keeping this worker's own turns
+    that have not been written yet. Turns another worker still holds in
+    its write-behind queue (up to HISTORY_FLUSH_INTERVAL) cannot be seen.
+    """
+
+    def __init__(self, db, max_conversations=2000, window_turns=6,
+                 max_history_chars=6000, max_summary_chars=1200):
+        self.db = db
+        self.max_conversations = max_conversations
+        self.window_turns = window_turns
+        self.max_history_chars = max_history_chars
+        self.max_summary_chars = max_summary_chars
+        self._conversations = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+        self.refreshes = 0
+
+    @staticmethod
+    def new_id():
+        return uuid.uuid4().hex
+
+    @staticmethod
+    def valid_id(conversation_id):
+        return isinstance(conversation_id, str) and re.fullmatch(r"[0-9a-f]{32}", conversation_id) is not None
+
+    def get(self, user_id, conversation_id, load=True):
+        """Conversation with an up-to-date window; earlier turns are loaded from the database if load is set"""
+        key = (user_id, conversation_id)
+        with self._lock:
+            cached = self._conversations.get(key)
+            if cached is not None:
+                self._conversations.move_to_end(key)
+        if cached is not None:
+            if not load or self._current(cached):
+                with self._lock:
+                    self.hits += 1
+                return cached
+            with self._lock:
+                self.refreshes += 1
+                if self._conversations.get(key) is cached:
+                    del self._conversations[key]
+
+        conversation = Conversation(conversation_id, user_id)
+        if load:
+            rows = self.db.get_conversation_turns(user_id, conversation_id, limit=self.window_turns * 3)
+            for _, question, answer in rows:
+                self._append(conversation, question, answer)
+            if rows:
+                conversation.last_id = rows[-1][0]
+        if cached is not None:
+            # This worker's turns still in the write-behind queue
+            with cached.lock:
+                for question, answer in cached.unconfirmed:
+                    self._append(conversation, question, answer)
+                    conversation.unconfirmed.append((question, answer))
+
+        with self._lock:
+            self.loads += 1
+            existing = self._conversations.get(key)
+            if existing is not None:
+                return existing
+            self._conversations[key] = conversation
+            while len(self._conversations) > self.max_conversations:
+                self._conversations.popitem(last=False)
+        return conversation
+
+    def _current(self, conversation):
+        """True if every row written since the window was built is a turn recorded by this worker"""
+        rows = self.db.get_conversation_turns(conversation.user_id, conversation.id,
+                                              limit=self.window_turns * 3, after_id=conversation.last_id)
+        with conversation.lock:
+            for row_id, question, answer in rows:
+                if not conversation.unconfirmed or conversation.unconfirmed[0] != (question, answer):
+                    return False
+                conversation.unconfirmed.popleft()
+                conversation.last_id = row_id
+        return True
+
+    def _append(self, conversation, question, answer):
+        conversation.turns.append((question, answer))
+        while len(conversation.turns) > self.window_turns or (
+            len(conversation.turns) > 1 and self._history_chars(conversation) > self.max_history_chars
+        ):
+            old_question, old_answer = conversation.turns.popleft()
+            conversation.summary.append(summarize_turn(old_question, old_answer))
+        while conversation.summary and sum(len(s) for s in conversation.summary) > self.max_summary_chars:
+            conversation.summary.pop(0)
+
+    @staticmethod
+    def _history_chars(conversation):
+        return sum(len(q) + len(a) for q, a in conversation.turns)
+
+    def record(self, conversation, question, answer):
+        with conversation.lock:
+            self._append(conversation, question, answer)
+            conversation.unconfirmed.append((question, answer))
+            while len(conversation.unconfirmed) > self.window_turns * 3:
+                # Writes that never landed (dropped by the writer) are no longer expected
+                conversation.unconfirmed.popleft()
+
+    def history(self, conversation):
+        """Gemini chat history: the summary of older turns followed by the recent window"""
+        with conversation.lock:
+            history = []
+            if conversation.summary:
+                history.append({
+                    'role': 'user',
+                    'parts': ["Summary of our earlier conversation:\n" + '\n'.join(conversation.summary)]
+                })
+                history.append({'role': 'model', 'parts': ["Thank you, I will keep that in mind."]})
+            for question, answer in conversation.turns:
+                history.append({'role': 'user', 'parts': [question]})
+                history.append({'role': 'model', 'parts': [answer]})
+            return history
+
+    def stats(self):
+        with self._lock:
+            return {
+                'conversations': len(self._conversations),
+                'max_conversations': self.max_conversations,
+                'window_turns': self.window_turns,
+                'hits': self.hits,
+                'loads': self.loads,
+                'refreshes': self.refreshes
+            }
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+log = logging.getLogger(__name__)
+
+
+class UserVersions:
+    """Per-user change counters held in this process.
+
+    Versions carry a random per-process prefix, so a version (or an ETag
+    built from it) issued by one worker never matches another worker's.
+    """
+
+    def __init__(self):
+        self._versions = {}
+        self._epoch = uuid.uuid4().hex[:8]
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            self._versions, self._epoch, self._pid = {}, uuid.uuid4().hex[:8], os.getpid()
+
+    def get(self, user_id):
+        with self._lock:
+            self._check_fork()
+            return f"{self._epoch}.{self._versions.get(user_id, 0)}"
+
+    def bump(self, user_ids):
+        with self._lock:
+            self._check_fork()
+            for user_id in user_ids:
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
+
+
+class SQLiteUserVersions:
+    """Per-user change counters in a SQLite file shared by every gunicorn worker on the host.
+
+    The file is opened on first use in each thread, never at construction.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS user_versions (
+                    user_id INTEGER PRIMARY KEY,
+                    version INTEGER NOT NULL
+                )
+            """)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, user_id):
+        row = self._conn().execute("SELECT version FROM user_versions WHERE user_id = ?", (user_id,)).fetchone()
+        return str(row[0] if row else 0)
+
+    def bump(self, user_ids):
+        self._conn().executemany("""
+            INSERT INTO user_versions (user_id, version) VALUES (?, 1)
+            ON CONFLICT(user_id) DO UPDATE SET version = version + 1
+        """, [(user_id,) for user_id in user_ids])
+
+
+class DashboardCache:
+    """Serialized dashboard snapshots per user, keyed on the user's data version.
+
+    ``build(user_id)`` returns the snapshot as a JSON-serializable dict. It
+    is serialized once and kept, along with an ETag made of the version and
+    a digest of the body, until invalidate() bumps the user's version. Call
+    invalidate() after every write that changes what the dashboard shows.
+    The version is read before building, so a write that lands mid-build
+    makes the entry stale at once instead of hiding the write. Entries
+    also expire after ``ttl`` seconds, which bounds staleness from writes
+    that skip invalidate() (other hosts, manual SQL, `flask rebuild-stats`).
+    """
+
+    def __init__(self, build, versions=None, max_entries=10000, ttl=300):
+        self.build = build
+        self.versions = versions or UserVersions()
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.builds = 0
+        self.invalidations = 0
+        self.version_errors = 0
+
+    def get(self, user_id):
+        """(body bytes, etag) for user_id; etag is None when the version store failed"""
+        try:
+            version = self.versions.get(user_id)
+        except sqlite3.Error as e:
+            log.warning("dashboard version read failed: %s", e)
+            with self._lock:
+                self.version_errors += 1
+            version = None
+
+        now = time.monotonic()
+        if version is not None:
+            with self._lock:
+                entry = self._entries.get(user_id)
+                if entry is not None and entry[0] == version and entry[3] > now:
+                    self._entries.move_to_end(user_id)
+                    self.hits += 1
+                    return entry[1], entry[2]
+
+        body = json.dumps(self.build(user_id), separators=(',', ':'), default=str).encode('utf-8')
+        with self._lock:
+            self.builds += 1
+            if version is None:
+                return body, None
+            etag = f"{version}-{hashlib.sha256(body).hexdigest()[:16]}"
+            self._entries[user_id] = (version, body, etag, now + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return body, etag
+
+    def invalidate(self, user_ids):
+        """Mark the dashboards of user_ids stale (safe to call from background threads)"""
+        user_ids = set(user_ids)
+        if not user_ids:
+            return
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+            self.invalidations += len(user_ids)
+        try:
+            self.versions.bump(user_ids)
+        except sqlite3.Error as e:
+            # This worker already dropped its entries; others catch up within ttl
+            log.warning("dashboard version bump failed: %s", e)
+            with self._lock:
+                self.version_errors += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.builds
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'builds': self.builds,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'invalidations': self.invalidations,
+                'version_errors': self.version_errors
+            }
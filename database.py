@@ -2,31 +2,245 @@ import mysql.connector
 from mysql.connector import Error
 import hashlib
 import json
+import logging
 import os
+import queue
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, time as dtime, timedelta
 from dotenv import load_dotenv
 
 load_dotenv()
 
+log = logging.getLogger(__name__)
+
+
+class PoolTimeout(Error):
+    """Raised when no pooled connection becomes free within the borrow timeout"""
+
+
+class PooledConnection:
+    """Thin proxy around a MySQL connection; close() hands it back to the pool"""
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+        self.checked_out_at = time.monotonic()
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def close(self):
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool.release(raw)
+
+    def discard(self):
+        """Close the connection instead of returning it, e.g. with an abandoned unbuffered result"""
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool.discard(raw)
+
+
+class ConnectionPool:
+    """Bounded pool of MySQL connections owned by a single process.
+
+    Connections are created lazily up to ``size``. Borrowers wait at most
+    ``timeout`` seconds for a free one. Connections idle for longer than
+    ``ping_interval`` are pinged (and reconnected if stale) on checkout.
+    """
+
+    def __init__(self, size=5, timeout=5.0, ping_interval=30.0, **connect_args):
+        self.size = size
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self.connect_args = connect_args
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._reconnects = 0
+        self._timeouts = 0
+
+    def _connect(self):
+        return mysql.connector.connect(**self.connect_args)
+
+    def acquire(self):
+        started = time.monotonic()
+        raw = None
+        last_used = None
+        try:
+            raw, last_used = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    raw = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                try:
+                    raw, last_used = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._waits += 1
+                        self._timeouts += 1
+                        self._wait_time += time.monotonic() - started
+                    raise PoolTimeout(
+                        msg=f"No database connection available after {self.timeout}s"
+                    )
+                with self._lock:
+                    self._waits += 1
+                    self._wait_time += time.monotonic() - started
+
+        if last_used is not None and time.monotonic() - last_used >= self.ping_interval:
+            raw = self._revalidate(raw)
+
+        with self._lock:
+            self._in_use += 1
+        return PooledConnection(self, raw)
+
+    def _revalidate(self, raw):
+        """Ping an idle connection, reconnecting it if the server dropped it"""
+        try:
+            if raw.is_connected():
+                return raw
+        except Error:
+            pass
+        with self._lock:
+            self._reconnects += 1
+        try:
+            raw.reconnect(attempts=1, delay=0)
+            return raw
+        except Error:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def release(self, raw):
+        with self._lock:
+            self._in_use -= 1
+        try:
+            # Discard any open transaction so the next borrower starts clean
+            if raw.in_transaction:
+                raw.rollback()
+        except Error:
+            with self._lock:
+                self._created -= 1
+            try:
+                raw.close()
+            except Error:
+                pass
+            return
+        self._idle.put((raw, time.monotonic()))
+
+    def discard(self, raw):
+        with self._lock:
+            self._in_use -= 1
+            self._created -= 1
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def close_all(self):
+        while True:
+            try:
+                raw, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._created -= 1
+            try:
+                raw.close()
+            except Error:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'created': self._created,
+                'in_use': self._in_use,
+                'idle': self._idle.qsize(),
+                'waits': self._waits,
+                'wait_time_seconds': round(self._wait_time, 6),
+                'timeouts': self._timeouts,
+                'reconnects': self._reconnects
+            }
+
+
+def create_database(backend=None):
+    """Database selected by DB_BACKEND: 'mysql' (default) or 'memory' for offline runs"""
+    backend = backend or os.getenv('DB_BACKEND', 'mysql')
+    if backend == 'memory':
+        from memory_db import MemoryDatabase
+        return MemoryDatabase()
+    if backend != 'mysql':
+        raise ValueError(f"Unknown DB_BACKEND: {backend}")
+    return Database()
+
+
 class Database:
     def __init__(self):
         self.host = os.getenv('DB_HOST', 'localhost')
         self.user = os.getenv('DB_USER', 'root')
         self.password = os.getenv('DB_PASSWORD', 'kalpesh2005?')
         self.database = os.getenv('DB_NAME', 'ai_health_advisor')
+        self.pool_size = int(os.getenv('DB_POOL_SIZE', '5'))
+        self.pool_timeout = float(os.getenv('DB_POOL_TIMEOUT', '5'))
+        self.pool_ping_interval = float(os.getenv('DB_POOL_PING_INTERVAL', '30'))
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+
+    @property
+    def pool(self):
+        """Per-process pool; a forked gunicorn worker builds its own on first use"""
+        pid = os.getpid()
+        if self._pool is None or self._pool_pid != pid:
+            with self._pool_lock:
+                if self._pool is None or self._pool_pid != pid:
+                    self._pool = ConnectionPool(
+                        size=self.pool_size,
+                        timeout=self.pool_timeout,
+                        ping_interval=self.pool_ping_interval,
+                        host=self.host,
+                        user=self.user,
+                        password=self.password,
+                        database=self.database
+                    )
+                    self._pool_pid = pid
+        return self._pool
 
     def get_connection(self):
         try:
-            connection = mysql.connector.connect(
-                host=self.host,
-                user=self.user,
-                password=self.password,
-                database=self.database
-            )
-            return connection
+            return self.pool.acquire()
         except Error as e:
-            print("DATABASE CONNECTION ERROR:", e)
+            log.error("database connection failed: %s", e)
             return None
 
+    @contextmanager
+    def connection(self):
+        """Borrow a pooled connection; it is always returned on exit"""
+        conn = self.pool.acquire()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def pool_stats(self):
+        return self.pool.stats()
+
     # --------------------------
     # Create users table
     # --------------------------
@@ -49,64 +263,42 @@ class Database:
             conn.commit()
             cursor.close()
             conn.close()
-            print("Tables created successfully.")
+            log.info("tables created")
         except Error as e:
-            print("TABLE CREATION ERROR:", e)
+            log.error("table creation failed: %s", e)
 
     # --------------------------
     # Register User - FIXED INDENTATION
     # --------------------------
     def register_user(self, user_name, contact_number, email, password):
-        print(f"\n=== DATABASE REGISTRATION ATTEMPT ===")
-        print(f"Username: {user_name}")
-        print(f"Contact: {contact_number}")
-        print(f"Email: {email}")
-        print(f"Password length: {len(password)}")
-        
         try:
-            conn = self.get_connection()
-            if conn is None:
-                print("ERROR: Database connection is None")
-                return {"success": False, "message": "Database connection failed"}
+            with self.connection() as conn:
+                cursor = conn.cursor()
 
-            print("✓ Database connection established")
-            
-            cursor = conn.cursor()
+                # Check if email already registered
+                cursor.execute("SELECT id FROM users WHERE email=%s", (email,))
+                existing = cursor.fetchone()
 
-            # Check if email already registered
-            print(f"Checking if email '{email}' exists...")
-            cursor.execute("SELECT id FROM users WHERE email=%s", (email,))
-            existing = cursor.fetchone()
+                if existing:
+                    cursor.close()
+                    return {"success": False, "message": "Email already registered"}
 
-            if existing:
-                print(f"✗ Email '{email}' already exists in database")
-                cursor.close()
-                conn.close()
-                return {"success": False, "message": "Email already registered"}
+                # Hash password
+                password_hash = hashlib.sha256(password.encode()).hexdigest()
 
-            print("✓ Email is not registered yet")
+                # Insert user
+                query = """
+                    INSERT INTO users (user_name, contact_number, email, password_hash)
+                    VALUES (%s, %s, %s, %s)
+                """
 
-            # Hash password
-            password_hash = hashlib.sha256(password.encode()).hexdigest()
-            print(f"Password hash: {password_hash[:20]}...")
+                cursor.execute(query, (user_name, contact_number, email, password_hash))
+                conn.commit()
 
-            # Insert user
-            query = """
-                INSERT INTO users (user_name, contact_number, email, password_hash)
-                VALUES (%s, %s, %s, %s)
-            """
-            
-            print("Executing insert query...")
-            cursor.execute(query, (user_name, contact_number, email, password_hash))
-            conn.commit()
-            
-            # Get the inserted user ID
-            user_id = cursor.lastrowid
-            print(f"✓ User inserted successfully! User ID: {user_id}")
+                # Get the inserted user ID
+                user_id = cursor.lastrowid
 
-            cursor.close()
-            conn.close()
-            print("✓ Database connection closed")
+                cursor.close()
 
             return {
                 "success": True, 
@@ -114,10 +306,11 @@ class Database:
                 "user_id": user_id
             }
 
+        except PoolTimeout as e:
+            log.warning("registration pool timeout: %s", e)
+            return {"success": False, "message": "Database is busy, please try again"}
         except mysql.connector.Error as e:
-            print(f"\n✗ MySQL ERROR: {e}")
-            print(f"Error code: {e.errno}")
-            print(f"SQL State: {e.sqlstate}")
+            log.error("registration MySQL error: %s", e, extra={'errno': e.errno, 'sqlstate': e.sqlstate})
             
             # More specific error messages
             if e.errno == 1062:  # Duplicate entry error code
@@ -131,9 +324,7 @@ class Database:
             else:
                 return {"success": False, "message": f"Database error: {e}"}
         except Exception as e:
-            print(f"\n✗ UNEXPECTED ERROR: {e}")
-            import traceback
-            traceback.print_exc()
+            log.exception("registration failed")
             return {"success": False, "message": "Registration failed due to system error"}
 
     # --------------------------
@@ -141,25 +332,30 @@ class Database:
     # --------------------------
     def check_login(self, email, password):
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor(dictionary=True)
-
             password_hash = hashlib.sha256(password.encode()).hexdigest()
 
-            cursor.execute("""
-                SELECT * FROM users WHERE email=%s AND password_hash=%s
-            """, (email, password_hash))
-
-            user = cursor.fetchone()
-
-            cursor.close()
-            conn.close()
+            with self.connection() as conn:
+                cursor = conn.cursor(dictionary=True)
+                cursor.execute("""
+                    SELECT * FROM users WHERE email=%s AND password_hash=%s
+                """, (email, password_hash))
+                user = cursor.fetchone()
+                cursor.close()
 
             return user
 
         except Error as e:
-            print("LOGIN ERROR:", e)
+            log.error("login query failed: %s", e)
             return None
+
+    def get_users(self):
+        """Every user row (for /debug/database)"""
+        with self.connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute("SELECT * FROM users")
+            users = cursor.fetchall()
+            cursor.close()
+        return users
         
 
     def create_tables(self):
@@ -189,21 +385,40 @@ class Database:
                     symptoms TEXT NOT NULL,
                     analysis_result TEXT,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    INDEX idx_symptoms_user_created (user_id, created_at, id),
                     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
                 )
             """)
+            # Keyset pagination of a user's history (see _history_page)
+            self._add_missing(cursor, """
+                ALTER TABLE symptoms_history
+                ADD INDEX idx_symptoms_user_created (user_id, created_at, id)
+            """)
 
         # AI consultations table
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS ai_consultations (
                     id INT PRIMARY KEY AUTO_INCREMENT,
                     user_id INT NOT NULL,
+                    conversation_id VARCHAR(32),
                     question TEXT NOT NULL,
                     response TEXT,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    INDEX idx_consultations_conversation (user_id, conversation_id, id),
+                    INDEX idx_consultations_user_created (user_id, created_at, id),
                     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
                 )
             """)
+            # Tables created before conversations existed
+            self._add_missing(cursor, """
+                ALTER TABLE ai_consultations
+                ADD COLUMN conversation_id VARCHAR(32) AFTER user_id,
+                ADD INDEX idx_consultations_conversation (user_id, conversation_id, id)
+            """)
+            self._add_missing(cursor, """
+                ALTER TABLE ai_consultations
+                ADD INDEX idx_consultations_user_created (user_id, created_at, id)
+            """)
 
         # Medicine reminders table
             cursor.execute("""
@@ -216,6 +431,36 @@ class Database:
                     reminder_time TIME,
                     is_active BOOLEAN DEFAULT TRUE,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                    last_notified_at DATETIME NULL,
+                    INDEX idx_reminders_active_time (is_active, reminder_time),
+                    INDEX idx_reminders_updated (updated_at),
+                    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+                )
+            """)
+            # The scheduler loads time windows from (is_active, reminder_time) and
+            # picks up edits from updated_at, so it never scans the whole table
+            self._add_missing(cursor, """
+                ALTER TABLE medicine_reminders
+                ADD COLUMN updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                ADD COLUMN last_notified_at DATETIME NULL
+            """)
+            self._add_missing(cursor, """
+                ALTER TABLE medicine_reminders
+                ADD INDEX idx_reminders_active_time (is_active, reminder_time),
+                ADD INDEX idx_reminders_updated (updated_at)
+            """)
+
+        # Per-user counters maintained on every history/reminder write (see _bump_user_stats)
+            cursor.execute("SHOW TABLES LIKE 'user_stats'")
+            stats_created = cursor.fetchone() is None
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS user_stats (
+                    user_id INT PRIMARY KEY,
+                    symptom_checks INT NOT NULL DEFAULT 0,
+                    ai_consultations INT NOT NULL DEFAULT 0,
+                    active_reminders INT NOT NULL DEFAULT 0,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
                     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
                 )
             """)
@@ -223,59 +468,118 @@ class Database:
             conn.commit()
             cursor.close()
             conn.close()
-            print("Tables created successfully.")
+            log.info("tables created")
+
+            if stats_created:
+                # Backfill every existing user now: a bump before their first stats read would
+                # otherwise create a row holding only the new delta, which reads never correct
+                rows = self.rebuild_user_stats()
+                log.info("user_stats backfilled", extra={'rows': rows})
+
+            # Opt-in monthly partitions on the history tables (see partition_history_tables)
+            if os.getenv('HISTORY_PARTITIONING') == '1':
+                self.partition_history_tables()
         except Error as e:
-            print("TABLE CREATION ERROR:", e)
+            log.error("table creation failed: %s", e)
             
-    def get_user_stats(self, user_id):
-        """Get statistics for a specific user"""
+    def _add_missing(self, cursor, statement):
+        """Run an ALTER TABLE migration, ignoring 'already exists' errors"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor(dictionary=True)
-        
-            # Get symptom check count
-            cursor.execute("""
-                SELECT COUNT(*) as symptom_checks 
-                FROM symptoms_history 
-                WHERE user_id = %s
-            """, (user_id,))
-            symptom_result = cursor.fetchone()
-            symptom_checks = symptom_result['symptom_checks'] if symptom_result else 0
-        
-            # Get AI consultations count
-            cursor.execute("""
-                SELECT COUNT(*) as ai_consultations 
-                FROM ai_consultations 
-                WHERE user_id = %s
-         """, (user_id,))
-            ai_result = cursor.fetchone()
-            ai_consultations = ai_result['ai_consultations'] if ai_result else 0
-        
-            # Get active reminders count
+            cursor.execute(statement)
+        except Error as e:
+            # 1060 duplicate column, 1061 duplicate key name
+            if e.errno not in (1060, 1061):
+                raise
+
+    # Columns of user_stats that writers may bump
+    STATS_COLUMNS = ('symptom_checks', 'ai_consultations', 'active_reminders')
+
+    def _bump_user_stats(self, cursor, user_id, column, delta=1):
+        """Adjust one materialized counter inside the caller's transaction"""
+        if column not in self.STATS_COLUMNS:
+            raise ValueError(f"Unknown user_stats column: {column}")
+        cursor.execute(f"""
+            INSERT INTO user_stats (user_id, {column}) VALUES (%s, GREATEST(%s, 0))
+            ON DUPLICATE KEY UPDATE {column} = GREATEST({column} + %s, 0)
+        """, (user_id, delta, delta))
+
+    def _count_user_stats(self, cursor, user_id):
+        """Count a user's rows in the base tables (the slow path user_stats replaces)"""
+        # Get symptom check count
+        cursor.execute("""
+            SELECT COUNT(*) as symptom_checks 
+            FROM symptoms_history 
+            WHERE user_id = %s
+        """, (user_id,))
+        symptom_result = cursor.fetchone()
+
+        # Get AI consultations count
+        cursor.execute("""
+            SELECT COUNT(*) as ai_consultations 
+            FROM ai_consultations 
+            WHERE user_id = %s
+        """, (user_id,))
+        ai_result = cursor.fetchone()
+
+        # Get active reminders count
+        cursor.execute("""
+            SELECT COUNT(*) as active_reminders 
+            FROM medicine_reminders 
+            WHERE user_id = %s AND is_active = TRUE
+        """, (user_id,))
+        reminders_result = cursor.fetchone()
+
+        return {
+            'symptom_checks': symptom_result['symptom_checks'] if symptom_result else 0,
+            'ai_consultations': ai_result['ai_consultations'] if ai_result else 0,
+            'active_reminders': reminders_result['active_reminders'] if reminders_result else 0
+        }
+
+    def _read_user_stats(self, conn, cursor, user_id):
+        """The user's counters from user_stats, plus the derived health score"""
+        cursor.execute("""
+            SELECT symptom_checks, ai_consultations, active_reminders
+            FROM user_stats
+            WHERE user_id = %s
+        """, (user_id,))
+        counters = cursor.fetchone()
+
+        if counters is None:
+            # No row yet: create_tables backfills existing users, this covers users added by hand
+            counters = self._count_user_stats(cursor, user_id)
             cursor.execute("""
-                SELECT COUNT(*) as active_reminders 
-                FROM medicine_reminders 
-                WHERE user_id = %s AND is_active = TRUE
-            """, (user_id,))
-            reminders_result = cursor.fetchone()
-            active_reminders = reminders_result['active_reminders'] if reminders_result else 0
-        
-            # Calculate health score (simplified version)
-            # You can make this more sophisticated
-            health_score = min(85 + (symptom_checks * 2), 100)
-        
-            cursor.close()
-            conn.close()
-        
-            return {
-                'symptom_checks': symptom_checks,
-                'ai_consultations': ai_consultations,
-                'active_reminders': active_reminders,
-                'health_score': health_score
-         }
+                INSERT IGNORE INTO user_stats (user_id, symptom_checks, ai_consultations, active_reminders)
+                VALUES (%s, %s, %s, %s)
+            """, (user_id, counters['symptom_checks'], counters['ai_consultations'],
+                  counters['active_reminders']))
+            conn.commit()
+
+        symptom_checks = counters['symptom_checks']
+        ai_consultations = counters['ai_consultations']
+        active_reminders = counters['active_reminders']
+
+        # Calculate health score (simplified version)
+        # You can make this more sophisticated
+        health_score = min(85 + (symptom_checks * 2), 100)
+
+        return {
+            'symptom_checks': symptom_checks,
+            'ai_consultations': ai_consultations,
+            'active_reminders': active_reminders,
+            'health_score': health_score
+        }
+
+    def get_user_stats(self, user_id):
+        """Get statistics for a specific user from the user_stats counter row"""
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor(dictionary=True)
+                stats = self._read_user_stats(conn, cursor, user_id)
+                cursor.close()
+            return stats
         
         except Error as e:
-            print("GET USER STATS ERROR:", e)
+            log.error("get user stats failed: %s", e)
         return {
                 'symptom_checks': 0,
                 'ai_consultations': 0,
@@ -286,47 +590,594 @@ class Database:
     def add_symptom_check(self, user_id, symptoms, analysis_result=None):
         """Add a new symptom check to history"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-
             if isinstance(analysis_result, dict):
                 analysis_json = json.dumps(analysis_result)
             else:
                 analysis_json = str(analysis_result)
-        
-            cursor.execute("""
-             INSERT INTO symptom_history (user_id, symptoms, analysis_result, created_at) 
-            VALUES (%s, %s, %s, NOW())
-        """, (user_id, symptoms, analysis_json))
-        
-            conn.commit()
-            cursor.close()
-            conn.close()
+
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                 INSERT INTO symptoms_history (user_id, symptoms, analysis_result, created_at) 
+                VALUES (%s, %s, %s, NOW())
+            """, (user_id, symptoms, analysis_json))
+                self._bump_user_stats(cursor, user_id, 'symptom_checks')
+                conn.commit()
+                cursor.close()
         
             return {"success": True, "message": "Symptom check recorded"}
         
         except Error as e:
-            print("ADD SYMPTOM CHECK ERROR:", e)
+            log.error("add symptom check failed: %s", e)
             return {"success": False, "message": str(e)}
 
-    def add_ai_consultation(self, user_id, question, response):
-        """Add an AI consultation to history"""
+    def add_symptom_checks(self, user_id, checks):
+        """Add several symptom checks for one user in a single multi-row INSERT.
+
+        checks is a list of (symptoms, analysis_result) pairs.
+        """
+        if not checks:
+            return {"success": True, "message": "No symptom checks to record", "count": 0}
         try:
-            conn = self.get_connection()
+            rows = []
+            for symptoms, analysis_result in checks:
+                if isinstance(analysis_result, dict):
+                    analysis_result = json.dumps(analysis_result)
+                rows.append((user_id, symptoms, str(analysis_result)))
+
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                # mysql.connector rewrites executemany INSERTs into one multi-row statement
+                cursor.executemany("""
+                    INSERT INTO symptoms_history (user_id, symptoms, analysis_result)
+                    VALUES (%s, %s, %s)
+                """, rows)
+                self._bump_user_stats(cursor, user_id, 'symptom_checks', len(rows))
+                conn.commit()
+                cursor.close()
+
+            return {"success": True, "message": "Symptom checks recorded", "count": len(rows)}
+
+        except Error as e:
+            log.error("add symptom checks failed: %s", e)
+            return {"success": False, "message": str(e)}
+
+    # Errors caused by the rows themselves (e.g. the user was deleted), not by the connection:
+    # retrying the same rows cannot succeed, so HistoryWriter isolates and drops them
+    ROW_ERRORS = (mysql.connector.errors.IntegrityError, mysql.connector.errors.DataError)
+
+    def add_history_batch(self, symptom_rows=(), consultation_rows=()):
+        """Write queued history rows for any number of users in one transaction.
+
+        symptom_rows are (user_id, symptoms, analysis_json, created_at) and
+        consultation_rows are (user_id, conversation_id, question, response, created_at). Raises
+        on failure so the caller (the write-behind queue) can retry the batch.
+        """
+        symptom_counts = {}
+        consultation_counts = {}
+        for row in symptom_rows:
+            symptom_counts[row[0]] = symptom_counts.get(row[0], 0) + 1
+        for row in consultation_rows:
+            consultation_counts[row[0]] = consultation_counts.get(row[0], 0) + 1
+
+        with self.connection() as conn:
             cursor = conn.cursor()
-        
-            cursor.execute("""
-                INSERT INTO ai_consultations (user_id, question, response)
-                VALUES (%s, %s, %s)
-            """, (user_id, question, response))
-        
-            conn.commit()
-            cursor.close()
-            conn.close()
+            try:
+                if symptom_rows:
+                    cursor.executemany("""
+                        INSERT INTO symptoms_history (user_id, symptoms, analysis_result, created_at)
+                        VALUES (%s, %s, %s, %s)
+                    """, list(symptom_rows))
+                if consultation_rows:
+                    cursor.executemany("""
+                        INSERT INTO ai_consultations (user_id, conversation_id, question, response, created_at)
+                        VALUES (%s, %s, %s, %s, %s)
+                    """, list(consultation_rows))
+                for user_id, count in symptom_counts.items():
+                    self._bump_user_stats(cursor, user_id, 'symptom_checks', count)
+                for user_id, count in consultation_counts.items():
+                    self._bump_user_stats(cursor, user_id, 'ai_consultations', count)
+                conn.commit()
+            except Error:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+
+    def add_ai_consultation(self, user_id, question, response, conversation_id=None):
+        """Add an AI consultation to history"""
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    INSERT INTO ai_consultations (user_id, conversation_id, question, response)
+                    VALUES (%s, %s, %s, %s)
+                """, (user_id, conversation_id, question, response))
+                self._bump_user_stats(cursor, user_id, 'ai_consultations')
+                conn.commit()
+                cursor.close()
         
             return {"success": True, "message": "AI consultation recorded"}
         
         except Error as e:
-            print("ADD AI CONSULTATION ERROR:", e)
-            return {"success": False, "message": str(e)}            
-    
\ No newline at end of file
+            log.error("add AI consultation failed: %s", e)
+            return {"success": False, "message": str(e)}
+
+    def get_conversation_turns(self, user_id, conversation_id, limit=20, after_id=0):
+        """Most recent (id, question, response) rows of a conversation with id > after_id, oldest first"""
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT id, question, response
+                    FROM ai_consultations
+                    WHERE user_id = %s AND conversation_id = %s AND id > %s
+                    ORDER BY id DESC
+                    LIMIT %s
+                """, (user_id, conversation_id, after_id, limit))
+                rows = cursor.fetchall()
+                cursor.close()
+            return [(row_id, question, response or '') for row_id, question, response in reversed(rows)]
+        except Error as e:
+            log.error("get conversation failed: %s", e)
+            return []
+
+    # Columns returned by the history pages, per table
+    HISTORY_COLUMNS = {
+        'symptoms_history': 'id, symptoms, analysis_result, created_at',
+        'ai_consultations': 'id, conversation_id, question, response, created_at'
+    }
+
+    def _history_page(self, table, user_id, limit, before=None, since=None, until=None):
+        """One page of a user's rows, newest first, read from the (user_id, created_at, id) index.
+
+        before is the (created_at, id) of the last row of the previous page, so
+        every page is an index range seek however deep it is (no OFFSET).
+        since (inclusive) and until (exclusive) bound created_at. Returns
+        (rows, has_more). Raises on database errors.
+        """
+        sql = [f"SELECT {self.HISTORY_COLUMNS[table]} FROM {table} WHERE user_id = %s"]
+        params = [user_id]
+        if since is not None:
+            sql.append("AND created_at >= %s")
+            params.append(since)
+        if until is not None:
+            sql.append("AND created_at < %s")
+            params.append(until)
+        if before is not None:
+            sql.append("AND (created_at < %s OR (created_at = %s AND id < %s))")
+            params.extend([before[0], before[0], before[1]])
+        sql.append("ORDER BY created_at DESC, id DESC LIMIT %s")
+        params.append(limit + 1)
+
+        with self.connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(' '.join(sql), params)
+            rows = cursor.fetchall()
+            cursor.close()
+        return rows[:limit], len(rows) > limit
+
+    def get_symptom_history(self, user_id, limit=20, before=None, since=None, until=None):
+        """A page of the user's symptom checks; see _history_page"""
+        return self._history_page('symptoms_history', user_id, limit, before, since, until)
+
+    def get_consultation_history(self, user_id, limit=20, before=None, since=None, until=None):
+        """A page of the user's AI consultations; see _history_page"""
+        return self._history_page('ai_consultations', user_id, limit, before, since, until)
+
+    def iter_user_history(self, table, user_id, since=None, until=None, chunk_rows=5000, batch_size=500):
+        """Stream all of a user's rows of a history table, oldest first, in constant memory.
+
+        Rows come from an unbuffered cursor, batch_size at a time. The scan
+        is split into keyset chunks of chunk_rows on (user_id, created_at,
+        id), and the pooled connection goes back between chunks. That way a
+        slow download never pins one connection or read view for the whole
+        export.
+        """
+        if table not in self.HISTORY_COLUMNS:
+            raise ValueError(f"Not a history table: {table}")
+        after = None
+        while True:
+            sql = [f"SELECT {self.HISTORY_COLUMNS[table]} FROM {table} WHERE user_id = %s"]
+            params = [user_id]
+            if since is not None:
+                sql.append("AND created_at >= %s")
+                params.append(since)
+            if until is not None:
+                sql.append("AND created_at < %s")
+                params.append(until)
+            if after is not None:
+                sql.append("AND (created_at > %s OR (created_at = %s AND id > %s))")
+                params.extend([after[0], after[0], after[1]])
+            sql.append("ORDER BY created_at, id LIMIT %s")
+            params.append(chunk_rows)
+            count = 0
+            for row in self._stream(' '.join(sql), params, batch_size):
+                count += 1
+                after = (row['created_at'], row['id'])
+                yield row
+            if count < chunk_rows:
+                return
+
+    # Columns returned for medicine reminders
+    REMINDER_COLUMNS = ('id, user_id, medicine_name, dosage, schedule, reminder_time, is_active, '
+                        'created_at, updated_at, last_notified_at')
+    REMINDER_FIELDS = ('medicine_name', 'dosage', 'schedule', 'reminder_time', 'is_active')
+
+    @staticmethod
+    def _reminder_row(row):
+        # mysql.connector returns TIME columns as timedelta
+        value = row.get('reminder_time')
+        if isinstance(value, timedelta):
+            seconds = int(value.total_seconds()) % 86400
+            row['reminder_time'] = dtime(seconds // 3600, seconds // 60 % 60, seconds % 60)
+        row['is_active'] = bool(row['is_active'])
+        return row
+
+    def _select_reminders(self, cursor, where, params):
+        cursor.execute(f"SELECT {self.REMINDER_COLUMNS} FROM medicine_reminders WHERE {where}", params)
+        return [self._reminder_row(row) for row in cursor.fetchall()]
+
+    def add_reminder(self, user_id, medicine_name, dosage=None, schedule='daily', reminder_time=None, is_active=True):
+        """Insert a reminder and bump active_reminders; returns the new row. Raises on database errors."""
+        with self.connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                cursor.execute("""
+                    INSERT INTO medicine_reminders (user_id, medicine_name, dosage, schedule, reminder_time, is_active)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                """, (user_id, medicine_name, dosage, schedule, reminder_time, is_active))
+                reminder_id = cursor.lastrowid
+                if is_active:
+                    self._bump_user_stats(cursor, user_id, 'active_reminders')
+                conn.commit()
+                rows = self._select_reminders(cursor, "id = %s", (reminder_id,))
+            except Error:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+        return rows[0]
+
+    def get_dashboard_snapshot(self, user_id, recent=5):
+        """Everything the dashboard shows, read over one pooled connection.
+
+        Returns stats, the ``recent`` newest symptom checks and consultations
+        (HISTORY_COLUMNS) and the active reminders. Every query is a user_id
+        index range. Raises on database errors.
+        """
+        with self.connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            snapshot = {'stats': self._read_user_stats(conn, cursor, user_id)}
+            for key, table in (('symptom_checks', 'symptoms_history'), ('consultations', 'ai_consultations')):
+                cursor.execute(f"""
+                    SELECT {self.HISTORY_COLUMNS[table]} FROM {table}
+                    WHERE user_id = %s ORDER BY created_at DESC, id DESC LIMIT %s
+                """, (user_id, recent))
+                snapshot[key] = cursor.fetchall()
+            snapshot['reminders'] = self._select_reminders(
+                cursor, "user_id = %s AND is_active = TRUE ORDER BY reminder_time, id", (user_id,))
+            cursor.close()
+        return snapshot
+
+    def get_reminders(self, user_id):
+        """All of a user's reminders, by time of day"""
+        with self.connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            rows = self._select_reminders(cursor, "user_id = %s ORDER BY reminder_time, id", (user_id,))
+            cursor.close()
+        return rows
+
+    def update_reminder(self, user_id, reminder_id, **fields):
+        """Change some of REMINDER_FIELDS; returns the updated row, or None if the user has no such reminder"""
+        fields = {k: v for k, v in fields.items() if k in self.REMINDER_FIELDS}
+        with self.connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                cursor.execute("""
+                    SELECT is_active FROM medicine_reminders WHERE id = %s AND user_id = %s FOR UPDATE
+                """, (reminder_id, user_id))
+                current = cursor.fetchone()
+                if current is None:
+                    conn.rollback()
+                    return None
+                if fields:
+                    assignments = ', '.join(f"{column} = %s" for column in fields)
+                    cursor.execute(f"UPDATE medicine_reminders SET {assignments} WHERE id = %s",
+                                   (*fields.values(), reminder_id))
+                    if 'is_active' in fields and bool(fields['is_active']) != bool(current['is_active']):
+                        self._bump_user_stats(cursor, user_id, 'active_reminders', 1 if fields['is_active'] else -1)
+                conn.commit()
+                rows = self._select_reminders(cursor, "id = %s", (reminder_id,))
+            except Error:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+        return rows[0]
+
+    def delete_reminder(self, user_id, reminder_id):
+        """Delete one of the user's reminders; returns False if there was none"""
+        with self.connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                cursor.execute("""
+                    SELECT is_active FROM medicine_reminders WHERE id = %s AND user_id = %s FOR UPDATE
+                """, (reminder_id, user_id))
+                current = cursor.fetchone()
+                if current is None:
+                    conn.rollback()
+                    return False
+                cursor.execute("DELETE FROM medicine_reminders WHERE id = %s", (reminder_id,))
+                if current['is_active']:
+                    self._bump_user_stats(cursor, user_id, 'active_reminders', -1)
+                conn.commit()
+            except Error:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+        return True
+
+    def get_active_reminders_between(self, start, end, after=None, limit=5000):
+        """Active reminders with start <= reminder_time < end, ordered by (reminder_time, id).
+
+        start and end are datetime.time values; end=None means the rest of the
+        day. A range seek on idx_reminders_active_time. Pass the
+        (reminder_time, id) of the last row as after to fetch the next chunk
+        of a large window.
+        """
+        where = ["is_active = TRUE AND reminder_time >= %s AND reminder_time < %s"]
+        params = [start, end if end is not None else '24:00:00']
+        if after is not None:
+            where.append("AND (reminder_time > %s OR (reminder_time = %s AND id > %s))")
+            params.extend([after[0], after[0], after[1]])
+        where.append("ORDER BY reminder_time, id LIMIT %s")
+        params.append(limit)
+        with self.connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            rows = self._select_reminders(cursor, ' '.join(where), params)
+            cursor.close()
+        return rows
+
+    def get_reminders_by_ids(self, ids):
+        """Current rows for the given ids (missing ids were deleted)"""
+        if not ids:
+            return []
+        with self.connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            rows = self._select_reminders(cursor, f"id IN ({', '.join(['%s'] * len(ids))})", list(ids))
+            cursor.close()
+        return rows
+
+    def get_reminders_changed_since(self, since, after_id=0, limit=5000):
+        """Reminders (active or not) edited after (since, after_id), ordered by (updated_at, id).
+
+        Pass the (updated_at, id) of the last row to continue, so a bulk edit
+        sharing one timestamp is still read in full.
+        """
+        with self.connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            rows = self._select_reminders(cursor, """
+                (updated_at > %s OR (updated_at = %s AND id > %s)) ORDER BY updated_at, id LIMIT %s
+            """, (since, since, after_id, limit))
+            cursor.close()
+        return rows
+
+    def mark_reminders_sent(self, ids, sent_at):
+        """Record a dispatch without touching updated_at, so it is not seen as an edit"""
+        if not ids:
+            return
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                UPDATE medicine_reminders SET last_notified_at = %s, updated_at = updated_at
+                WHERE id IN ({', '.join(['%s'] * len(ids))})
+            """, (sent_at, *ids))
+            conn.commit()
+            cursor.close()
+
+    def rebuild_user_stats(self, archived=None):
+        """Recompute every user's counters from the base tables in one bulk statement.
+
+        Run after imports, manual deletes or if counters are suspected to have
+        drifted. archived maps user ids to {column: rows} moved out to the
+        history archive, which still count. Returns the number of user_stats
+        rows written.
+        """
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO user_stats (user_id, symptom_checks, ai_consultations, active_reminders)
+                SELECT u.id, COALESCE(s.n, 0), COALESCE(a.n, 0), COALESCE(r.n, 0)
+                FROM users u
+                LEFT JOIN (
+                    SELECT user_id, COUNT(*) AS n FROM symptoms_history GROUP BY user_id
+                ) s ON s.user_id = u.id
+                LEFT JOIN (
+                    SELECT user_id, COUNT(*) AS n FROM ai_consultations GROUP BY user_id
+                ) a ON a.user_id = u.id
+                LEFT JOIN (
+                    SELECT user_id, COUNT(*) AS n FROM medicine_reminders WHERE is_active = TRUE GROUP BY user_id
+                ) r ON r.user_id = u.id
+                ON DUPLICATE KEY UPDATE
+                    symptom_checks = VALUES(symptom_checks),
+                    ai_consultations = VALUES(ai_consultations),
+                    active_reminders = VALUES(active_reminders)
+            """)
+            rows = cursor.rowcount
+            if archived:
+                cursor.executemany("""
+                    UPDATE user_stats
+                    SET symptom_checks = symptom_checks + %s, ai_consultations = ai_consultations + %s
+                    WHERE user_id = %s
+                """, [(counts.get('symptom_checks', 0), counts.get('ai_consultations', 0), user_id)
+                      for user_id, counts in archived.items()])
+            conn.commit()
+            cursor.close()
+        return rows
+
+    def _stream(self, sql, params=(), batch_size=1000):
+        """Yield the rows of a query from an unbuffered (server-side) cursor.
+
+        Rows are fetched batch_size at a time, so memory stays flat however
+        many match. The pooled connection is held until the generator is
+        exhausted; one abandoned early is closed rather than returned with
+        unread rows.
+        """
+        conn = self.pool.acquire()
+        finished = False
+        try:
+            cursor = conn.cursor(dictionary=True, buffered=False)
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+            cursor.close()
+            finished = True
+        finally:
+            if finished:
+                conn.close()
+            else:
+                conn.discard()
+
+    # History tables that can be range-partitioned by month of created_at and archived
+    PARTITIONED_TABLES = ('symptoms_history', 'ai_consultations')
+    _PARTITION_NAME = re.compile(r"p\d{6}")
+
+    @staticmethod
+    def _next_month(month):
+        return (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+    def _partition_clauses(self, first, last):
+        """PARTITION definitions for every month from first to last (dates on the 1st)"""
+        clauses = []
+        while first <= last:
+            following = self._next_month(first)
+            clauses.append(f"PARTITION p{first:%Y%m} VALUES LESS THAN (UNIX_TIMESTAMP('{following:%Y-%m-%d}'))")
+            first = following
+        return clauses
+
+    def _check_partition(self, table, name):
+        if table not in self.PARTITIONED_TABLES or not self._PARTITION_NAME.fullmatch(name):
+            raise ValueError(f"Not a monthly history partition: {table}.{name}")
+
+    def _partition_names(self, cursor, table):
+        cursor.execute("""
+            SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+            ORDER BY PARTITION_ORDINAL_POSITION
+        """, (table,))
+        return [row[0] for row in cursor.fetchall()]
+
+    def history_partitions(self, table):
+        """Monthly partitions of a history table as ('pYYYYMM', date of the 1st), oldest first.
+
+        Empty when the table is not partitioned (see partition_history_tables).
+        """
+        if table not in self.PARTITIONED_TABLES:
+            raise ValueError(f"Not a history table: {table}")
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            names = self._partition_names(cursor, table)
+            cursor.close()
+        return [(name, date(int(name[1:5]), int(name[5:7]), 1))
+                for name in names if self._PARTITION_NAME.fullmatch(name)]
+
+    def partition_history_tables(self, months_ahead=3):
+        """Convert symptoms_history and ai_consultations to monthly RANGE partitions on created_at.
+
+        A one-off migration that rebuilds each table, so run it in a
+        maintenance window. MySQL allows neither foreign keys on partitioned
+        tables nor unique keys without the partitioning column, so the
+        user_id foreign keys are dropped and the primary key becomes
+        (id, created_at). Already partitioned tables are left alone. Either
+        way, partitions are then added up to months_ahead months from now.
+        Returns {table: [partitions added]}.
+        """
+        added = {}
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            for table in self.PARTITIONED_TABLES:
+                if self._partition_names(cursor, table):
+                    continue
+                cursor.execute(f"SELECT MIN(created_at) FROM {table}")
+                oldest = cursor.fetchone()[0] or datetime.now()
+                this_month = date.today().replace(day=1)
+                clauses = self._partition_clauses(min(oldest.date().replace(day=1), this_month), this_month)
+                cursor.execute("""
+                    SELECT CONSTRAINT_NAME FROM information_schema.REFERENTIAL_CONSTRAINTS
+                    WHERE CONSTRAINT_SCHEMA = DATABASE() AND TABLE_NAME = %s
+                """, (table,))
+                for (constraint,) in cursor.fetchall():
+                    cursor.execute(f"ALTER TABLE {table} DROP FOREIGN KEY `{constraint}`")
+                cursor.execute(f"""
+                    ALTER TABLE {table}
+                    MODIFY created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    DROP PRIMARY KEY, ADD PRIMARY KEY (id, created_at)
+                """)
+                cursor.execute(f"""
+                    ALTER TABLE {table} PARTITION BY RANGE (UNIX_TIMESTAMP(created_at)) (
+                        {', '.join(clauses)},
+                        PARTITION pmax VALUES LESS THAN MAXVALUE
+                    )
+                """)
+                added[table] = [clause.split()[1] for clause in clauses]
+                log.info("history table partitioned", extra={'table': table, 'partitions': len(clauses)})
+            cursor.close()
+        for table, names in self.ensure_history_partitions(months_ahead).items():
+            added.setdefault(table, []).extend(names)
+        return added
+
+    def ensure_history_partitions(self, months_ahead=3):
+        """Split empty future months out of pmax so inserts never pile up there; returns {table: [added]}"""
+        added = {}
+        last_needed = date.today().replace(day=1)
+        for _ in range(months_ahead):
+            last_needed = self._next_month(last_needed)
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            for table in self.PARTITIONED_TABLES:
+                names = [name for name in self._partition_names(cursor, table) if self._PARTITION_NAME.fullmatch(name)]
+                if not names:
+                    continue
+                first = self._next_month(date(int(names[-1][1:5]), int(names[-1][5:7]), 1))
+                clauses = self._partition_clauses(first, last_needed)
+                if not clauses:
+                    continue
+                cursor.execute(f"""
+                    ALTER TABLE {table} REORGANIZE PARTITION pmax INTO (
+                        {', '.join(clauses)},
+                        PARTITION pmax VALUES LESS THAN MAXVALUE
+                    )
+                """)
+                added[table] = [clause.split()[1] for clause in clauses]
+            cursor.close()
+        return added
+
+    def count_history_partition(self, table, name):
+        self._check_partition(table, name)
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT COUNT(*) FROM {table} PARTITION ({name})")
+            count = cursor.fetchone()[0]
+            cursor.close()
+        return count
+
+    def iter_history_partition(self, table, name, batch_size=1000):
+        """Stream one partition's rows (user_id plus HISTORY_COLUMNS) ordered by user_id, created_at, id"""
+        self._check_partition(table, name)
+        return self._stream(f"""
+            SELECT user_id, {self.HISTORY_COLUMNS[table]} FROM {table} PARTITION ({name})
+            ORDER BY user_id, created_at, id
+        """, batch_size=batch_size)
+
+    def drop_history_partition(self, table, name):
+        """Drop a month of history (metadata-only, unlike DELETE); archive it first"""
+        self._check_partition(table, name)
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"ALTER TABLE {table} DROP PARTITION {name}")
+            cursor.close()
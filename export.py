@@ -0,0 +1,78 @@
+import csv
+import io
+import json
+import zlib
+
+
+# Columns of the CSV export; NDJSON records carry the same keys minus the empty ones
+CSV_FIELDS = ('type', 'id', 'created_at', 'symptoms', 'analysis', 'conversation_id', 'question', 'response')
+
+
+def ndjson_lines(records):
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False, default=str) + '\n'
+
+
+def csv_lines(records):
+    """Header plus one CSV line per record; nested analyses are written as JSON text"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, CSV_FIELDS, extrasaction='ignore')
+    writer.writeheader()
+    for record in records:
+        analysis = record.get('analysis')
+        if analysis is not None and not isinstance(analysis, str):
+            record = {**record, 'analysis': json.dumps(analysis, ensure_ascii=False)}
+        writer.writerow(record)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def encoded_chunks(lines, chunk_size=64 * 1024):
+    """UTF-8 bytes in chunks of about chunk_size; the first line goes out on its own so bytes flow at once"""
+    pending = []
+    size = 0
+    first = True
+    for line in lines:
+        data = line.encode('utf-8')
+        if first:
+            yield data
+            first = False
+            continue
+        pending.append(data)
+        size += len(data)
+        if size >= chunk_size:
+            yield b''.join(pending)
+            pending, size = [], 0
+    if pending:
+        yield b''.join(pending)
+
+
+def gzip_chunks(chunks, level=6):
+    """Compress a byte stream into a gzip file on the fly, in constant memory"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    first = True
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if first:
+            # Push the header and first record out rather than waiting for a full deflate block
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            first = False
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+FORMATS = {
+    'ndjson': (ndjson_lines, 'application/x-ndjson', 'ndjson'),
+    'csv': (csv_lines, 'text/csv', 'csv')
+}
+
+
+def export_stream(records, fmt='ndjson', compress=False, level=6):
+    """(byte chunk generator, mimetype, file extension) for records in fmt, optionally gzipped"""
+    lines, mimetype, extension = FORMATS[fmt]
+    chunks = encoded_chunks(lines(records))
+    if compress:
+        return gzip_chunks(chunks, level), 'application/gzip', extension + '.gz'
+    return chunks, mimetype, extension
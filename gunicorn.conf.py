@@ -0,0 +1,28 @@
+import os
+
+# AI requests spend almost all their time waiting on Gemini, so each worker
+# runs many threads instead of one request at a time. With the LLM gateway
+# capping upstream concurrency, one process can hold hundreds of in-flight
+# AI requests while using little CPU.
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', '200'))
+
+# Must exceed the longest LLM deadline (LLM_TIMEOUT_SYMPTOMS / LLM_TIMEOUT_CHAT)
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '90'))
+graceful_timeout = 30
+keepalive = 5
+
+# Load the app once in the master and fork workers from it. app.py creates
+# its DB pool, model client and background threads lazily per worker, so
+# nothing unsafe is inherited across fork (GUNICORN_PRELOAD=0 to disable).
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') != '0'
+
+
+def when_ready(server):
+    # Runs in the master before the first fork: import (but do not configure)
+    # the model client library so workers share it copy-on-write
+    if server.cfg.preload_app:
+        import model_backends
+        model_backends.import_backend()
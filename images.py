@@ -0,0 +1,313 @@
+import argparse
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+
+from markupsafe import Markup
+
+
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'img')
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+BUILD_SUBDIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+SOURCE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+DEFAULT_WIDTHS = (480, 960, 1440, 1920)
+# Images shown at a fixed CSS size only need 1x/2x/3x variants
+IMAGE_WIDTHS = {
+    'logo.jpg': (40, 80, 120)
+}
+
+QUALITY = {'avif': 50, 'webp': 78, 'jpeg': 80, 'png': None}
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp', 'jpeg': 'image/jpeg', 'png': 'image/png'}
+EXTENSIONS = {'avif': 'avif', 'webp': 'webp', 'jpeg': 'jpg', 'png': 'png'}
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+# picture('name.jpg', ...) and background_image('#selector', 'name.jpg') calls in templates
+_TEMPLATE_IMAGE = re.compile(r"""(?:picture\(\s*|background_image\(\s*['"][^'"]*['"]\s*,\s*)['"]([^'"]+)['"]""")
+
+
+def referenced_images(template_dir=TEMPLATE_DIR):
+    """Image names passed to picture()/background_image() in any template"""
+    names = set()
+    for root, _, files in os.walk(template_dir):
+        for filename in files:
+            if filename.endswith('.html'):
+                with open(os.path.join(root, filename), encoding='utf-8') as f:
+                    names.update(_TEMPLATE_IMAGE.findall(f.read()))
+    return names
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def available_formats():
+    """Modern formats this Pillow build can encode, best first"""
+    from PIL import features
+
+    formats = []
+    try:
+        if features.check('avif'):
+            formats.append('avif')
+    except ValueError:
+        # Pillow < 11.3 has no AVIF codec
+        pass
+    if features.check('webp'):
+        formats.append('webp')
+    return formats
+
+
+def _encode(image, fmt):
+    buffer = io.BytesIO()
+    if fmt == 'jpeg':
+        image.convert('RGB').save(buffer, 'JPEG', quality=QUALITY['jpeg'], optimize=True, progressive=True)
+    elif fmt == 'png':
+        image.save(buffer, 'PNG', optimize=True)
+    elif fmt == 'webp':
+        image.save(buffer, 'WEBP', quality=QUALITY['webp'], method=6)
+    else:
+        image.save(buffer, 'AVIF', quality=QUALITY['avif'])
+    return buffer.getvalue()
+
+
+def _target_widths(name, source_width):
+    widths = sorted({w for w in IMAGE_WIDTHS.get(name, DEFAULT_WIDTHS) if w < source_width})
+    if not widths or (name not in IMAGE_WIDTHS and widths[-1] < min(source_width, max(DEFAULT_WIDTHS))):
+        widths.append(min(source_width, max(DEFAULT_WIDTHS)))
+    return widths
+
+
+def build_image(path, out_dir, formats):
+    """Resize one source image to its target widths and write every format with a content-hashed name"""
+    from PIL import Image, ImageOps
+
+    name = os.path.basename(path)
+    stem = os.path.splitext(name)[0]
+    with Image.open(path) as source:
+        source = ImageOps.exif_transpose(source)
+        has_alpha = source.mode in ('RGBA', 'LA') or (source.mode == 'P' and 'transparency' in source.info)
+        source = source.convert('RGBA' if has_alpha else 'RGB')
+        # JPEG for photos, PNG only where transparency has to survive
+        fallback = 'png' if has_alpha else 'jpeg'
+
+        entry = {
+            'width': source.width,
+            'height': source.height,
+            'fallback': fallback,
+            'variants': {fmt: [] for fmt in formats + [fallback]}
+        }
+        for width in _target_widths(name, source.width):
+            height = max(1, round(source.height * width / source.width))
+            resized = source if width == source.width else source.resize((width, height), Image.LANCZOS)
+            for fmt in entry['variants']:
+                data = _encode(resized, fmt)
+                digest = hashlib.sha256(data).hexdigest()[:10]
+                filename = f"{stem}-{width}.{digest}.{EXTENSIONS[fmt]}"
+                target = os.path.join(out_dir, filename)
+                if not os.path.exists(target):
+                    with open(target + '.tmp', 'wb') as f:
+                        f.write(data)
+                    os.replace(target + '.tmp', target)
+                entry['variants'][fmt].append({
+                    'width': width, 'height': height, 'file': filename, 'bytes': len(data)
+                })
+    return entry
+
+
+def build(image_dir=IMAGE_DIR, force=False, prune=True, template_dir=TEMPLATE_DIR):
+    """Build responsive variants of the images templates use into <image_dir>/dist and write the manifest.
+
+    Only images passed to picture()/background_image() in template_dir are
+    built; others (plain CSS backgrounds, unused files) would only be dead
+    weight. Images whose source hash and target widths match the existing
+    manifest are skipped unless force is set. With prune, files no longer
+    referenced by the manifest are removed.
+    """
+    out_dir = os.path.join(image_dir, BUILD_SUBDIR)
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+    previous = _read_manifest(manifest_path).get('images', {})
+    formats = available_formats()
+    wanted = referenced_images(template_dir)
+
+    images = {}
+    for name in sorted(os.listdir(image_dir)):
+        path = os.path.join(image_dir, name)
+        if not os.path.isfile(path) or not name.lower().endswith(SOURCE_EXTENSIONS):
+            continue
+        if name not in wanted:
+            print(f"IMAGES: {name} not used by any template, skipped")
+            continue
+        source_hash = _file_sha256(path)
+        old = previous.get(name)
+        if (not force and old and old.get('source_sha256') == source_hash
+                and sorted(old['variants']) == sorted(formats + [old['fallback']])
+                and [v['width'] for v in old['variants'][old['fallback']]] == _target_widths(name, old['width'])
+                and all(os.path.exists(os.path.join(out_dir, v['file']))
+                        for variants in old['variants'].values() for v in variants)):
+            images[name] = old
+            print(f"IMAGES: {name} unchanged")
+            continue
+
+        entry = build_image(path, out_dir, formats)
+        entry['source_sha256'] = source_hash
+        entry['source_bytes'] = os.path.getsize(path)
+        images[name] = entry
+        smallest = min(v['bytes'] for v in entry['variants'][formats[0] if formats else entry['fallback']])
+        print(f"IMAGES: {name} {entry['source_bytes']} bytes -> "
+              f"{sum(len(v) for v in entry['variants'].values())} files, smallest {smallest} bytes")
+
+    manifest = {'version': 1, 'formats': formats, 'images': images}
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+    if prune:
+        referenced = {v['file'] for entry in images.values() for variants in entry['variants'].values()
+                      for v in variants}
+        for filename in os.listdir(out_dir):
+            if filename != MANIFEST_NAME and filename not in referenced:
+                os.remove(os.path.join(out_dir, filename))
+    return manifest
+
+
+def _read_manifest(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class ImageManifest:
+    """Reads the build manifest and renders <picture> tags and CSS backgrounds from it.
+
+    Without a manifest (build not run) or for images missing from it, the
+    helpers fall back to the original file under static/img. The manifest is
+    re-read when its mtime changes, so a rebuild is picked up without a restart.
+    """
+
+    def __init__(self, image_dir=IMAGE_DIR, static_prefix='img'):
+        self.path = os.path.join(image_dir, BUILD_SUBDIR, MANIFEST_NAME)
+        self.static_prefix = static_prefix
+        self._images = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def _entries(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            mtime = None
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    self._images = _read_manifest(self.path).get('images', {}) if mtime else {}
+                    self._mtime = mtime
+        return self._images
+
+    def entry(self, name):
+        return self._entries().get(name)
+
+    def generation(self):
+        """Changes whenever the manifest is rebuilt (its mtime, or None without one)"""
+        self._entries()
+        return self._mtime
+
+    def _url(self, filename, built=True):
+        from flask import url_for
+
+        path = f"{self.static_prefix}/{BUILD_SUBDIR}/{filename}" if built else f"{self.static_prefix}/{filename}"
+        return url_for('static', filename=path)
+
+    def _srcset(self, variants):
+        return ', '.join(f"{self._url(v['file'])} {v['width']}w" for v in variants)
+
+    def picture(self, name, alt='', sizes='100vw', **attrs):
+        """<picture> with AVIF/WebP sources and a JPEG/PNG <img> fallback, all with srcset"""
+        attrs.setdefault('loading', 'lazy')
+        attrs.setdefault('decoding', 'async')
+        entry = self.entry(name)
+        if entry is None:
+            return Markup('<img src="{}" alt="{}"{}>').format(self._url(name, built=False), alt, _attributes(attrs))
+
+        if 'width' not in attrs and 'height' not in attrs:
+            # Intrinsic size lets the browser reserve space before the image arrives
+            attrs['width'], attrs['height'] = entry['width'], entry['height']
+        fallback = entry['variants'][entry['fallback']]
+        parts = []
+        # Variants are stored best format first, which is the order browsers try <source>s in
+        for fmt, variants in entry['variants'].items():
+            if fmt != entry['fallback']:
+                parts.append(Markup('<source type="{}" srcset="{}" sizes="{}">').format(
+                    MIME_TYPES[fmt], self._srcset(variants), sizes))
+        parts.append(Markup('<img src="{}" srcset="{}" sizes="{}" alt="{}"{}>').format(
+            self._url(fallback[-1]['file']), self._srcset(fallback), sizes, alt, _attributes(attrs)))
+        return Markup('<picture>{}</picture>').format(Markup('').join(parts))
+
+    def background(self, selector, name):
+        """<style> block giving selector a viewport-sized background-image in the best supported format"""
+        entry = self.entry(name)
+        if entry is None:
+            return Markup('')
+
+        formats = [fmt for fmt in ('avif', 'webp') if fmt in entry['variants']] + [entry['fallback']]
+        widths = [v['width'] for v in entry['variants'][entry['fallback']]]
+
+        def declarations(i):
+            fallback_url = self._url(entry['variants'][entry['fallback']][i]['file'])
+            image_set = ', '.join(
+                f'url("{self._url(entry["variants"][fmt][i]["file"])}") type("{MIME_TYPES[fmt]}")' for fmt in formats
+            )
+            # Browsers without image-set() type() support keep the plain url()
+            return f'background-image: url("{fallback_url}"); background-image: image-set({image_set});'
+
+        rules = [f"{selector} {{ {declarations(len(widths) - 1)} }}"]
+        # Narrowest breakpoint last so it wins on small screens
+        for i in reversed(range(len(widths) - 1)):
+            rules.append(f"@media (max-width: {widths[i]}px) {{ {selector} {{ {declarations(i)} }} }}")
+        return Markup('<style>\n{}\n</style>').format(Markup('\n'.join(rules)))
+
+
+def _attributes(attrs):
+    return Markup('').join(
+        Markup(' {}="{}"').format(key.replace('_', '-'), value) for key, value in attrs.items() if value is not None
+    )
+
+
+def init_app(app, manifest):
+    """Expose picture()/background_image() to templates and mark built images immutable"""
+    from flask import request
+
+    build_prefix = f"{app.static_url_path}/{manifest.static_prefix}/{BUILD_SUBDIR}/"
+
+    @app.context_processor
+    def image_helpers():
+        return {'picture': manifest.picture, 'background_image': manifest.background}
+
+    @app.after_request
+    def cache_built_images(response):
+        # Built files are content-hashed, so a URL never changes meaning
+        if request.path.startswith(build_prefix) and response.status_code in (200, 304):
+            response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+            response.headers.pop('Expires', None)
+        return response
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build responsive, content-hashed variants of static/img")
+    parser.add_argument('--image-dir', default=IMAGE_DIR)
+    parser.add_argument('--template-dir', default=TEMPLATE_DIR, help="templates scanned for the images to build")
+    parser.add_argument('--force', action='store_true', help="rebuild images whose source has not changed")
+    parser.add_argument('--no-prune', action='store_true', help="keep files the new manifest no longer references")
+    args = parser.parse_args()
+    build(args.image_dir, force=args.force, prune=not args.no_prune, template_dir=args.template_dir)
@@ -0,0 +1,40 @@
+import os
+import threading
+
+
+class PerProcess:
+    """Proxy for an object that ``factory`` builds on first use, once per process.
+
+    Nothing is created at import time, so importing app.py stays cheap. A
+    gunicorn --preload master also never holds clients, sockets or threads
+    that a forked worker would inherit. A worker builds its own instance
+    the first time it touches the proxy. ``setup`` runs on every new
+    instance, for example to attach metrics.
+    """
+
+    def __init__(self, factory, setup=None):
+        self._factory = factory
+        self._setup = setup
+        self._instance = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        pid = os.getpid()
+        if self._instance is None or self._pid != pid:
+            with self._lock:
+                if self._instance is None or self._pid != pid:
+                    instance = self._factory()
+                    if self._setup:
+                        self._setup(instance)
+                    self._instance = instance
+                    self._pid = pid
+        return self._instance
+
+    @property
+    def created(self):
+        """Whether this process has built its instance yet"""
+        return self._instance is not None and self._pid == os.getpid()
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
@@ -0,0 +1,411 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from metrics import LLM_CALL_DURATION, LLM_HEDGES, LLM_RETRIES, LLM_TIME_TO_FIRST_TOKEN, LLM_TOKENS
+from resilience import CLOSED, backoff_delay, is_retryable
+
+
+log = logging.getLogger(__name__)
+
+
+class GatewayError(Exception):
+    """Base class for errors raised by the LLM gateway itself (not the model)"""
+
+
+class GatewayBusy(GatewayError):
+    """Raised when too many model calls are already queued in this process"""
+
+
+class GatewayTimeout(GatewayError):
+    """Raised when a model call does not finish within its deadline"""
+
+
+class GatewayUnavailable(GatewayError):
+    """Raised without calling the model while the circuit breaker is open"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+_DONE = object()
+
+
+def _estimate_tokens(text):
+    return max(len(text) // 4, 1) if text else 0
+
+
+def _history_text(history):
+    return ' '.join(str(part) for turn in history or [] for part in turn.get('parts', []))
+
+
+class _CallMetrics:
+    """Times one gateway call and records its outcome and token counts"""
+
+    def __init__(self, kind, prompt_text, listeners=()):
+        self.kind = kind
+        self.prompt_text = prompt_text
+        self.listeners = listeners
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def record_tokens(self, response=None, text=None):
+        usage = getattr(response, 'usage_metadata', None)
+        tokens_in = getattr(usage, 'prompt_token_count', None) or _estimate_tokens(self.prompt_text)
+        tokens_out = getattr(usage, 'candidates_token_count', None) or _estimate_tokens(
+            text if text is not None else getattr(response, 'text', '')
+        )
+        LLM_TOKENS.inc(tokens_in, kind=self.kind, direction='in')
+        LLM_TOKENS.inc(tokens_out, kind=self.kind, direction='out')
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None or exc_type is GeneratorExit:
+            outcome = 'ok'
+        elif issubclass(exc_type, GatewayTimeout):
+            outcome = 'timeout'
+        elif issubclass(exc_type, GatewayBusy):
+            outcome = 'rejected'
+        elif issubclass(exc_type, GatewayUnavailable):
+            outcome = 'circuit_open'
+        else:
+            outcome = 'error'
+        elapsed = time.perf_counter() - self.started
+        LLM_CALL_DURATION.observe(elapsed, kind=self.kind, outcome=outcome)
+        for listener in self.listeners:
+            try:
+                listener(self.kind, elapsed, outcome)
+            except Exception as e:
+                log.warning("LLM listener failed: %s", e)
+        return False
+
+
+class LLMGateway:
+    """Single entry point for every Gemini call made by the app.
+
+    Calls run on a bounded I/O thread pool whose size is the global cap on
+    in-flight upstream requests. Callers wait at most ``timeout`` seconds for
+    a result; at most ``max_pending`` calls may be waiting for a pool slot
+    before new ones are rejected with GatewayBusy. The pool is created lazily
+    per process so it is safe to build the gateway before gunicorn forks.
+
+    ``timeout`` is a deadline for the whole call, retries included. Transient
+    upstream errors are retried up to ``max_retries`` times with jittered
+    backoff, but only while at least ``min_attempt_seconds`` would remain for
+    the new attempt. With ``hedge_after`` set, a non-streamed call still
+    running after that many seconds gets a second identical request and the
+    first answer wins; hedges are only sent while the pool is less than half
+    busy. An optional CircuitBreaker sees every attempt's outcome and, while
+    open, makes calls fail at once with GatewayUnavailable.
+    """
+
+    def __init__(self, model, max_concurrency=32, max_pending=256, default_timeout=30.0, breaker=None,
+                 max_retries=0, min_attempt_seconds=2.0, hedge_after=None):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.default_timeout = default_timeout
+        self.breaker = breaker
+        self.max_retries = max_retries
+        self.min_attempt_seconds = min_attempt_seconds
+        self.hedge_after = hedge_after
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        self._admitted = threading.BoundedSemaphore(max_concurrency + max_pending)
+        self._in_flight = 0
+        self._calls = 0
+        self._completed = 0
+        self._failed = 0
+        self._timeouts = 0
+        self._rejected = 0
+        self._retries = 0
+        self._hedges = 0
+        self._hedge_wins = 0
+        self._busy_seconds = 0.0
+        self.listeners = []
+
+    def add_listener(self, listener):
+        """Call listener(kind, seconds, outcome) after every generate/chat/stream_chat call"""
+        self.listeners.append(listener)
+
+    @property
+    def executor(self):
+        pid = os.getpid()
+        if self._executor is None or self._executor_pid != pid:
+            with self._lock:
+                if self._executor is None or self._executor_pid != pid:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_concurrency,
+                        thread_name_prefix='llm'
+                    )
+                    self._executor_pid = pid
+                    self._admitted = threading.BoundedSemaphore(self.max_concurrency + self.max_pending)
+        return self._executor
+
+    def _admit(self):
+        if not self._admitted.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise GatewayBusy("Too many AI requests in progress, please try again shortly")
+        with self._lock:
+            self._calls += 1
+
+    def _run(self, fn, *args, **kwargs):
+        with self._lock:
+            self._in_flight += 1
+        started = time.monotonic()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self._busy_seconds += time.monotonic() - started
+
+    def _submit(self, executor, fn, *args, **kwargs):
+        self._admit()
+        try:
+            future = executor.submit(self._run, fn, *args, **kwargs)
+        except RuntimeError:
+            self._admitted.release()
+            raise
+        # Runs on completion and on cancellation of a still-queued call
+        future.add_done_callback(lambda _: self._admitted.release())
+        return future
+
+    def call(self, fn, *args, timeout=None, **kwargs):
+        """Run fn(*args, **kwargs) on the pool and wait for it until the deadline"""
+        return self._call(lambda remaining: fn(*args, **kwargs), timeout, hedge=False)
+
+    def _check_breaker(self):
+        if self.breaker is not None and not self.breaker.allow():
+            raise GatewayUnavailable("AI model is temporarily unavailable, please try again shortly",
+                                     self.breaker.retry_after())
+
+    def _record(self, ok):
+        if self.breaker is not None:
+            self.breaker.record(ok)
+
+    def _release(self):
+        if self.breaker is not None:
+            self.breaker.release()
+
+    def _retry_delay(self, error, attempt, deadline):
+        """Seconds to back off before another attempt, or None to give up"""
+        if attempt >= self.max_retries or not is_retryable(error):
+            return None
+        delay = backoff_delay(attempt)
+        if deadline - time.monotonic() - delay < self.min_attempt_seconds:
+            return None
+        return delay
+
+    def _call(self, request, timeout, hedge=True):
+        """Run request(remaining_seconds) with retries, hedging and the breaker, all within one deadline"""
+        timeout = self.default_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        attempt = 0
+        while True:
+            self._check_breaker()
+            try:
+                result = self._attempt(request, deadline, hedge)
+            except GatewayBusy:
+                # Never reached the model, so it says nothing about upstream health
+                self._release()
+                raise
+            except GatewayTimeout:
+                self._record(False)
+                with self._lock:
+                    self._timeouts += 1
+                raise GatewayTimeout(f"AI model did not respond within {timeout}s")
+            except Exception as e:
+                self._record(False)
+                delay = self._retry_delay(e, attempt, deadline)
+                if delay is None:
+                    with self._lock:
+                        self._failed += 1
+                    raise
+                log.warning("LLM call failed, retrying", extra={'error': str(e), 'attempt': attempt + 1,
+                                                                'delay_ms': round(delay * 1000)})
+                LLM_RETRIES.inc()
+                with self._lock:
+                    self._retries += 1
+                attempt += 1
+                time.sleep(delay)
+                continue
+            self._record(True)
+            with self._lock:
+                self._completed += 1
+            return result
+
+    def _should_hedge(self, hedge, deadline):
+        if not hedge or self.hedge_after is None:
+            return False
+        if self.breaker is not None and self.breaker.state != CLOSED:
+            return False
+        with self._lock:
+            spare = self._in_flight < self.max_concurrency // 2
+        return spare and deadline - time.monotonic() > self.hedge_after
+
+    def _attempt(self, request, deadline, hedge):
+        executor = self.executor
+        primary = self._submit(executor, request, deadline - time.monotonic())
+        pending = {primary}
+        hedge = self._should_hedge(hedge, deadline)
+        error = None
+        try:
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise GatewayTimeout("deadline exceeded")
+                wait_for = min(remaining, self.hedge_after) if hedge else remaining
+                done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+                if not done:
+                    if not hedge:
+                        raise GatewayTimeout("deadline exceeded")
+                    hedge = False
+                    try:
+                        pending.add(self._submit(executor, request, deadline - time.monotonic()))
+                    except GatewayBusy:
+                        continue
+                    LLM_HEDGES.inc(outcome='sent')
+                    with self._lock:
+                        self._hedges += 1
+                    continue
+                hedge = False
+                for future in done:
+                    if future.exception() is None:
+                        if future is not primary:
+                            LLM_HEDGES.inc(outcome='won')
+                            with self._lock:
+                                self._hedge_wins += 1
+                        return future.result()
+                    error = future.exception()
+            raise error
+        finally:
+            # A still-queued loser is dropped; a running one finishes in the background
+            for future in pending:
+                future.cancel()
+
+    def generate(self, prompt, timeout=None):
+        """One-shot generate_content; returns the response text"""
+        with _CallMetrics('generate', prompt, self.listeners) as call_metrics:
+            response = self._call(
+                lambda remaining: self.model.generate_content(prompt, request_options={'timeout': remaining}),
+                timeout
+            )
+            call_metrics.record_tokens(response)
+        return response.text
+
+    def chat(self, question, history=None, timeout=None):
+        """Send one message in a chat seeded with history; returns the response text"""
+        def send(remaining):
+            chat = self.model.start_chat(history=history or [])
+            return chat.send_message(question, request_options={'timeout': remaining})
+
+        with _CallMetrics('chat', _history_text(history) + question, self.listeners) as call_metrics:
+            response = self._call(send, timeout)
+            call_metrics.record_tokens(response)
+        return response.text
+
+    def stream_chat(self, question, history=None, timeout=None):
+        """Yield response text chunks as the model produces them.
+
+        The upstream iterator runs on the pool and hands chunks over a queue,
+        so the whole stream shares one deadline and one concurrency slot.
+        Failures before the first chunk are retried like other calls; once
+        text has been sent, errors are final.
+        """
+        timeout = self.default_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        with _CallMetrics('stream', _history_text(history) + question, self.listeners) as call_metrics:
+            started = time.perf_counter()
+            parts = []
+            attempt = 0
+            while True:
+                self._check_breaker()
+                recorded = False
+                try:
+                    for text in self._stream_chunks(question, history, deadline, timeout):
+                        if not parts:
+                            LLM_TIME_TO_FIRST_TOKEN.observe(time.perf_counter() - started, kind='stream')
+                        parts.append(text)
+                        yield text
+                    recorded = True
+                except GatewayBusy:
+                    raise
+                except Exception as e:
+                    recorded = True
+                    self._record(False)
+                    delay = None if parts or isinstance(e, GatewayTimeout) else self._retry_delay(e, attempt, deadline)
+                    if delay is None:
+                        with self._lock:
+                            if isinstance(e, GatewayTimeout):
+                                self._timeouts += 1
+                            else:
+                                self._failed += 1
+                        raise
+                    LLM_RETRIES.inc()
+                    with self._lock:
+                        self._retries += 1
+                    attempt += 1
+                    time.sleep(delay)
+                    continue
+                finally:
+                    if not recorded:
+                        # Client disconnect (GeneratorExit) or a full pool: free the breaker slot
+                        self._release()
+                self._record(True)
+                with self._lock:
+                    self._completed += 1
+                break
+            call_metrics.record_tokens(text=''.join(parts))
+
+    def _stream_chunks(self, question, history, deadline, timeout):
+        chunks = queue.Queue()
+
+        def produce(remaining):
+            try:
+                chat = self.model.start_chat(history=history or [])
+                for chunk in chat.send_message(question, stream=True, request_options={'timeout': remaining}):
+                    chunks.put(chunk.text)
+                chunks.put(_DONE)
+            except Exception as e:
+                chunks.put(e)
+
+        self._submit(self.executor, produce, deadline - time.monotonic())
+
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                item = chunks.get(timeout=max(remaining, 0))
+            except queue.Empty:
+                raise GatewayTimeout(f"AI model did not finish within {timeout}s")
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            if item:
+                yield item
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_concurrency': self.max_concurrency,
+                'max_pending': self.max_pending,
+                'default_timeout': self.default_timeout,
+                'in_flight': self._in_flight,
+                'calls': self._calls,
+                'completed': self._completed,
+                'failed': self._failed,
+                'timeouts': self._timeouts,
+                'rejected': self._rejected,
+                'retries': self._retries,
+                'hedges': self._hedges,
+                'hedge_wins': self._hedge_wins,
+                'busy_seconds': round(self._busy_seconds, 3)
+            }
@@ -0,0 +1,210 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+
+
+# Values of these keys never reach the log output
+SENSITIVE_KEYS = {
+    'password', 'confirm_password', 'password_hash', 'secret', 'secret_key', 'token', 'api_key',
+    'authorization', 'cookie', 'set-cookie', 'session'
+}
+# Values of these keys are partially masked
+MASKED_KEYS = {'email'}
+REDACTED = '[redacted]'
+
+_EMAIL = re.compile(r"([A-Za-z0-9._%+-])[A-Za-z0-9._%+-]*@([A-Za-z0-9.-]+)")
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def mask_email(value):
+    return _EMAIL.sub(r"\1***@\2", str(value))
+
+
+def redact(value, key=None):
+    """Copy of value with sensitive keys dropped and e-mail addresses masked, recursively"""
+    if key is not None:
+        lowered = str(key).lower()
+        if lowered in SENSITIVE_KEYS:
+            return REDACTED
+        if lowered in MASKED_KEYS:
+            return mask_email(value)
+    if isinstance(value, dict):
+        return {k: redact(v, k) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(v) for v in value]
+    if isinstance(value, str):
+        return mask_email(value)
+    return value
+
+
+class RequestContextFilter(logging.Filter):
+    """Tags records logged inside a Flask request with its request id, route and method"""
+
+    def filter(self, record):
+        from flask import g, has_request_context, request
+
+        if has_request_context():
+            record.request_id = g.get('request_id')
+            if not hasattr(record, 'route'):
+                record.route = request.url_rule.rule if request.url_rule else '<unmatched>'
+            record.method = request.method
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a random fraction of records below WARNING.
+
+    ``level_rates`` maps level names to the fraction kept (default 1.0).
+    ``route_rates`` overrides it for records tagged with a route. Warnings
+    and errors are never dropped. Kept records carry ``sample_rate``
+    whenever it is below 1, so counts can be scaled back up.
+    """
+
+    def __init__(self, level_rates=None, route_rates=None):
+        super().__init__()
+        self.level_rates = level_rates or {}
+        self.route_rates = route_rates or {}
+        self.dropped = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.route_rates.get(getattr(record, 'route', None), self.level_rates.get(record.levelname, 1.0))
+        if rate >= 1.0:
+            return True
+        if rate > 0 and random.random() < rate:
+            record.sample_rate = rate
+            return True
+        self.dropped += 1
+        return False
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, any extra fields (redacted), exc"""
+
+    def format(self, record):
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': mask_email(record.getMessage())
+        }
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRS and not key.startswith('_') and value is not None:
+                entry[key] = redact(value, key)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class BackgroundHandler(logging.handlers.QueueHandler):
+    """Hands records to a bounded queue drained by a per-process writer thread.
+
+    Request threads never block on log I/O. When the queue is full the
+    record is dropped and counted instead. The writer thread is started
+    lazily in each process, so the handler can be installed before
+    gunicorn forks.
+    """
+
+    def __init__(self, handlers, max_queue=10000):
+        super().__init__(queue.Queue(max_queue))
+        self.targets = handlers
+        self.max_queue = max_queue
+        self.dropped = 0
+        self._listener = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_listener(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Records queued by the parent before fork are its to write
+            self.queue = queue.Queue(self.max_queue)
+            self._listener = logging.handlers.QueueListener(self.queue, *self.targets, respect_handler_level=True)
+            self._listener.start()
+            self._pid = os.getpid()
+            atexit.register(self.stop)
+
+    def prepare(self, record):
+        # Only the cheap part runs on the request thread: freeze the message and any traceback
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self):
+        """Flush what is queued and stop the writer thread of this process"""
+        with self._lock:
+            if self._listener is not None and self._pid == os.getpid():
+                self._listener.stop()
+                self._listener = None
+                self._pid = None
+
+    def stats(self):
+        return {'queued': self.queue.qsize(), 'max_queue': self.max_queue, 'dropped': self.dropped}
+
+
+def parse_rates(text):
+    """'DEBUG=0.01,/api/user/stats=0.1' -> {'DEBUG': 0.01, '/api/user/stats': 0.1}"""
+    rates = {}
+    for part in (text or '').split(','):
+        if '=' in part:
+            name, value = part.rsplit('=', 1)
+            rates[name.strip()] = float(value)
+    return rates
+
+
+def setup_logging(level=None, fmt=None, level_rates=None, route_rates=None, max_queue=None, stream=None):
+    """Route every logger through one BackgroundHandler on the root logger.
+
+    Defaults come from LOG_LEVEL (INFO), LOG_FORMAT (json or text),
+    LOG_SAMPLE_RATES (e.g. 'DEBUG=0.01'), LOG_ROUTE_SAMPLE_RATES
+    (e.g. '/api/user/stats=0.1,/metrics=0') and LOG_QUEUE_SIZE (10000).
+    Returns the handler, whose filters and stats() expose the drop counts.
+    """
+    level = level or os.getenv('LOG_LEVEL', 'INFO')
+    fmt = fmt or os.getenv('LOG_FORMAT', 'json')
+    level_rates = parse_rates(os.getenv('LOG_SAMPLE_RATES')) if level_rates is None else level_rates
+    route_rates = parse_rates(os.getenv('LOG_ROUTE_SAMPLE_RATES')) if route_rates is None else route_rates
+    max_queue = max_queue or int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+
+    target = logging.StreamHandler(stream or sys.stderr)
+    if fmt == 'json':
+        target.setFormatter(JsonFormatter())
+    else:
+        target.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s",
+                                              defaults={'request_id': '-'}))
+
+    handler = BackgroundHandler([target], max_queue=max_queue)
+    handler.addFilter(RequestContextFilter())
+    handler.sampling = SamplingFilter(level_rates, route_rates)
+    handler.addFilter(handler.sampling)
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        if isinstance(existing, BackgroundHandler):
+            existing.stop()
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+    return handler
@@ -0,0 +1,369 @@
+import bisect
+import hashlib
+import heapq
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+
+log = logging.getLogger(__name__)
+
+
+class MemoryDatabase:
+    """In-process stand-in for Database, used for offline benchmarks and local runs.
+
+    It implements the same public methods with dicts and lists behind one
+    lock. DB_FAKE_LATENCY_MS adds a simulated round-trip to every call.
+    There is no SQL connection, so callers go through these methods only.
+    """
+
+    def __init__(self, latency_ms=None):
+        if latency_ms is None:
+            latency_ms = float(os.getenv('DB_FAKE_LATENCY_MS', '0'))
+        self.latency = latency_ms / 1000
+        self.host = 'memory'
+        self.database = 'memory'
+        self._lock = threading.Lock()
+        self.users = {}
+        self.users_by_email = {}
+        self.symptoms_history = []
+        self.ai_consultations = []
+        self.medicine_reminders = {}
+        # Mirrors of idx_reminders_active_time and idx_reminders_updated
+        self._reminder_index = []
+        self._reminder_changes = []
+        self._reminder_ids = 0
+        # Like AUTO_INCREMENT, ids are never reused after rows are archived and dropped
+        self._history_ids = {'symptoms_history': 0, 'ai_consultations': 0}
+        self.user_stats = {}
+        self.queries = 0
+
+    def _round_trip(self):
+        with self._lock:
+            self.queries += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def pool_stats(self):
+        return {'backend': 'memory', 'queries': self.queries}
+
+    def create_tables(self):
+        log.info("tables created")
+
+    def register_user(self, user_name, contact_number, email, password):
+        self._round_trip()
+        with self._lock:
+            if email in self.users_by_email:
+                return {"success": False, "message": "Email already registered"}
+            user_id = len(self.users) + 1
+            user = {
+                'id': user_id,
+                'user_name': user_name,
+                'contact_number': contact_number,
+                'email': email,
+                'password_hash': hashlib.sha256(password.encode()).hexdigest(),
+                'created_at': datetime.now()
+            }
+            self.users[user_id] = user
+            self.users_by_email[email] = user
+        return {"success": True, "message": "Registration successful", "user_id": user_id}
+
+    def get_users(self):
+        self._round_trip()
+        with self._lock:
+            return [dict(user) for user in self.users.values()]
+
+    def check_login(self, email, password):
+        self._round_trip()
+        user = self.users_by_email.get(email)
+        if user and user['password_hash'] == hashlib.sha256(password.encode()).hexdigest():
+            return dict(user)
+        return None
+
+    def _bump(self, user_id, column, delta=1):
+        stats = self.user_stats.setdefault(
+            user_id, {'symptom_checks': 0, 'ai_consultations': 0, 'active_reminders': 0}
+        )
+        stats[column] = max(stats[column] + delta, 0)
+
+    def get_user_stats(self, user_id):
+        self._round_trip()
+        with self._lock:
+            stats = dict(self.user_stats.get(
+                user_id, {'symptom_checks': 0, 'ai_consultations': 0, 'active_reminders': 0}
+            ))
+        stats['health_score'] = min(85 + (stats['symptom_checks'] * 2), 100)
+        return stats
+
+    def add_symptom_check(self, user_id, symptoms, analysis_result=None):
+        self.add_history_batch([(user_id, symptoms, str(analysis_result), datetime.now())], [])
+        return {"success": True, "message": "Symptom check recorded"}
+
+    def add_symptom_checks(self, user_id, checks):
+        now = datetime.now()
+        self.add_history_batch([(user_id, symptoms, str(result), now) for symptoms, result in checks], [])
+        return {"success": True, "message": "Symptom checks recorded", "count": len(checks)}
+
+    def add_ai_consultation(self, user_id, question, response, conversation_id=None):
+        self.add_history_batch([], [(user_id, conversation_id, question, response, datetime.now())])
+        return {"success": True, "message": "AI consultation recorded"}
+
+    # Errors caused by the rows themselves (see HistoryWriter), like Database.ROW_ERRORS
+    ROW_ERRORS = (ValueError,)
+
+    def add_history_batch(self, symptom_rows=(), consultation_rows=()):
+        self._round_trip()
+        with self._lock:
+            # The foreign keys on user_id: one unknown user fails the whole batch
+            for row in list(symptom_rows) + list(consultation_rows):
+                if row[0] not in self.users:
+                    raise ValueError(f"Cannot add history for unknown user {row[0]}")
+            for user_id, symptoms, analysis, created_at in symptom_rows:
+                self._history_ids['symptoms_history'] += 1
+                self.symptoms_history.append({
+                    'id': self._history_ids['symptoms_history'],
+                    'user_id': user_id,
+                    'symptoms': symptoms,
+                    'analysis_result': analysis,
+                    'created_at': created_at
+                })
+                self._bump(user_id, 'symptom_checks')
+            for user_id, conversation_id, question, response, created_at in consultation_rows:
+                self._history_ids['ai_consultations'] += 1
+                self.ai_consultations.append({
+                    'id': self._history_ids['ai_consultations'],
+                    'user_id': user_id,
+                    'conversation_id': conversation_id,
+                    'question': question,
+                    'response': response,
+                    'created_at': created_at
+                })
+                self._bump(user_id, 'ai_consultations')
+
+    def get_conversation_turns(self, user_id, conversation_id, limit=20, after_id=0):
+        self._round_trip()
+        with self._lock:
+            rows = [r for r in self.ai_consultations
+                    if r['user_id'] == user_id and r['conversation_id'] == conversation_id and r['id'] > after_id]
+        return [(r['id'], r['question'], r['response'] or '') for r in rows[-limit:]]
+
+    def _history_page(self, rows, columns, user_id, limit, before, since, until):
+        self._round_trip()
+        with self._lock:
+            matching = [r for r in rows if r['user_id'] == user_id
+                        and (since is None or r['created_at'] >= since)
+                        and (until is None or r['created_at'] < until)
+                        and (before is None or (r['created_at'], r['id']) < tuple(before))]
+        page = heapq.nlargest(limit + 1, matching, key=lambda r: (r['created_at'], r['id']))
+        return [{c: r[c] for c in columns} for r in page[:limit]], len(page) > limit
+
+    def get_symptom_history(self, user_id, limit=20, before=None, since=None, until=None):
+        return self._history_page(self.symptoms_history, ('id', 'symptoms', 'analysis_result', 'created_at'),
+                                  user_id, limit, before, since, until)
+
+    def get_consultation_history(self, user_id, limit=20, before=None, since=None, until=None):
+        return self._history_page(self.ai_consultations,
+                                  ('id', 'conversation_id', 'question', 'response', 'created_at'),
+                                  user_id, limit, before, since, until)
+
+    def get_dashboard_snapshot(self, user_id, recent=5):
+        self._round_trip()
+        with self._lock:
+            stats = dict(self.user_stats.get(
+                user_id, {'symptom_checks': 0, 'ai_consultations': 0, 'active_reminders': 0}
+            ))
+            stats['health_score'] = min(85 + (stats['symptom_checks'] * 2), 100)
+            snapshot = {'stats': stats}
+            for key, rows, columns in (
+                ('symptom_checks', self.symptoms_history, ('id', 'symptoms', 'analysis_result', 'created_at')),
+                ('consultations', self.ai_consultations,
+                 ('id', 'conversation_id', 'question', 'response', 'created_at'))
+            ):
+                newest = heapq.nlargest(recent, (r for r in rows if r['user_id'] == user_id),
+                                        key=lambda r: (r['created_at'], r['id']))
+                snapshot[key] = [{c: r[c] for c in columns} for r in newest]
+            reminders = [dict(r) for r in self.medicine_reminders.values()
+                         if r['user_id'] == user_id and r['is_active']]
+        snapshot['reminders'] = sorted(
+            reminders, key=lambda r: (r['reminder_time'] is not None, r['reminder_time'] or 0, r['id']))
+        return snapshot
+
+    def iter_user_history(self, table, user_id, since=None, until=None, chunk_rows=5000, batch_size=500):
+        rows, columns = self._history_table(table)
+        self._round_trip()
+        with self._lock:
+            matching = [r for r in rows if r['user_id'] == user_id
+                        and (since is None or r['created_at'] >= since)
+                        and (until is None or r['created_at'] < until)]
+        matching.sort(key=lambda r: (r['created_at'], r['id']))
+        for row in matching:
+            yield {c: row[c] for c in columns}
+
+    def _index_reminder(self, row, add):
+        if row['reminder_time'] is None:
+            return
+        entry = (row['reminder_time'], row['id'])
+        if add:
+            bisect.insort(self._reminder_index, entry)
+        else:
+            i = bisect.bisect_left(self._reminder_index, entry)
+            if i < len(self._reminder_index) and self._reminder_index[i] == entry:
+                del self._reminder_index[i]
+
+    def _touch_reminder(self, row):
+        row['updated_at'] = datetime.now()
+        self._reminder_changes.append((row['updated_at'], row['id']))
+
+    def add_reminder(self, user_id, medicine_name, dosage=None, schedule='daily', reminder_time=None, is_active=True):
+        self._round_trip()
+        with self._lock:
+            self._reminder_ids += 1
+            row = {
+                'id': self._reminder_ids,
+                'user_id': user_id,
+                'medicine_name': medicine_name,
+                'dosage': dosage,
+                'schedule': schedule,
+                'reminder_time': reminder_time,
+                'is_active': bool(is_active),
+                'created_at': datetime.now(),
+                'last_notified_at': None
+            }
+            self._touch_reminder(row)
+            self.medicine_reminders[row['id']] = row
+            if row['is_active']:
+                self._index_reminder(row, True)
+                self._bump(user_id, 'active_reminders')
+            return dict(row)
+
+    def get_reminders(self, user_id):
+        self._round_trip()
+        with self._lock:
+            rows = [dict(r) for r in self.medicine_reminders.values() if r['user_id'] == user_id]
+        return sorted(rows, key=lambda r: (r['reminder_time'] is not None, r['reminder_time'] or 0, r['id']))
+
+    def update_reminder(self, user_id, reminder_id, **fields):
+        self._round_trip()
+        with self._lock:
+            row = self.medicine_reminders.get(reminder_id)
+            if row is None or row['user_id'] != user_id:
+                return None
+            if row['is_active']:
+                self._index_reminder(row, False)
+            was_active = row['is_active']
+            for key, value in fields.items():
+                if key in ('medicine_name', 'dosage', 'schedule', 'reminder_time', 'is_active'):
+                    row[key] = bool(value) if key == 'is_active' else value
+            if row['is_active']:
+                self._index_reminder(row, True)
+            if row['is_active'] != was_active:
+                self._bump(user_id, 'active_reminders', 1 if row['is_active'] else -1)
+            self._touch_reminder(row)
+            return dict(row)
+
+    def delete_reminder(self, user_id, reminder_id):
+        self._round_trip()
+        with self._lock:
+            row = self.medicine_reminders.get(reminder_id)
+            if row is None or row['user_id'] != user_id:
+                return False
+            del self.medicine_reminders[reminder_id]
+            if row['is_active']:
+                self._index_reminder(row, False)
+                self._bump(user_id, 'active_reminders', -1)
+            return True
+
+    def get_active_reminders_between(self, start, end, after=None, limit=5000):
+        self._round_trip()
+        with self._lock:
+            low = bisect.bisect_right(self._reminder_index, tuple(after)) if after else \
+                bisect.bisect_left(self._reminder_index, (start, 0))
+            rows = []
+            for reminder_time, reminder_id in self._reminder_index[low:]:
+                if (end is not None and reminder_time >= end) or len(rows) >= limit:
+                    break
+                if reminder_time >= start:
+                    rows.append(dict(self.medicine_reminders[reminder_id]))
+        return rows
+
+    def get_reminders_by_ids(self, ids):
+        self._round_trip()
+        with self._lock:
+            return [dict(self.medicine_reminders[i]) for i in ids if i in self.medicine_reminders]
+
+    def get_reminders_changed_since(self, since, after_id=0, limit=5000):
+        self._round_trip()
+        with self._lock:
+            low = bisect.bisect_right(self._reminder_changes, (since, after_id))
+            ids = dict.fromkeys(reminder_id for _, reminder_id in self._reminder_changes[low:low + limit])
+            return [dict(self.medicine_reminders[i]) for i in ids if i in self.medicine_reminders]
+
+    def mark_reminders_sent(self, ids, sent_at):
+        self._round_trip()
+        with self._lock:
+            for reminder_id in ids:
+                if reminder_id in self.medicine_reminders:
+                    self.medicine_reminders[reminder_id]['last_notified_at'] = sent_at
+
+    def rebuild_user_stats(self, archived=None):
+        with self._lock:
+            self.user_stats = {}
+            for row in self.symptoms_history:
+                self._bump(row['user_id'], 'symptom_checks')
+            for row in self.ai_consultations:
+                self._bump(row['user_id'], 'ai_consultations')
+            for row in self.medicine_reminders.values():
+                if row['is_active']:
+                    self._bump(row['user_id'], 'active_reminders')
+            for user_id, counts in (archived or {}).items():
+                for column, rows in counts.items():
+                    self._bump(user_id, column, rows)
+            return len(self.user_stats)
+
+    # Calendar months of created_at stand in for the MySQL history partitions
+    def _history_table(self, table):
+        if table == 'symptoms_history':
+            return self.symptoms_history, ('id', 'symptoms', 'analysis_result', 'created_at')
+        if table == 'ai_consultations':
+            return self.ai_consultations, ('id', 'conversation_id', 'question', 'response', 'created_at')
+        raise ValueError(f"Not a history table: {table}")
+
+    @staticmethod
+    def _in_partition(row, name):
+        return f"p{row['created_at']:%Y%m}" == name
+
+    def history_partitions(self, table):
+        rows, _ = self._history_table(table)
+        self._round_trip()
+        with self._lock:
+            months = sorted({row['created_at'].date().replace(day=1) for row in rows})
+        return [(f"p{month:%Y%m}", month) for month in months]
+
+    def partition_history_tables(self, months_ahead=3):
+        return {}
+
+    def ensure_history_partitions(self, months_ahead=3):
+        return {}
+
+    def count_history_partition(self, table, name):
+        rows, _ = self._history_table(table)
+        self._round_trip()
+        with self._lock:
+            return sum(1 for row in rows if self._in_partition(row, name))
+
+    def iter_history_partition(self, table, name, batch_size=1000):
+        rows, columns = self._history_table(table)
+        self._round_trip()
+        with self._lock:
+            matching = sorted((row for row in rows if self._in_partition(row, name)),
+                              key=lambda row: (row['user_id'], row['created_at'], row['id']))
+        for row in matching:
+            yield {'user_id': row['user_id'], **{c: row[c] for c in columns}}
+
+    def drop_history_partition(self, table, name):
+        rows, _ = self._history_table(table)
+        self._round_trip()
+        with self._lock:
+            rows[:] = [row for row in rows if not self._in_partition(row, name)]
@@ -0,0 +1,377 @@
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from functools import wraps
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: folding runs unlocked
+    fcntl = None
+
+
+log = logging.getLogger(__name__)
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, '')) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(k), v] for k, v in self._values.items()]
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, '')) for n in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, then sum and count
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def time(self, **labels):
+        """Context manager that observes the wall time of its block"""
+        histogram = self
+
+        class _Timer:
+            def __enter__(self):
+                self.started = time.perf_counter()
+                return self
+
+            def __exit__(self, *exc):
+                histogram.observe(time.perf_counter() - self.started, **labels)
+
+        return _Timer()
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(k), list(v)] for k, v in self._values.items()]
+
+
+class MetricsRegistry:
+    """Process-local metrics rendered in the Prometheus text format.
+
+    With ``directory`` set (METRICS_DIR), every worker writes its counters,
+    histograms and gauges to <directory>/metrics-<pid>.json every
+    ``flush_interval`` seconds and on each scrape. /metrics on any worker
+    merges all files. Counters and histograms are summed across workers.
+    Gauges are reported per worker with a ``pid`` label.
+
+    Files of workers that have exited are folded into archived.json
+    (counters and histograms only) and deleted, so totals stay monotonic
+    across worker restarts and a recycled pid never overwrites a dead
+    worker's counts. Folding runs under a file lock when a flusher
+    starts and on each scrape.
+    """
+
+    def __init__(self, directory=None, flush_interval=5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._metrics = []
+        self._gauge_sources = []
+        self._lock = threading.Lock()
+        self._flusher_pid = None
+        self._writer_pid = None
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_stats(self, prefix, documentation, stats_fn):
+        """Expose every numeric value of stats_fn() as a gauge named <prefix>_<key>"""
+        self._gauge_sources.append((prefix, documentation, stats_fn))
+
+    def _collect_gauges(self):
+        gauges = {}
+        for prefix, documentation, stats_fn in self._gauge_sources:
+            try:
+                stats = stats_fn()
+            except Exception as e:
+                log.warning("metrics gauge %s failed: %s", prefix, e)
+                continue
+            for key, value in stats.items():
+                if isinstance(value, bool):
+                    value = int(value)
+                if isinstance(value, (int, float)):
+                    gauges[f"{prefix}_{key}"] = [documentation, value]
+        return gauges
+
+    def snapshot(self):
+        return {
+            'pid': os.getpid(),
+            'counters': {m.name: [m.documentation, list(m.labelnames), m.snapshot()]
+                         for m in self._metrics if isinstance(m, Counter)},
+            'histograms': {m.name: [m.documentation, list(m.labelnames), list(m.buckets), m.snapshot()]
+                           for m in self._metrics if isinstance(m, Histogram)},
+            'gauges': self._collect_gauges()
+        }
+
+    def _snapshot_path(self, pid):
+        return os.path.join(self.directory, f"metrics-{pid}.json")
+
+    def _archive_path(self):
+        return os.path.join(self.directory, 'archived.json')
+
+    @staticmethod
+    def _write_json(path, data):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _read_json(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _locked(self):
+        """Exclusive lock on <directory>/metrics.lock, held while the returned file is open"""
+        lock_file = open(os.path.join(self.directory, 'metrics.lock'), 'a')
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    def fold_dead_workers(self, pids=()):
+        """Move the counters of exited workers (and of ``pids``) into archived.json and delete their files"""
+        if not self.directory:
+            return 0
+        os.makedirs(self.directory, exist_ok=True)
+        with self._locked():
+            stale = []
+            for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+                snap = self._read_json(path)
+                if snap is None:
+                    continue
+                if snap['pid'] in pids or not self._alive(snap['pid']):
+                    stale.append((path, snap))
+            if not stale:
+                return 0
+            archive = self._read_json(self._archive_path()) or {'pid': None, 'counters': {}, 'histograms': {}, 'gauges': {}}
+            counters, histograms = _merge([archive] + [snap for _, snap in stale])
+            archive['counters'] = {name: [doc, labelnames, [[list(k), v] for k, v in values.items()]]
+                                   for name, (doc, labelnames, values) in counters.items()}
+            archive['histograms'] = {name: [doc, labelnames, buckets, [[list(k), v] for k, v in values.items()]]
+                                     for name, (doc, labelnames, buckets, values) in histograms.items()}
+            # Archive first: a crash before the deletes double counts once instead of losing counts
+            self._write_json(self._archive_path(), archive)
+            for path, _ in stale:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        log.info("metrics: folded %d exited worker snapshot(s) into %s", len(stale), self._archive_path())
+        return len(stale)
+
+    def write_snapshot(self):
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        if self._writer_pid != os.getpid():
+            # A file already at our path belongs to an earlier process that had this pid
+            self.fold_dead_workers(pids=(os.getpid(),))
+            self._writer_pid = os.getpid()
+        self._write_json(self._snapshot_path(os.getpid()), self.snapshot())
+
+    def start_flusher(self):
+        """Start (once per process) the thread that publishes this worker's snapshot"""
+        if not self.directory or self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        try:
+            self.fold_dead_workers()
+        except OSError as e:
+            log.warning("metrics cleanup failed: %s", e)
+
+        def run():
+            while True:
+                time.sleep(self.flush_interval)
+                try:
+                    self.write_snapshot()
+                except OSError as e:
+                    log.warning("metrics flush failed: %s", e)
+
+        threading.Thread(target=run, name='metrics-flusher', daemon=True).start()
+
+    def _load_snapshots(self):
+        if not self.directory:
+            return [self.snapshot()]
+        self.write_snapshot()
+        self.fold_dead_workers()
+        snapshots = []
+        with self._locked():
+            for path in [self._archive_path()] + glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+                snap = self._read_json(path)
+                if snap is not None:
+                    snapshots.append(snap)
+        return snapshots
+
+    @staticmethod
+    def _alive(pid):
+        if pid is None:
+            return False
+        if pid == os.getpid():
+            return True
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except OSError:
+            pass
+        return True
+
+    def render(self):
+        """Prometheus text exposition of all workers' metrics"""
+        snapshots = self._load_snapshots()
+        counters, histograms = _merge(snapshots)
+        gauges = {}
+        for snap in snapshots:
+            if self._alive(snap['pid']):
+                for name, (doc, value) in snap['gauges'].items():
+                    gauges.setdefault(name, [doc, []])[1].append((snap['pid'], value))
+
+        lines = []
+        for name, (doc, labelnames, values) in sorted(counters.items()):
+            lines.append(f"# HELP {name} {doc}")
+            lines.append(f"# TYPE {name} counter")
+            for key, value in sorted(values.items()):
+                lines.append(f"{name}{_format_labels(labelnames, key)} {value}")
+        for name, (doc, labelnames, buckets, values) in sorted(histograms.items()):
+            lines.append(f"# HELP {name} {doc}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, state in sorted(values.items()):
+                cumulative = 0
+                for bound, count in zip(buckets, state):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(labelnames, key, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(labelnames, key, [('le', '+Inf')])} {state[-1]}")
+                lines.append(f"{name}_sum{_format_labels(labelnames, key)} {state[-2]}")
+                lines.append(f"{name}_count{_format_labels(labelnames, key)} {state[-1]}")
+        for name, (doc, values) in sorted(gauges.items()):
+            lines.append(f"# HELP {name} {doc}")
+            lines.append(f"# TYPE {name} gauge")
+            for pid, value in sorted(values):
+                lines.append(f'{name}{{pid="{pid}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _merge(snapshots):
+    """Counters and histograms of several snapshots summed per metric and label set"""
+    counters, histograms = {}, {}
+    for snap in snapshots:
+        for name, (doc, labelnames, values) in snap['counters'].items():
+            merged = counters.setdefault(name, [doc, labelnames, {}])[2]
+            for key, value in values:
+                merged[tuple(key)] = merged.get(tuple(key), 0) + value
+        for name, (doc, labelnames, buckets, values) in snap['histograms'].items():
+            merged = histograms.setdefault(name, [doc, labelnames, buckets, {}])[3]
+            for key, state in values:
+                current = merged.get(tuple(key))
+                merged[tuple(key)] = state if current is None else [a + b for a, b in zip(current, state)]
+    return counters, histograms
+
+
+def instrument(obj, method_names, histogram, label='method'):
+    """Wrap obj's methods so each call's duration is observed in histogram"""
+    for name in method_names:
+        method = getattr(obj, name, None)
+        if method is None:
+            continue
+
+        def make_wrapper(method, name):
+            @wraps(method)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - started, **{label: name})
+            return wrapper
+
+        setattr(obj, name, make_wrapper(method, name))
+
+
+REGISTRY = MetricsRegistry(
+    directory=os.getenv('METRICS_DIR'),
+    flush_interval=float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+)
+
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    'http_request_duration_seconds', "Time spent handling HTTP requests",
+    ('route', 'method', 'status')
+)
+DB_CALL_DURATION = REGISTRY.histogram(
+    'db_call_duration_seconds', "Duration of Database method calls", ('method',)
+)
+LLM_CALL_DURATION = REGISTRY.histogram(
+    'llm_call_duration_seconds', "Duration of model calls made through the LLM gateway",
+    ('kind', 'outcome')
+)
+LLM_TIME_TO_FIRST_TOKEN = REGISTRY.histogram(
+    'llm_time_to_first_token_seconds', "Time until the first streamed chunk arrives", ('kind',)
+)
+LLM_TOKENS = REGISTRY.counter(
+    'llm_tokens_total', "Model tokens by direction (usage metadata, or ~4 chars per token)",
+    ('kind', 'direction')
+)
+LLM_RETRIES = REGISTRY.counter('llm_retries_total', "Model calls retried after a transient upstream error")
+LLM_HEDGES = REGISTRY.counter(
+    'llm_hedges_total', "Hedged duplicate model requests sent, and how many answered first", ('outcome',)
+)
+ADMISSION_REJECTIONS = REGISTRY.counter(
+    'admission_rejections_total', "AI requests refused with 429 by admission control", ('reason',)
+)
+EXPORTS = REGISTRY.counter('exports_total', "History exports by outcome", ('format', 'outcome'))
+EXPORT_ROWS = REGISTRY.counter('export_rows_total', "History rows streamed by /api/export", ('format',))
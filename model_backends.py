@@ -0,0 +1,259 @@
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+
+
+class FakeUpstreamError(Exception):
+    """Injected upstream failure raised by FakeModel"""
+
+    # Treated like a Gemini 503, so it is retryable
+    code = 503
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+def _prompt_key(prompt, history=None):
+    payload = json.dumps({'prompt': prompt, 'history': history or []}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class FakeModel:
+    """Deterministic local stand-in for genai.GenerativeModel.
+
+    Latency is log-normal around ``latency_ms`` (spread ``latency_sigma``), and
+    streamed answers add ``token_ms`` per token after the first. A fraction
+    ``error_rate`` of calls raise FakeUpstreamError. Answers depend only on the
+    prompt, so runs are reproducible. Symptom prompts get valid analysis JSON,
+    packed batch prompts get a JSON array, and everything else gets prose.
+    """
+
+    def __init__(self, latency_ms=800, latency_sigma=0.5, token_ms=20, error_rate=0.0,
+                 answer_tokens=120, seed=None):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.token_ms = token_ms
+        self.error_rate = error_rate
+        self.answer_tokens = answer_tokens
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.calls = 0
+
+    @classmethod
+    def from_env(cls):
+        seed = os.getenv('FAKE_LLM_SEED')
+        return cls(
+            latency_ms=float(os.getenv('FAKE_LLM_LATENCY_MS', '800')),
+            latency_sigma=float(os.getenv('FAKE_LLM_LATENCY_SIGMA', '0.5')),
+            token_ms=float(os.getenv('FAKE_LLM_TOKEN_MS', '20')),
+            error_rate=float(os.getenv('FAKE_LLM_ERROR_RATE', '0')),
+            answer_tokens=int(os.getenv('FAKE_LLM_ANSWER_TOKENS', '120')),
+            seed=int(seed) if seed is not None else None
+        )
+
+    def _sample(self):
+        with self._rng_lock:
+            self.calls += 1
+            latency = self._rng.lognormvariate(0, self.latency_sigma) * self.latency_ms / 1000
+            failed = self._rng.random() < self.error_rate
+        return latency, failed
+
+    def _wait(self, seconds, request_options):
+        timeout = (request_options or {}).get('timeout')
+        if timeout is not None and seconds > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"Fake model exceeded request timeout of {timeout}s")
+        time.sleep(seconds)
+
+    def answer(self, prompt):
+        """The deterministic answer text for a prompt"""
+        digest = hashlib.sha256(prompt.encode()).hexdigest()
+        batch = re.search(r"following (\d+) numbered symptom descriptions", prompt)
+        if batch:
+            return json.dumps([self._analysis(f"{digest}{i}") for i in range(int(batch.group(1)))])
+        if 'Analyze these symptoms' in prompt:
+            return json.dumps(self._analysis(digest))
+        words = ['Stay', 'hydrated,', 'rest', 'well,', 'and', 'consult', 'a', 'doctor', 'if',
+                 'symptoms', 'persist.', 'A', 'balanced', 'diet', 'and', 'regular', 'exercise', 'help.']
+        offset = int(digest[:4], 16)
+        return ' '.join(words[(offset + i) % len(words)] for i in range(self.answer_tokens))
+
+    @staticmethod
+    def _analysis(digest):
+        severity = ['Low', 'Medium', 'High'][int(digest[0], 16) % 3]
+        return {
+            'conditions': [{'name': f"Condition {digest[:4]}", 'probability': f"{int(digest[4:6], 16) % 60 + 20}%"}],
+            'severity': severity,
+            'recommendations': "Rest, drink fluids and monitor your symptoms.",
+            'see_doctor': "If symptoms worsen or last more than three days.",
+            'home_remedies': "Warm fluids, honey and adequate sleep."
+        }
+
+    def _respond(self, prompt, stream, request_options):
+        latency, failed = self._sample()
+        if failed:
+            self._wait(latency / 2, request_options)
+            raise FakeUpstreamError("503 Service Unavailable (injected by FakeModel)")
+        text = self.answer(prompt)
+        if not stream:
+            self._wait(latency, request_options)
+            return FakeResponse(text)
+        return self._stream(text, latency, request_options)
+
+    def _stream(self, text, first_token_latency, request_options):
+        self._wait(first_token_latency, request_options)
+        tokens = text.split(' ')
+        for i in range(0, len(tokens), 4):
+            if i:
+                time.sleep(self.token_ms * 4 / 1000)
+            yield FakeResponse(' '.join(tokens[i:i + 4]) + (' ' if i + 4 < len(tokens) else ''))
+
+    def generate_content(self, prompt, stream=False, request_options=None):
+        return self._respond(prompt, stream, request_options)
+
+    def start_chat(self, history=None):
+        return FakeChat(self, history or [])
+
+
+class FakeChat:
+    def __init__(self, model, history):
+        self.model = model
+        self.history = history
+
+    def send_message(self, message, stream=False, request_options=None):
+        return self.model._respond(message, stream, request_options)
+
+
+class RecordingModel:
+    """Wraps a real model and appends every non-streamed answer to a JSONL file for later replay"""
+
+    def __init__(self, model, path):
+        self.model = model
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _record(self, prompt, history, text):
+        line = json.dumps({'key': _prompt_key(prompt, history), 'prompt': prompt, 'text': text})
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+    def generate_content(self, prompt, stream=False, request_options=None):
+        response = self.model.generate_content(prompt, stream=stream, request_options=request_options)
+        if not stream:
+            self._record(prompt, None, response.text)
+        return response
+
+    def start_chat(self, history=None):
+        return _RecordingChat(self, history or [])
+
+
+class _RecordingChat:
+    def __init__(self, recorder, history):
+        self.recorder = recorder
+        self.history = history
+        self.chat = recorder.model.start_chat(history=history)
+
+    def send_message(self, message, stream=False, request_options=None):
+        response = self.chat.send_message(message, stream=stream, request_options=request_options)
+        if not stream:
+            self.recorder._record(message, self.history, response.text)
+        return response
+
+
+class ReplayModel(FakeModel):
+    """FakeModel that answers from a RecordingModel JSONL file, falling back to fake answers"""
+
+    def __init__(self, path, **kwargs):
+        super().__init__(**kwargs)
+        self.recorded = {}
+        self.replayed = 0
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.recorded[entry['key']] = entry['text']
+
+    def _respond(self, prompt, stream, request_options, history=None):
+        text = self.recorded.get(_prompt_key(prompt, history))
+        if text is None:
+            return super()._respond(prompt, stream, request_options)
+        self.replayed += 1
+        latency, _ = self._sample()
+        if not stream:
+            self._wait(latency, request_options)
+            return FakeResponse(text)
+        return self._stream(text, latency, request_options)
+
+    def start_chat(self, history=None):
+        return _ReplayChat(self, history or [])
+
+
+class _ReplayChat:
+    def __init__(self, model, history):
+        self.model = model
+        self.history = history
+
+    def send_message(self, message, stream=False, request_options=None):
+        return self.model._respond(message, stream, request_options, self.history)
+
+
+def import_backend(backend=None):
+    """Import the client library of MODEL_BACKEND without configuring or connecting anything.
+
+    A gunicorn --preload master calls this so forked workers share the
+    already imported modules instead of each paying the import on first use.
+    """
+    backend = backend or os.getenv('MODEL_BACKEND', 'gemini')
+    if backend == 'gemini':
+        import google.generativeai  # noqa: F401
+
+
+def create_model(system_instruction, backend=None):
+    """Build the model named by MODEL_BACKEND: 'gemini' (default), 'fake' or 'replay'.
+
+    'replay' reads MODEL_REPLAY_FILE. With MODEL_RECORD_FILE set, Gemini
+    answers are also recorded to that file.
+    """
+    backend = backend or os.getenv('MODEL_BACKEND', 'gemini')
+
+    if backend == 'fake':
+        return FakeModel.from_env()
+
+    if backend == 'replay':
+        fake = FakeModel.from_env()
+        return ReplayModel(
+            os.environ['MODEL_REPLAY_FILE'],
+            latency_ms=fake.latency_ms,
+            latency_sigma=fake.latency_sigma,
+            token_ms=fake.token_ms,
+            error_rate=fake.error_rate
+        )
+
+    if backend != 'gemini':
+        raise ValueError(f"Unknown MODEL_BACKEND: {backend}")
+
+    import google.generativeai as genai
+
+    # Load API key from environment variables for security
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        raise EnvironmentError("Please set the GOOGLE_API_KEY environment variable")
+
+    genai.configure(api_key=api_key)
+
+    # Initialize the model with system instruction
+    model = genai.GenerativeModel(
+        model_name=os.getenv('GEMINI_MODEL', "gemini-2.5-flash"),
+        system_instruction=system_instruction
+    )
+
+    record_file = os.getenv('MODEL_RECORD_FILE')
+    if record_file:
+        model = RecordingModel(model, record_file)
+    return model
@@ -0,0 +1,77 @@
+import hashlib
+import threading
+
+from flask import Response, render_template, request, session
+
+
+class PageCache:
+    """Rendered HTML for templates whose output only depends on login state.
+
+    Each (template, logged in?) variant is rendered once per worker and then
+    served from memory with a strong ETag, so repeat visits get a 304 and
+    first visits skip Jinja entirely. When templates auto-reload (debug
+    mode), stale entries are re-rendered as soon as the template file
+    changes. ``version_fn`` adds an outside dependency (such as the image
+    manifest) whose change also invalidates every page.
+    """
+
+    def __init__(self, app, version_fn=None, cache_control='no-cache'):
+        self.app = app
+        self.version_fn = version_fn
+        self.cache_control = cache_control
+        self._pages = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.renders = 0
+        self.not_modified = 0
+
+    def _render(self, template_name):
+        body = render_template(template_name).encode('utf-8')
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        template = self.app.jinja_env.get_template(template_name)
+        with self._lock:
+            self.renders += 1
+        return body, etag, template
+
+    def render(self, template_name):
+        """Response for template_name, rendered at most once per variant and version"""
+        logged_in = 'user_id' in session
+        version = self.version_fn() if self.version_fn else None
+        key = (template_name, logged_in, request.script_root, version)
+
+        entry = self._pages.get(key)
+        if entry is not None and self.app.jinja_env.auto_reload and not entry[2].is_up_to_date:
+            entry = None
+        if entry is None:
+            entry = self._render(template_name)
+            with self._lock:
+                self._pages[key] = entry
+        else:
+            with self._lock:
+                self.hits += 1
+
+        body, etag, _ = entry
+        response = Response(body, mimetype='text/html')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = self.cache_control
+        # The navbar differs for logged-in users
+        response.vary.add('Cookie')
+        response.make_conditional(request)
+        if response.status_code == 304:
+            with self._lock:
+                self.not_modified += 1
+        return response
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pages': len(self._pages),
+                'hits': self.hits,
+                'renders': self.renders,
+                'not_modified': self.not_modified,
+                'bytes': sum(len(body) for body, _, _ in self._pages.values())
+            }
@@ -0,0 +1,384 @@
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+import urllib.request
+from datetime import datetime, time as dtime, timedelta
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-worker leader lock
+    fcntl = None
+
+
+log = logging.getLogger(__name__)
+
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+DAY_NAMES = {name: i for i, day in enumerate(WEEKDAYS) for name in (day, day[:3], day + 's')}
+DAY_NAMES.update({'tues': 1, 'thur': 3, 'thurs': 3})
+EVERY_DAY = frozenset(range(7))
+NAMED_SCHEDULES = {
+    '': EVERY_DAY, 'daily': EVERY_DAY, 'every day': EVERY_DAY, 'everyday': EVERY_DAY,
+    'weekdays': frozenset(range(5)), 'weekends': frozenset((5, 6))
+}
+
+
+def parse_schedule(text):
+    """Weekdays (0 = Monday) a schedule fires on: 'daily', 'weekdays', 'weekends' or 'mon,wed,fri'.
+
+    Raises ValueError for anything else.
+    """
+    text = (text or '').strip().lower()
+    if text in NAMED_SCHEDULES:
+        return NAMED_SCHEDULES[text]
+    days = set()
+    for part in text.replace(' ', ',').split(','):
+        if part:
+            if part not in DAY_NAMES:
+                raise ValueError(f"Unknown schedule day: {part}")
+            days.add(DAY_NAMES[part])
+    if not days:
+        raise ValueError("Empty schedule")
+    return frozenset(days)
+
+
+def schedule_days(text):
+    """Like parse_schedule, but free-text schedules from before validation fire every day"""
+    try:
+        return parse_schedule(text)
+    except ValueError:
+        return EVERY_DAY
+
+
+def parse_reminder_time(text):
+    """'08:00', '8:00:30' or '8:00 PM' -> datetime.time; raises ValueError"""
+    text = (text or '').strip().upper()
+    for fmt in ('%H:%M', '%H:%M:%S', '%I:%M %p', '%I:%M%p', '%I %p'):
+        try:
+            return datetime.strptime(text, fmt).time()
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid reminder time: {text!r}")
+
+
+def reminder_payload(row, fire_at):
+    return {
+        'id': row['id'],
+        'user_id': row['user_id'],
+        'medicine_name': row['medicine_name'],
+        'dosage': row.get('dosage'),
+        'schedule': row.get('schedule'),
+        'reminder_time': row['reminder_time'].strftime('%H:%M'),
+        'fire_at': fire_at.isoformat(timespec='seconds')
+    }
+
+
+class LogNotifier:
+    """Writes due reminders as JSON lines to ``path``, or to the log without one (for local runs and tests)"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, reminders):
+        if self.path is None:
+            for reminder in reminders:
+                log.info("reminder due", extra={'reminder': reminder})
+            return
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(reminder) + '\n' for reminder in reminders))
+
+
+class WebhookNotifier:
+    """POSTs each batch as {"reminders": [...]} to a push/SMS/e-mail service; non-2xx raises"""
+
+    def __init__(self, url, timeout=10.0):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, reminders):
+        body = json.dumps({'reminders': reminders}).encode()
+        request = urllib.request.Request(self.url, data=body, headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+def create_notifier(spec=None):
+    """Notifier from REMINDER_NOTIFIER: 'log' (default), 'file:/path/to.jsonl' or 'webhook:https://...'"""
+    spec = spec or os.getenv('REMINDER_NOTIFIER', 'log')
+    kind, _, target = spec.partition(':')
+    if kind == 'log':
+        return LogNotifier()
+    if kind == 'file':
+        return LogNotifier(target)
+    if kind == 'webhook':
+        return WebhookNotifier(target)
+    raise ValueError(f"Unknown REMINDER_NOTIFIER: {spec}")
+
+
+class ReminderScheduler:
+    """Fires medicine reminders at their time of day without scanning medicine_reminders.
+
+    Reminders are loaded ``window`` seconds at a time, ``lookahead``
+    seconds before they are needed, with keyset range reads on
+    (is_active, reminder_time). Their next fire times go into a min-heap, so
+    the scheduler only ever holds one window of reminders. Edits are picked
+    up every ``poll_interval`` seconds from updated_at. Just before a batch
+    of up to ``batch_size`` due reminders is handed to the notifier, the
+    batch is re-read by id, which drops anything deleted, paused or moved in
+    the meantime. last_notified_at is then set in one UPDATE.
+
+    A failed batch is retried ``max_attempts`` times, ``retry_delay``
+    seconds apart. Reminders more than ``grace`` seconds late are counted as
+    missed instead of being sent. Times are server-local, like the TIME
+    column. With ``lock_path`` set, only the process holding that file lock
+    dispatches, so several gunicorn workers can run a scheduler safely.
+    """
+
+    def __init__(self, db, notifier, window=300, lookahead=60, page_size=5000, batch_size=500,
+                 poll_interval=5.0, retry_delay=30.0, max_attempts=3, grace=3600, lock_path=None,
+                 clock=datetime.now, on_sent=None):
+        self.db = db
+        self.notifier = notifier
+        # Called with the set of user ids whose reminders were just marked sent
+        self.on_sent = on_sent
+        self.window = timedelta(seconds=window)
+        self.lookahead = timedelta(seconds=lookahead)
+        self.page_size = page_size
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.retry_delay = timedelta(seconds=retry_delay)
+        self.max_attempts = max_attempts
+        self.grace = timedelta(seconds=grace)
+        self.lock_path = lock_path if fcntl is not None else None
+        self.clock = clock
+        self._heap = []
+        # id -> [fire_at, row, attempts]; heap entries that disagree with it are stale
+        self._scheduled = {}
+        self._loaded_until = None
+        # Every reminder due at or before this has been popped from the heap
+        self._dispatched_until = None
+        self._changes_since = None
+        self._changes_after_id = 0
+        self._next_poll = 0.0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        self._lock_file = None
+        self.loaded = 0
+        self.load_queries = 0
+        self.sent = 0
+        self.batches = 0
+        self.failures = 0
+        self.missed = 0
+        self.skipped = 0
+
+    def _fire_time(self, row, start, end):
+        """Next time row fires in [start, end), or None"""
+        if not row.get('is_active') or row.get('reminder_time') is None:
+            return None
+        fire_at = datetime.combine(start.date(), row['reminder_time'])
+        if fire_at < start:
+            fire_at += timedelta(days=1)
+        if fire_at >= end or fire_at.weekday() not in schedule_days(row.get('schedule')):
+            return None
+        if row.get('last_notified_at') is not None and row['last_notified_at'] >= fire_at:
+            return None
+        return fire_at
+
+    def _schedule(self, row, start, end):
+        fire_at = self._fire_time(row, start, end)
+        if fire_at is None:
+            self._scheduled.pop(row['id'], None)
+            return False
+        current = self._scheduled.get(row['id'])
+        if current is not None and current[0] == fire_at:
+            current[1] = row
+            return False
+        self._scheduled[row['id']] = [fire_at, row, 0]
+        heapq.heappush(self._heap, (fire_at, fire_at, row['id']))
+        return True
+
+    def _load(self, start, end):
+        """Schedule every active reminder firing in [start, end), one keyset page at a time"""
+        segment_start = start
+        while segment_start < end:
+            midnight = datetime.combine(segment_start.date() + timedelta(days=1), dtime())
+            segment_end = min(end, midnight)
+            last_time = None if segment_end == midnight else segment_end.time()
+            after = None
+            while True:
+                rows = self.db.get_active_reminders_between(segment_start.time(), last_time, after, self.page_size)
+                self.load_queries += 1
+                for row in rows:
+                    if self._schedule(row, start, end):
+                        self.loaded += 1
+                if len(rows) < self.page_size:
+                    break
+                after = (rows[-1]['reminder_time'], rows[-1]['id'])
+            segment_start = segment_end
+
+    def _apply_changes(self):
+        while True:
+            rows = self.db.get_reminders_changed_since(self._changes_since, self._changes_after_id, self.page_size)
+            for row in rows:
+                # From the last dispatch on, so an edit cannot push a just-due reminder to tomorrow
+                self._schedule(row, self._dispatched_until, self._loaded_until)
+            if rows and rows[-1].get('updated_at') is not None:
+                self._changes_since, self._changes_after_id = rows[-1]['updated_at'], rows[-1]['id']
+            if len(rows) < self.page_size:
+                return
+
+    def _pop_due(self, now):
+        batch = []
+        while self._heap and self._heap[0][0] <= now and len(batch) < self.batch_size:
+            _, fire_at, reminder_id = heapq.heappop(self._heap)
+            entry = self._scheduled.get(reminder_id)
+            if entry is None or entry[0] != fire_at:
+                continue
+            if now - fire_at > self.grace:
+                del self._scheduled[reminder_id]
+                self.missed += 1
+                continue
+            batch.append((reminder_id, entry))
+        return batch
+
+    def _dispatch(self, batch, now):
+        current = {row['id']: row for row in self.db.get_reminders_by_ids([i for i, _ in batch])}
+        due = []
+        for reminder_id, entry in batch:
+            row = current.get(reminder_id)
+            fire_at = entry[0]
+            if row is None or self._fire_time(row, fire_at, fire_at + timedelta(seconds=1)) != fire_at:
+                # Deleted, paused or moved since it was loaded
+                self._scheduled.pop(reminder_id, None)
+                self.skipped += 1
+                continue
+            due.append((reminder_id, entry, row))
+        if not due:
+            return 0
+
+        try:
+            self.notifier.send([reminder_payload(row, entry[0]) for _, entry, row in due])
+        except Exception as e:
+            self.failures += 1
+            log.error("reminder notifier failed: %s", e, extra={'reminders': len(due)})
+            for reminder_id, entry, _ in due:
+                entry[2] += 1
+                if entry[2] >= self.max_attempts:
+                    del self._scheduled[reminder_id]
+                    self.missed += 1
+                else:
+                    heapq.heappush(self._heap, (now + self.retry_delay, entry[0], reminder_id))
+            return 0
+
+        ids = [reminder_id for reminder_id, _, _ in due]
+        for reminder_id in ids:
+            del self._scheduled[reminder_id]
+        try:
+            self.db.mark_reminders_sent(ids, now)
+        except Exception as e:
+            # Already delivered; worst case a restart inside the same window repeats them
+            log.warning("marking reminders sent failed: %s", e, extra={'reminders': len(ids)})
+        else:
+            if self.on_sent is not None:
+                self.on_sent({row['user_id'] for _, _, row in due})
+        self.sent += len(ids)
+        self.batches += 1
+        return len(ids)
+
+    def tick(self, now=None):
+        """Load, apply edits and dispatch whatever is due; returns the number of reminders sent"""
+        now = now or self.clock()
+        with self._lock:
+            if self._loaded_until is None:
+                self._loaded_until = self._dispatched_until = now
+                self._changes_after_id = 0
+                # Clocks of app and database may differ a little; duplicates are harmless
+                self._changes_since = now - timedelta(minutes=1)
+            if now + self.lookahead >= self._loaded_until:
+                start, self._loaded_until = self._loaded_until, max(self._loaded_until, now) + self.window
+                self._load(start, self._loaded_until)
+            if time.monotonic() >= self._next_poll:
+                self._next_poll = time.monotonic() + self.poll_interval
+                self._apply_changes()
+            sent = 0
+            while True:
+                batch = self._pop_due(now)
+                if not batch:
+                    break
+                sent += self._dispatch(batch, now)
+            self._dispatched_until = now
+            return sent
+
+    def _seconds_until_next(self):
+        with self._lock:
+            now = self.clock()
+            candidates = [self.poll_interval, (self._loaded_until - self.lookahead - now).total_seconds()]
+            if self._heap:
+                candidates.append((self._heap[0][0] - now).total_seconds())
+        return min(max(c, 0.05) for c in candidates)
+
+    def _is_leader(self):
+        if self.lock_path is None:
+            return True
+        if self._lock_file is None:
+            lock_file = open(self.lock_path, 'a')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                return False
+            self._lock_file = lock_file
+            log.info("reminder scheduler is running in this process")
+        return True
+
+    def run(self):
+        """Tick until stop(); use directly for a dedicated reminder process"""
+        while not self._stop.is_set():
+            if not self._is_leader():
+                # Another worker dispatches; take over if it dies
+                self._stop.wait(self.poll_interval)
+                continue
+            try:
+                self.tick()
+                wait = self._seconds_until_next()
+            except Exception as e:
+                log.exception("reminder scheduler tick failed: %s", e)
+                wait = self.poll_interval
+            self._stop.wait(wait)
+
+    def start(self):
+        """Run in a daemon thread of this process (once per process)"""
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._stop.clear()
+            self._heap, self._scheduled, self._loaded_until, self._lock_file = [], {}, None, None
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self.run, name='reminder-scheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'running': self._thread is not None and self._pid == os.getpid() and not self._stop.is_set(),
+                'leader': self._lock_file is not None if self.lock_path else self._thread is not None,
+                'scheduled': len(self._scheduled),
+                'heap': len(self._heap),
+                'loaded': self.loaded,
+                'load_queries': self.load_queries,
+                'sent': self.sent,
+                'batches': self.batches,
+                'failures': self.failures,
+                'missed': self.missed,
+                'skipped': self.skipped
+            }
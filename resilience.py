@@ -0,0 +1,141 @@
+import random
+import threading
+import time
+from collections import deque
+
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# HTTP statuses (and google.api_core exception names) worth another attempt
+RETRYABLE_CODES = {408, 429, 500, 502, 503, 504}
+RETRYABLE_NAMES = {
+    'ServiceUnavailable', 'InternalServerError', 'TooManyRequests', 'ResourceExhausted',
+    'DeadlineExceeded', 'GatewayTimeout', 'BadGateway', 'RetryError'
+}
+
+
+def is_retryable(error):
+    """Whether error looks transient (connection trouble, timeouts, 429/5xx)"""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    code = getattr(error, 'code', None)
+    code = getattr(code, 'value', code)
+    if isinstance(code, int) and code in RETRYABLE_CODES:
+        return True
+    return type(error).__name__ in RETRYABLE_NAMES
+
+
+def backoff_delay(attempt, base=0.2, cap=2.0, rng=random):
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2**attempt)]"""
+    return rng.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """Fails fast while the upstream error rate is high.
+
+    Outcomes of the last ``window`` seconds are kept. Once at least
+    ``min_calls`` were seen and the failed fraction reaches
+    ``failure_threshold``, the breaker opens and refuses calls for
+    ``open_seconds``. It then lets ``half_open_calls`` probes through: one
+    success closes it, one failure opens it again. A probe that ends
+    without a verdict (client gone, pool full) must call release(); one
+    that never reports back frees its slot after another ``open_seconds``.
+    """
+
+    def __init__(self, failure_threshold=0.5, min_calls=10, window=30.0, open_seconds=15.0, half_open_calls=1):
+        self.failure_threshold = failure_threshold
+        self.min_calls = min_calls
+        self.window = window
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.state = CLOSED
+        self._outcomes = deque()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.rejected = 0
+
+    def _trim(self, now):
+        while self._outcomes and self._outcomes[0][0] < now - self.window:
+            _, ok = self._outcomes.popleft()
+            if not ok:
+                self._failures -= 1
+
+    def _open(self, now):
+        self.state = OPEN
+        self._opened_at = now
+        self._outcomes.clear()
+        self._failures = 0
+        self.opened += 1
+
+    def allow(self):
+        """True if a call may go upstream now; counts a refusal otherwise"""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == OPEN and now - self._opened_at >= self.open_seconds:
+                self.state = HALF_OPEN
+                self._probes = 0
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and self._probes and now - self._probe_started >= self.open_seconds:
+                # The probes never reported back; don't stay half open forever
+                self._probes = 0
+            if self.state == HALF_OPEN and self._probes < self.half_open_calls:
+                self._probes += 1
+                self._probe_started = now
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, ok):
+        """Report the outcome of a call that allow() let through"""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == HALF_OPEN:
+                if ok:
+                    self.state = CLOSED
+                else:
+                    self._open(now)
+                return
+            if self.state == OPEN:
+                # A call admitted before the breaker opened
+                return
+            self._outcomes.append((now, ok))
+            if not ok:
+                self._failures += 1
+            self._trim(now)
+            if len(self._outcomes) >= self.min_calls and self._failures / len(self._outcomes) >= self.failure_threshold:
+                self._open(now)
+
+    def release(self):
+        """Give back a call that allow() let through but that ended without an upstream outcome"""
+        with self._lock:
+            if self.state == HALF_OPEN and self._probes:
+                self._probes -= 1
+
+    def retry_after(self):
+        """Seconds until the breaker lets a probe through"""
+        with self._lock:
+            if self.state == HALF_OPEN and self._probes >= self.half_open_calls:
+                return max(0.0, self.open_seconds - (time.monotonic() - self._probe_started))
+            if self.state != OPEN:
+                return 0.0
+            return max(0.0, self.open_seconds - (time.monotonic() - self._opened_at))
+
+    def stats(self):
+        with self._lock:
+            self._trim(time.monotonic())
+            calls = len(self._outcomes)
+            return {
+                'state': self.state,
+                'open': int(self.state != CLOSED),
+                'window_calls': calls,
+                'window_failure_rate': round(self._failures / calls, 3) if calls else 0.0,
+                'opened': self.opened,
+                'rejected': self.rejected
+            }
@@ -0,0 +1,334 @@
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+# Words that carry no meaning for matching health questions
+STOPWORDS = frozenset("""
+a an the i me my we our you your he she it its they them is am are was were be been
+being do does did doing have has had should would could can will shall may might must
+to of in on at for with by from about as into over after before and or but if so than
+too very just how what when where which who whom why this that these those there here
+much many some any per get got please thanks thank way ways vs versus contain contains
+while during
+""".split())
+
+# Multi-word phrasings rewritten before tokenizing
+PHRASES = [
+    (re.compile(r"\bgrown[- ]?ups?\b"), "adults"),
+    (re.compile(r"\b(?:each|a|per|every) day\b"), "daily"),
+    (re.compile(r"\bwithout (?:medication|medicine|medicines|drugs|pills)\b"), "naturally"),
+    (re.compile(r"\b(?:a lot of|lots of|rich in)\b"), "high in"),
+    (re.compile(r"\b(?:after eating|on a full stomach)\b"), "with food"),
+    (re.compile(r"\b(?:how to tell|know if|difference between)\b"), "tell"),
+    (re.compile(r"\bhigh blood pressure\b"), "blood pressure"),
+    (re.compile(r"\bvitamin ([a-z]\d*)\b"), r"vitamin\1"),
+]
+
+# Word (or stem) -> canonical concept(s)
+SYNONYMS = {
+    'day': 'daily', 'daily': 'daily', 'intake': 'drink', 'sign': 'symptom', 'dehydration': 'dehydrat',
+    'reduce': 'lower', 'decrease': 'lower', 'healthy': 'normal', 'ok': 'safe', 'okay': 'safe',
+    'rich': 'high', 'know': 'tell', 'hurt': 'pain', 'ache': 'pain', 'sore': 'pain',
+    'headache': ('head', 'pain'), 'stomachache': ('stomach', 'pain'),
+    'hypertension': ('blood', 'pressure'),
+    'children': 'child', 'kid': 'child', 'toddler': 'child',
+    'newborn': 'infant', 'baby': 'infant', 'babie': 'infant',
+    'teenager': 'teen', 'adolescent': 'teen', 'senior': 'elderly', 'older': 'elderly',
+    'pregnant': 'pregnancy', 'nursing': 'breastfeed',
+    'acetaminophen': 'paracetamol', 'tylenol': 'paracetamol', 'advil': 'ibuprofen', 'motrin': 'ibuprofen',
+    'teeth': 'tooth', 'feet': 'foot', 'influenza': 'flu', 'diabet': 'diabetes', 'diabetic': 'diabetes',
+}
+
+# Concepts that change the answer on their own: a cached answer is never reused when the two
+# questions differ in any of these (another drug, body part, patient group, condition or negation)
+CRITICAL = frozenset("""
+ibuprofen aspirin paracetamol naproxen metformin insulin amoxicillin antibiotic antihistamine
+codeine morphine tramadol prednisone warfarin statin omeprazole lisinopril melatonin
+alcohol coffee caffeine nicotine cannabis
+head neck chest heart lung stomach back knee ankle wrist hip shoulder elbow foot hand arm leg
+eye ear nose throat skin kidney liver tooth abdomen bladder left right
+adult child infant teen elderly pregnancy breastfeed man woman men women
+flu cold covid diabetes asthma migraine cancer allergy pneumonia
+not no never without
+""".split())
+
+
+def _stem(word):
+    """Very small suffix stripper so 'drinking'/'drinks'/'drink' share a feature"""
+    for suffix in ('ing', 'edly', 'ed', 'ly', 'es', 's'):
+        if len(word) > len(suffix) + 2 and word.endswith(suffix):
+            return word[:-len(suffix)]
+    return word
+
+
+def concepts(text):
+    """Set of normalized concepts in text: stopwords dropped, phrasings, synonyms and stems folded"""
+    text = text.lower()
+    for pattern, replacement in PHRASES:
+        text = pattern.sub(replacement, text)
+    found = set()
+    for word in _WORD.findall(text):
+        if word in STOPWORDS:
+            continue
+        concept = SYNONYMS.get(word) or SYNONYMS.get(_stem(word), _stem(word))
+        if isinstance(concept, tuple):
+            found.update(concept)
+        else:
+            found.add(concept)
+    return frozenset(found)
+
+
+def critical_terms(words):
+    """The concepts in words that must match exactly (see CRITICAL), plus numbers and vitamins"""
+    return frozenset(w for w in words if w in CRITICAL or w.startswith('vitamin') or any(c.isdigit() for c in w))
+
+
+class SemanticCache:
+    """Bounded in-process cache of question -> answer, matched by TF-IDF weighted concept overlap.
+
+    Questions are reduced to concepts: stopwords dropped, common phrasings
+    and synonyms folded ("daily water intake?" and "How much water should I
+    drink daily?" both become {water, drink, daily}). The similarity is the
+    cosine of the two concept sets, each concept weighted by its inverse
+    document frequency among the cached questions, so rare words count
+    more than "take" or "symptom". A cached answer is only considered when
+    both questions name exactly the same critical terms (drugs, body parts,
+    patient groups, conditions, negations and numbers), so "aspirin" never
+    gets the "ibuprofen" answer however similar the rest is.
+
+    Candidates come from an inverted index restricted to the bucket of
+    entries with the query's critical terms, so a lookup touches only
+    entries sharing a concept with it. Least recently used entries are
+    evicted. Run ``python semantic_cache.py`` for hit rates on labelled
+    paraphrases, held-out paraphrases and look-alikes.
+    """
+
+    def __init__(self, threshold=0.8, max_entries=10000, ttl=None):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # id -> (question, answer, concepts, critical terms, created)
+        self._entries = OrderedDict()
+        self._postings = {}
+        self._buckets = {}
+        self._by_concepts = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.candidates = 0
+        self.lookup_seconds = 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _idf(self, concept):
+        return math.log((len(self._entries) + 1) / (len(self._postings.get(concept, ())) + 1)) + 1.0
+
+    def _remove(self, entry_id):
+        _, _, words, critical, _ = self._entries.pop(entry_id)
+        for word in words:
+            posting = self._postings[word]
+            posting.discard(entry_id)
+            if not posting:
+                del self._postings[word]
+        bucket = self._buckets[critical]
+        bucket.discard(entry_id)
+        if not bucket:
+            del self._buckets[critical]
+        del self._by_concepts[words]
+
+    def get(self, question, threshold=None):
+        """Return (answer, similarity) for the closest cached question, or (None, best score considered).
+
+        ``threshold`` overrides the configured minimum similarity for this lookup.
+        """
+        threshold = self.threshold if threshold is None else threshold
+        started = time.perf_counter()
+        words = concepts(question)
+        critical = critical_terms(words)
+        with self._lock:
+            best_id, best = None, 0.0
+            bucket = self._buckets.get(critical)
+            if words and bucket:
+                weights = {}
+
+                def weight(word):
+                    if word not in weights:
+                        weights[word] = self._idf(word) ** 2
+                    return weights[word]
+
+                # Weight each candidate shares with the query, accumulated from the postings
+                shared = {}
+                for word in words:
+                    w = weight(word)
+                    for entry_id in self._postings.get(word, set()) & bucket:
+                        shared[entry_id] = shared.get(entry_id, 0.0) + w
+                self.candidates += len(shared)
+                query_norm = math.sqrt(sum(weight(w) for w in words))
+                expired_before = time.time() - self.ttl if self.ttl is not None else None
+                for entry_id, overlap in shared.items():
+                    # An entry is at least as heavy as the overlap, so sqrt(overlap) / query_norm bounds
+                    # its score; most candidates share one word and are skipped on that alone
+                    if math.sqrt(overlap) / query_norm < threshold:
+                        continue
+                    _, _, entry_words, _, created = self._entries[entry_id]
+                    if expired_before is not None and created < expired_before:
+                        continue
+                    score = overlap / (query_norm * math.sqrt(sum(weight(w) for w in entry_words)))
+                    if score > best:
+                        best_id, best = entry_id, score
+            answer = None
+            if best_id is not None and best >= threshold:
+                answer = self._entries[best_id][1]
+                self._entries.move_to_end(best_id)
+                self.hits += 1
+            else:
+                self.misses += 1
+            self.lookup_seconds += time.perf_counter() - started
+        return answer, round(best, 4)
+
+    def set(self, question, answer):
+        words = concepts(question)
+        if not words:
+            return
+        critical = critical_terms(words)
+        with self._lock:
+            if words in self._by_concepts:
+                self._remove(self._by_concepts[words])
+            while len(self._entries) >= self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (question, answer, words, critical, time.time())
+            for word in words:
+                self._postings.setdefault(word, set()).add(entry_id)
+            self._buckets.setdefault(critical, set()).add(entry_id)
+            self._by_concepts[words] = entry_id
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._postings.clear()
+            self._buckets.clear()
+            self._by_concepts.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'threshold': self.threshold,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'avg_candidates': round(self.candidates / lookups, 2) if lookups else 0.0,
+                'avg_lookup_ms': round(self.lookup_seconds * 1000 / lookups, 4) if lookups else 0.0
+            }
+
+
+# Labelled pairs for the offline check below: (cached question, new question)
+PARAPHRASES = [
+    ("How much water should I drink daily?", "daily water intake?"),
+    ("How much water should I drink daily?", "how much water to drink each day"),
+    ("How much water should I drink daily?", "How much water should I drink a day?"),
+    ("What are the symptoms of dehydration?", "signs of being dehydrated"),
+    ("How can I lower my blood pressure naturally?", "natural ways to lower blood pressure"),
+    ("How can I lower my blood pressure naturally?", "how to reduce high blood pressure without medication"),
+    ("How many hours of sleep do adults need?", "how much sleep do grown-ups need"),
+    ("Is it safe to take ibuprofen with food?", "can I take ibuprofen after eating"),
+    ("Is it safe to take ibuprofen with food?", "is it ok to take ibuprofen with food"),
+    ("What foods are high in iron?", "iron rich foods"),
+    ("What foods are high in iron?", "which foods contain a lot of iron"),
+    ("What is a healthy resting heart rate?", "normal resting heart rate"),
+    ("How do I know if I have the flu or a cold?", "flu vs cold how to tell"),
+]
+# Written after the vocabulary above was settled, so they measure it rather than fit it
+HELD_OUT = [
+    ("How much water should I drink daily?", "how many glasses of water per day"),
+    ("What are the symptoms of dehydration?", "how do I know if I am dehydrated"),
+    ("How can I lower my blood pressure naturally?", "tips to bring down blood pressure"),
+    ("How many hours of sleep do adults need?", "how long should adults sleep each night"),
+    ("What foods are high in iron?", "best foods for iron"),
+    ("What is a healthy resting heart rate?", "what resting heart rate is normal"),
+    ("How long does the flu last?", "how many days does flu last"),
+    ("What are the symptoms of dehydration?", "dehydration symptoms"),
+]
+REPEATS = [
+    ("What are the symptoms of dehydration?", "symptoms of dehydration"),
+    ("How many hours of sleep do adults need?", "how many hours of sleep does an adult need"),
+    ("How can I lower my blood pressure?", "How can I lower my blood pressure??"),
+    ("What foods are high in iron?", "what foods are high in iron"),
+]
+# Look-alikes that must never share an answer: another drug, body part, dose or patient group
+MUST_MISS = [
+    ("Is ibuprofen safe during pregnancy?", "Is aspirin safe during pregnancy?"),
+    ("Is it safe to take ibuprofen with food?", "Is it safe to take paracetamol with food?"),
+    ("Can I take ibuprofen with alcohol?", "Can I take metformin with alcohol?"),
+    ("What is the maximum dose of paracetamol for adults?", "What is the maximum dose of paracetamol for children?"),
+    ("What causes pain in my left knee?", "What causes pain in my left chest?"),
+    ("How do I treat a sprained ankle?", "How do I treat a sprained wrist?"),
+    ("What is a healthy resting heart rate?", "What is a healthy resting heart rate for a newborn?"),
+    ("How much vitamin D should I take daily?", "How much vitamin B12 should I take daily?"),
+    ("Is it normal to have a headache after exercise?", "Is it normal to have chest pain after exercise?"),
+    ("How long does the flu last?", "How long does covid last?"),
+    ("What are the symptoms of type 1 diabetes?", "What are the symptoms of type 2 diabetes?"),
+    ("Can I drink coffee while breastfeeding?", "Can I drink alcohol while breastfeeding?"),
+    ("Is it safe to take ibuprofen with food?", "Is it safe to take ibuprofen without food?"),
+    ("How much paracetamol can I take in a day?", "How much paracetamol can I take in a day while pregnant?"),
+]
+
+
+def pair_hits(pairs, threshold, together=False):
+    """How many (cached, asked) pairs hit, one cache per pair or all cached questions in one cache"""
+    hits = 0
+    cache = SemanticCache(threshold=threshold)
+    if together:
+        for cached, _ in pairs:
+            cache.set(cached, cached)
+    for cached, asked in pairs:
+        if not together:
+            cache = SemanticCache(threshold=threshold)
+            cache.set(cached, cached)
+        hits += cache.get(asked)[0] == cached
+    return hits
+
+
+if __name__ == '__main__':
+    # Quick offline benchmark: hit rates on labelled pairs and lookup latency with a full index
+    import random
+
+    groups = (('repeats', REPEATS), ('paraphrases', PARAPHRASES), ('held-out', HELD_OUT), ('must-miss', MUST_MISS))
+    print(f"{'threshold':>10}" + ''.join(f"{name:>13}" for name, _ in groups) + "   (one shared cache)")
+    for threshold in (0.6, 0.7, 0.8, 0.9):
+        alone = [f"{pair_hits(pairs, threshold)}/{len(pairs)}" for _, pairs in groups]
+        together = [f"{pair_hits(pairs, threshold, together=True)}/{len(pairs)}" for _, pairs in groups]
+        print(f"{threshold:>10}" + ''.join(f"{rate:>13}" for rate in alone) + "   " + ' '.join(together))
+
+    entries = 100000
+    cache = SemanticCache(max_entries=entries + len(REPEATS))
+    rng = random.Random(42)
+    # Letters only: digits would make every synthetic word a critical term with its own bucket
+    vocab = list({''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(7)) for _ in range(5000)})
+    print(f"\nFilling index with {entries} synthetic questions...")
+    for i in range(entries):
+        cache.set(' '.join(rng.sample(vocab, 6)), f"answer {i}")
+    for question, _ in REPEATS:
+        cache.set(question, f"answer to {question}")
+
+    cache.hits = cache.misses = cache.candidates = 0
+    cache.lookup_seconds = 0.0
+    for _, repeat in REPEATS:
+        cache.get(repeat)
+    for _ in range(200):
+        cache.get(' '.join(rng.sample(vocab, 6)) + " unseen")
+    print(cache.stats())
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: cross-worker coalescing is unavailable
+    fcntl = None
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one upstream call.
+
+    Within a process, the first caller for a key (the leader) runs the
+    function and every concurrent caller with that key waits for its result.
+    If ``lock_dir`` is set (POSIX only), leaders in different gunicorn
+    workers also coordinate through a per-key file lock. The winning worker
+    publishes the JSON-serializable result next to the lock for the others.
+    """
+
+    def __init__(self, lock_dir=None, wait_timeout=60.0, result_ttl=30.0):
+        self.lock_dir = lock_dir if fcntl is not None else None
+        self.wait_timeout = wait_timeout
+        self.result_ttl = result_ttl
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.upstream_calls = 0
+        self.coalesced = 0
+        self.cross_worker_coalesced = 0
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+
+    def do(self, key, fn):
+        """Return (result, shared); shared is True if another caller's upstream call was reused"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+            else:
+                call.waiters += 1
+                leader = False
+
+        if not leader:
+            if not call.done.wait(self.wait_timeout):
+                raise TimeoutError("Timed out waiting for an identical in-flight request")
+            with self._lock:
+                self.coalesced += 1
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        shared = False
+        try:
+            if self.lock_dir:
+                call.result, shared = self._do_cross_worker(key, fn)
+            else:
+                call.result = self._call_upstream(fn)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, shared
+
+    def _call_upstream(self, fn):
+        with self._lock:
+            self.upstream_calls += 1
+        return fn()
+
+    def _paths(self, key):
+        name = hashlib.sha256(key.encode()).hexdigest()
+        base = os.path.join(self.lock_dir, name)
+        return base + '.lock', base + '.json'
+
+    def _read_published(self, result_path, since):
+        """Load a result another worker published after ``since``, if any"""
+        try:
+            if os.path.getmtime(result_path) < since:
+                return None
+            with open(result_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _do_cross_worker(self, key, fn):
+        lock_path, result_path = self._paths(key)
+        started = time.time()
+        with open(lock_path, 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Another worker is computing this key: wait for it, then reuse its result
+                deadline = time.monotonic() + self.wait_timeout
+                while True:
+                    try:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        if time.monotonic() >= deadline:
+                            raise TimeoutError("Timed out waiting for an identical request in another worker")
+                        time.sleep(0.02)
+                published = self._read_published(result_path, started)
+                if published is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                    with self._lock:
+                        self.cross_worker_coalesced += 1
+                    return published['result'], True
+            try:
+                result = self._call_upstream(fn)
+                tmp_path = f"{result_path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w') as f:
+                    json.dump({'result': result}, f)
+                os.replace(tmp_path, result_path)
+                if self.upstream_calls % 500 == 0:
+                    self.purge()
+                return result, False
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def purge(self, max_age=None):
+        """Delete published results and lock files older than max_age seconds"""
+        if not self.lock_dir:
+            return 0
+        cutoff = time.time() - (self.result_ttl if max_age is None else max_age)
+        removed = 0
+        for name in os.listdir(self.lock_dir):
+            path = os.path.join(self.lock_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def stats(self):
+        with self._lock:
+            saved = self.coalesced + self.cross_worker_coalesced
+            return {
+                'in_flight_keys': len(self._calls),
+                'cross_worker': bool(self.lock_dir),
+                'upstream_calls': self.upstream_calls,
+                'coalesced': self.coalesced,
+                'cross_worker_coalesced': self.cross_worker_coalesced,
+                'upstream_calls_saved': saved
+            }
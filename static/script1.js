@@ -41,11 +41,12 @@ document.addEventListener('DOMContentLoaded', function() {
         queryCount.textContent = count;
         localStorage.setItem('queryCount', count);
         
-        // Send message to server and get response - UPDATED ENDPOINT
-        fetch('/api/chat', {  // CHANGED from '/ask' to '/api/chat'
+        // Send message to server and render the answer as it streams in (Server-Sent Events)
+        fetch('/api/chat/stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
+                'Accept': 'text/event-stream',
             },
             body: JSON.stringify({ question: message })
         })
@@ -53,17 +54,7 @@ document.addEventListener('DOMContentLoaded', function() {
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
-            return response.json();
-        })
-        .then(data => {
-            // Remove typing indicator
-            removeTypingIndicator();
-            
-            if (data.error) {
-                addMessage("Sorry, I'm having trouble answering right now. Please try again later.", 'bot');
-            } else {
-                addMessage(data.response, 'bot');
-            }
+            return readChatStream(response);
         })
         .catch(error => {
             removeTypingIndicator();
@@ -80,17 +71,75 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
     
-    function addMessage(text, sender) {
-        const messageDiv = document.createElement('div');
-        messageDiv.className = `chat-message ${sender}-message`;
+    function readChatStream(response) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let content = null;
+        let answer = '';
+        let finished = false;
         
-        const avatar = document.createElement('div');
-        avatar.className = 'avatar';
-        avatar.innerHTML = sender === 'user' ? '<i class="fas fa-user"></i>' : '<i class="fas fa-robot"></i>';
+        function handleEvent(rawEvent) {
+            let eventName = 'message';
+            let data = '';
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event:')) {
+                    eventName = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    data += line.slice(5).trim();
+                }
+            });
+            if (!data) return;
+            const payload = JSON.parse(data);
+            
+            if (eventName === 'error') {
+                finished = true;
+                removeTypingIndicator();
+                if (!content) {
+                    addMessage("Sorry, I'm having trouble answering right now. Please try again later.", 'bot');
+                }
+                return;
+            }
+            
+            if (eventName === 'chunk') {
+                answer += payload.text;
+            } else if (eventName === 'done') {
+                answer = payload.response;
+                finished = true;
+            }
+            
+            // First chunk replaces the typing indicator with the bot message
+            if (!content) {
+                removeTypingIndicator();
+                content = addMessage(answer, 'bot');
+            } else {
+                content.innerHTML = `<p>${formatMessage(answer, 'bot')}</p>`;
+                chatBox.scrollTop = chatBox.scrollHeight;
+            }
+        }
         
-        const content = document.createElement('div');
-        content.className = 'message-content';
+        function pump() {
+            return reader.read().then(({ done, value }) => {
+                if (value) {
+                    buffer += decoder.decode(value, { stream: true });
+                    const events = buffer.split('\n\n');
+                    buffer = events.pop();
+                    events.forEach(handleEvent);
+                }
+                if (done) {
+                    if (!finished) {
+                        throw new Error('Stream ended unexpectedly');
+                    }
+                    return;
+                }
+                return pump();
+            });
+        }
         
+        return pump();
+    }
+    
+    function formatMessage(text, sender) {
         // Format the bot's response for better readability
         let formattedText = text;
         if (sender === 'bot') {
@@ -101,8 +150,20 @@ document.addEventListener('DOMContentLoaded', function() {
             formattedText = formattedText.replace(/\•/g, '<br>• ');
             formattedText = formattedText.replace(/(\d+\.)/g, '<br>$1');
         }
+        return formattedText;
+    }
+    
+    function addMessage(text, sender) {
+        const messageDiv = document.createElement('div');
+        messageDiv.className = `chat-message ${sender}-message`;
         
-        content.innerHTML = `<p>${formattedText}</p>`;
+        const avatar = document.createElement('div');
+        avatar.className = 'avatar';
+        avatar.innerHTML = sender === 'user' ? '<i class="fas fa-user"></i>' : '<i class="fas fa-robot"></i>';
+        
+        const content = document.createElement('div');
+        content.className = 'message-content';
+        content.innerHTML = `<p>${formatMessage(text, sender)}</p>`;
         
         messageDiv.appendChild(avatar);
         messageDiv.appendChild(content);
@@ -110,6 +171,7 @@ document.addEventListener('DOMContentLoaded', function() {
         
         // Scroll to bottom
         chatBox.scrollTop = chatBox.scrollHeight;
+        return content;
     }
     
     function showTypingIndicator() {
@@ -0,0 +1,44 @@
+import os
+import uuid
+
+import pytest
+
+# Before app is imported: no MySQL, no Gemini, history written synchronously
+os.environ['DB_BACKEND'] = 'memory'
+os.environ['MODEL_BACKEND'] = 'fake'
+os.environ['HISTORY_WRITE_BEHIND'] = '0'
+os.environ.setdefault('FLASK_SECRET_KEY', 'test')
+os.environ.setdefault('FAKE_LLM_LATENCY_MS', '1')
+os.environ.setdefault('FAKE_LLM_TOKEN_MS', '0')
+os.environ.setdefault('LOG_LEVEL', 'CRITICAL')
+
+
+class FakeClock:
+    """Settable stand-in for time.monotonic() or datetime.now()"""
+
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def app_module():
+    import app
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    """A test client logged in as a fresh user"""
+    client = app_module.app.test_client()
+    email = f"{uuid.uuid4().hex[:12]}@example.com"
+    response = client.post('/api/register', json={
+        'user_name': 'Test User', 'contact_number': '1234567890', 'email': email,
+        'password': 'Passw0rd!', 'confirm_password': 'Passw0rd!'
+    })
+    assert response.status_code in (200, 201), response.get_json()
+    response = client.post('/api/login', json={'email': email, 'password': 'Passw0rd!'})
+    assert response.status_code == 200, response.get_json()
+    return client
@@ -0,0 +1,83 @@
+import time
+import uuid
+
+import pytest
+
+from admission import Throttled, TokenBuckets
+
+
+def vague(count):
+    # Unknown words keep local triage from answering, so every item needs the model
+    tag = uuid.uuid4().hex
+    return [f"odd feeling in my arm {tag} number {i}" for i in range(count)]
+
+
+@pytest.fixture
+def buckets(app_module, monkeypatch):
+    buckets = TokenBuckets(rate=10, burst=2)
+    monkeypatch.setattr(app_module, 'user_buckets', buckets)
+    return buckets
+
+
+def bucket_key(client):
+    with client.session_transaction() as session:
+        return f"user:{session['user_id']}"
+
+
+def test_batch_beyond_the_wait_is_refused_with_retry_after(app_module, client, buckets, monkeypatch):
+    monkeypatch.setattr(app_module, 'BATCH_RATE_WAIT', 0.1)
+    response = client.post('/api/symptoms/batch', json={'symptoms': vague(6)})
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '1'
+    assert response.get_json()['retry_after'] == 1
+    # Refused up front: nothing was spent
+    assert buckets.available(bucket_key(client)) == pytest.approx(2)
+
+
+def test_batch_larger_than_the_burst_waits_for_refills(app_module, client, buckets, monkeypatch):
+    monkeypatch.setattr(app_module, 'BATCH_RATE_WAIT', 5)
+    started = time.monotonic()
+    response = client.post('/api/symptoms/batch', json={'symptoms': vague(6)})
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert len(results) == 6
+    assert all('error' not in r['analysis'] for r in results)
+    # Four items beyond the burst of two, refilled at ten a second
+    assert time.monotonic() - started >= 0.35
+    assert buckets.available(bucket_key(client)) < 1
+
+
+def test_cached_and_duplicate_items_are_free(app_module, client, buckets, monkeypatch):
+    monkeypatch.setattr(app_module, 'BATCH_RATE_WAIT', 0)
+    items = vague(2)
+    assert client.post('/api/symptoms/batch', json={'symptoms': items + items}).status_code == 200
+    # The bucket is now empty, but cache hits and local triage answers cost nothing
+    response = client.post('/api/symptoms/batch', json={
+        'symptoms': items + ['fever, chills, body aches and fatigue']
+    })
+    assert response.status_code == 200
+    assert [r['cached'] for r in response.get_json()['results']] == [True, True, False]
+
+
+def test_batch_history_is_saved(client, buckets):
+    items = vague(2)
+    assert client.post('/api/symptoms/batch', json={'symptoms': items}).status_code == 200
+    stats = client.get('/api/user/stats').get_json()['stats']
+    assert stats['symptom_checks'] == 2
+
+
+def test_charger_waits_for_refills(app_module):
+    buckets = TokenBuckets(rate=20, burst=1)
+    charge = app_module.batch_charger(buckets, 'k', time.monotonic() + 1)
+    started = time.monotonic()
+    charge(3)
+    assert time.monotonic() - started >= 0.09
+
+
+def test_charger_gives_up_at_the_deadline(app_module):
+    buckets = TokenBuckets(rate=1, burst=1)
+    charge = app_module.batch_charger(buckets, 'k', time.monotonic() + 0.1)
+    charge(1)
+    with pytest.raises(Throttled) as raised:
+        charge(1)
+    assert raised.value.reason == 'rate_limit'
@@ -0,0 +1,63 @@
+from datetime import datetime
+
+from conversations import ConversationStore
+from memory_db import MemoryDatabase
+
+
+def make_db():
+    db = MemoryDatabase()
+    db.register_user('Test User', '1234567890', 'u@example.com', 'Passw0rd!')
+    return db, ConversationStore.new_id()
+
+
+def save(db, conversation_id, question, answer):
+    db.add_history_batch([], [(1, conversation_id, question, answer, datetime.now())])
+
+
+def questions(store, conversation):
+    return [turn['parts'][0] for turn in store.history(conversation)[::2]]
+
+
+def test_window_is_loaded_from_the_database():
+    db, cid = make_db()
+    save(db, cid, 'q1', 'a1')
+    store = ConversationStore(db)
+    assert questions(store, store.get(1, cid)) == ['q1']
+    assert store.stats()['loads'] == 1
+
+
+def test_own_turns_keep_the_cached_window():
+    db, cid = make_db()
+    store = ConversationStore(db)
+    conversation = store.get(1, cid)
+    store.record(conversation, 'q1', 'a1')
+    # Not written yet (write-behind), then written
+    assert store.get(1, cid) is conversation
+    save(db, cid, 'q1', 'a1')
+    assert store.get(1, cid) is conversation
+    assert store.stats()['refreshes'] == 0
+
+
+def test_turns_written_by_another_worker_refresh_the_window():
+    db, cid = make_db()
+    mine, theirs = ConversationStore(db), ConversationStore(db)
+    mine.record(mine.get(1, cid), 'q1', 'a1')
+    save(db, cid, 'q1', 'a1')
+    theirs.record(theirs.get(1, cid), 'q2', 'a2')
+    save(db, cid, 'q2', 'a2')
+    mine.record(mine.get(1, cid), 'q3', 'a3')
+    conversation = mine.get(1, cid)
+    assert mine.stats()['refreshes'] == 1
+    # q3 is still in this worker's write-behind queue, so it is kept after the reload
+    assert questions(mine, conversation) == ['q1', 'q2', 'q3']
+
+
+def test_old_turns_are_summarised():
+    db, cid = make_db()
+    store = ConversationStore(db, window_turns=2)
+    conversation = store.get(1, cid)
+    for n in range(4):
+        store.record(conversation, f'q{n}', f'a{n}')
+    history = store.history(conversation)
+    assert history[0]['parts'][0].startswith('Summary of our earlier conversation')
+    assert questions(store, conversation)[1:] == ['q2', 'q3']
@@ -0,0 +1,153 @@
+from datetime import datetime, time, timedelta
+
+import pytest
+
+from conftest import FakeClock
+from memory_db import MemoryDatabase
+from reminders import ReminderScheduler, parse_reminder_time, parse_schedule, reminder_payload
+
+START = datetime(2026, 10, 19, 7, 59)  # a Monday
+
+
+class RecordingNotifier:
+    def __init__(self):
+        self.batches = []
+        self.fail = 0
+
+    def send(self, reminders):
+        if self.fail:
+            self.fail -= 1
+            raise ConnectionError("notifier down")
+        self.batches.append(reminders)
+
+    @property
+    def sent(self):
+        return [r['medicine_name'] for batch in self.batches for r in batch]
+
+
+@pytest.fixture
+def db():
+    db = MemoryDatabase()
+    db.register_user('Test User', '1234567890', 'u@example.com', 'Passw0rd!')
+    return db
+
+
+@pytest.fixture
+def user_id(db):
+    return db.get_users()[0]['id']
+
+
+def scheduler(db, notifier, clock, **kwargs):
+    kwargs.setdefault('retry_delay', 60)
+    return ReminderScheduler(db, notifier, window=300, lookahead=60, clock=clock, **kwargs)
+
+
+def test_fires_once_at_its_time(db, user_id):
+    db.add_reminder(user_id, 'Aspirin', '100mg', 'daily', time(8, 0))
+    db.add_reminder(user_id, 'Vitamin D', None, 'daily', time(9, 0))
+    notifier, clock = RecordingNotifier(), FakeClock(START)
+    s = scheduler(db, notifier, clock)
+
+    assert s.tick() == 0
+    clock.now = START.replace(minute=0, hour=8)
+    assert s.tick() == 1
+    assert notifier.sent == ['Aspirin']
+    assert notifier.batches[0][0]['fire_at'] == '2026-10-19T08:00:00'
+    clock.now += timedelta(minutes=1)
+    assert s.tick() == 0
+    assert db.get_reminders(user_id)[0]['last_notified_at'] == START.replace(minute=0, hour=8)
+
+
+def test_fires_again_the_next_day(db, user_id):
+    db.add_reminder(user_id, 'Aspirin', None, 'daily', time(8, 0))
+    notifier, clock = RecordingNotifier(), FakeClock(START)
+    s = scheduler(db, notifier, clock)
+    for minutes in range(0, 24 * 60 + 2):
+        clock.now = START + timedelta(minutes=minutes)
+        s.tick()
+    assert notifier.sent == ['Aspirin', 'Aspirin']
+    assert s.stats()['sent'] == 2
+
+
+def test_respects_schedule_days(db, user_id):
+    db.add_reminder(user_id, 'Weekend pill', None, 'weekends', time(8, 0))
+    notifier, clock = RecordingNotifier(), FakeClock(START)
+    s = scheduler(db, notifier, clock)
+    clock.now = START.replace(minute=0, hour=8)
+    assert s.tick() == 0
+    assert notifier.sent == []
+
+
+def test_deleted_and_paused_reminders_are_skipped(db, user_id):
+    deleted = db.add_reminder(user_id, 'Deleted', None, 'daily', time(8, 0))
+    paused = db.add_reminder(user_id, 'Paused', None, 'daily', time(8, 0))
+    db.add_reminder(user_id, 'Kept', None, 'daily', time(8, 0))
+    notifier, clock = RecordingNotifier(), FakeClock(START)
+    s = scheduler(db, notifier, clock)
+    s.tick()
+    db.delete_reminder(user_id, deleted['id'])
+    db.update_reminder(user_id, paused['id'], is_active=False)
+    clock.now = START.replace(minute=0, hour=8)
+    assert s.tick() == 1
+    assert notifier.sent == ['Kept']
+
+
+def test_failed_batch_is_retried(db, user_id):
+    db.add_reminder(user_id, 'Aspirin', None, 'daily', time(8, 0))
+    notifier, clock = RecordingNotifier(), FakeClock(START)
+    s = scheduler(db, notifier, clock, max_attempts=3)
+    notifier.fail = 1
+    clock.now = START.replace(minute=0, hour=8)
+    assert s.tick() == 0
+    assert s.stats()['failures'] == 1
+    clock.now += timedelta(seconds=30)
+    assert s.tick() == 0
+    clock.now += timedelta(seconds=30)
+    assert s.tick() == 1
+    assert notifier.sent == ['Aspirin']
+
+
+def test_gives_up_after_max_attempts(db, user_id):
+    db.add_reminder(user_id, 'Aspirin', None, 'daily', time(8, 0))
+    notifier, clock = RecordingNotifier(), FakeClock(START)
+    s = scheduler(db, notifier, clock, max_attempts=2)
+    notifier.fail = 5
+    clock.now = START.replace(minute=0, hour=8)
+    s.tick()
+    clock.now += timedelta(minutes=1)
+    s.tick()
+    clock.now += timedelta(minutes=1)
+    assert s.tick() == 0
+    assert s.stats()['missed'] == 1
+    assert notifier.sent == []
+
+
+def test_late_reminders_are_missed_not_sent(db, user_id):
+    db.add_reminder(user_id, 'Aspirin', None, 'daily', time(8, 0))
+    notifier, clock = RecordingNotifier(), FakeClock(START)
+    s = scheduler(db, notifier, clock, grace=60)
+    s.tick()
+    clock.now = START.replace(minute=3, hour=8)
+    assert s.tick() == 0
+    assert s.stats()['missed'] == 1
+
+
+def test_on_sent_gets_the_users(db, user_id):
+    db.add_reminder(user_id, 'Aspirin', None, 'daily', time(8, 0))
+    notified = []
+    clock = FakeClock(START.replace(minute=0, hour=8))
+    s = scheduler(db, RecordingNotifier(), clock, on_sent=notified.append)
+    s.tick()
+    assert notified == [{user_id}]
+
+
+def test_parsers():
+    assert parse_schedule('weekdays') == frozenset(range(5))
+    assert parse_schedule('mon, wed') == frozenset({0, 2})
+    with pytest.raises(ValueError):
+        parse_schedule('someday')
+    assert parse_reminder_time('8:30 PM') == time(20, 30)
+    with pytest.raises(ValueError):
+        parse_reminder_time('25:00')
+    row = {'id': 1, 'user_id': 2, 'medicine_name': 'Aspirin', 'reminder_time': time(8, 0)}
+    assert reminder_payload(row, START)['reminder_time'] == '08:00'
@@ -0,0 +1,111 @@
+import types
+
+import pytest
+
+import resilience
+from conftest import FakeClock
+from resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock(1000.0)
+    monkeypatch.setattr(resilience, 'time', types.SimpleNamespace(monotonic=clock))
+    return clock
+
+
+def trip(breaker):
+    for _ in range(breaker.min_calls):
+        assert breaker.allow()
+        breaker.record(False)
+
+
+def test_opens_at_failure_threshold(clock):
+    breaker = CircuitBreaker(failure_threshold=0.5, min_calls=4, open_seconds=10)
+    for ok in (True, False, True):
+        assert breaker.allow()
+        breaker.record(ok)
+    assert breaker.state == CLOSED
+    breaker.allow()
+    breaker.record(False)
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.stats()['rejected'] == 1
+    assert breaker.retry_after() == 10
+
+
+def test_needs_min_calls(clock):
+    breaker = CircuitBreaker(min_calls=4)
+    for _ in range(3):
+        breaker.allow()
+        breaker.record(False)
+    assert breaker.state == CLOSED
+
+
+def test_old_failures_leave_the_window(clock):
+    breaker = CircuitBreaker(min_calls=4, window=30)
+    for _ in range(3):
+        breaker.allow()
+        breaker.record(False)
+    clock.now += 31
+    for _ in range(3):
+        breaker.allow()
+        breaker.record(True)
+    breaker.allow()
+    breaker.record(False)
+    assert breaker.state == CLOSED
+
+
+def test_half_open_probe_success_closes(clock):
+    breaker = CircuitBreaker(min_calls=2, open_seconds=10)
+    trip(breaker)
+    clock.now += 10
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    # Only one probe at a time
+    assert not breaker.allow()
+    breaker.record(True)
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_half_open_probe_failure_reopens(clock):
+    breaker = CircuitBreaker(min_calls=2, open_seconds=10)
+    trip(breaker)
+    clock.now += 10
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.state == OPEN
+    assert breaker.stats()['opened'] == 2
+    clock.now += 5
+    assert not breaker.allow()
+
+
+def test_released_probe_frees_its_slot(clock):
+    breaker = CircuitBreaker(min_calls=2, open_seconds=10)
+    trip(breaker)
+    clock.now += 10
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+
+
+def test_lost_probe_expires(clock):
+    breaker = CircuitBreaker(min_calls=2, open_seconds=10)
+    trip(breaker)
+    clock.now += 10
+    assert breaker.allow()
+    clock.now += 5
+    assert not breaker.allow()
+    assert breaker.retry_after() == 5
+    clock.now += 5
+    assert breaker.allow()
+
+
+def test_outcome_of_a_call_admitted_before_opening_is_ignored(clock):
+    breaker = CircuitBreaker(min_calls=2, open_seconds=10)
+    assert breaker.allow()
+    trip(breaker)
+    breaker.record(True)
+    assert breaker.state == OPEN
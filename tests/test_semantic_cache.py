@@ -0,0 +1,73 @@
+import time
+
+import pytest
+
+from semantic_cache import HELD_OUT, MUST_MISS, PARAPHRASES, REPEATS, SemanticCache, pair_hits
+
+
+def test_repeat_hits():
+    cache = SemanticCache()
+    cache.set("What are the symptoms of dehydration?", "drink water")
+    answer, score = cache.get("symptoms of dehydration")
+    assert answer == "drink water"
+    assert score >= cache.threshold
+
+
+def test_unrelated_question_misses():
+    cache = SemanticCache()
+    cache.set("What are the symptoms of dehydration?", "drink water")
+    assert cache.get("How do I treat a sprained ankle?")[0] is None
+    assert cache.stats()['misses'] == 1
+
+
+@pytest.mark.parametrize('cached, asked', PARAPHRASES)
+def test_paraphrase_hits(cached, asked):
+    cache = SemanticCache()
+    cache.set(cached, cached)
+    assert cache.get(asked)[0] == cached
+
+
+def test_labelled_pairs_at_default_threshold():
+    threshold = SemanticCache().threshold
+    assert pair_hits(REPEATS, threshold) == len(REPEATS)
+    assert pair_hits(PARAPHRASES, threshold, together=True) == len(PARAPHRASES)
+    assert pair_hits(HELD_OUT, threshold) >= 1
+
+
+@pytest.mark.parametrize('cached, asked', MUST_MISS)
+def test_must_miss(cached, asked):
+    # Another drug, body part, dose or patient group must never get the cached answer
+    for threshold in (0.6, 0.8):
+        cache = SemanticCache(threshold=threshold)
+        cache.set(cached, cached)
+        assert cache.get(asked)[0] is None
+        cache = SemanticCache(threshold=threshold)
+        cache.set(asked, asked)
+        assert cache.get(cached)[0] is None
+
+
+def test_must_miss_in_a_shared_cache():
+    cache = SemanticCache()
+    for cached, _ in MUST_MISS:
+        cache.set(cached, cached)
+    for cached, asked in MUST_MISS:
+        assert cache.get(asked)[0] is None
+
+
+def test_expired_entries_miss(monkeypatch):
+    cache = SemanticCache(ttl=60)
+    cache.set("What foods are high in iron?", "iron")
+    assert cache.get("What foods are high in iron?")[0] == "iron"
+    later = time.time() + 61
+    monkeypatch.setattr(time, 'time', lambda: later)
+    assert cache.get("What foods are high in iron?")[0] is None
+
+
+def test_least_recently_used_is_evicted():
+    cache = SemanticCache(max_entries=2)
+    cache.set("What foods are high in iron?", "iron")
+    cache.set("How long does the flu last?", "flu")
+    cache.set("What is a healthy resting heart rate?", "heart")
+    assert len(cache) == 2
+    assert cache.get("What foods are high in iron?")[0] is None
+    assert cache.stats()['evictions'] == 1
@@ -0,0 +1,64 @@
+import pytest
+
+from triage import TriageEngine, keyword_red_flag, measurement_flag
+
+ROUTINE = "fever, chills, body aches and fatigue"
+
+
+@pytest.fixture(scope='module')
+def engine():
+    return TriageEngine()
+
+
+def test_routine_case_is_answered_locally(app_module):
+    analysis = app_module.local_triage(ROUTINE)
+    assert analysis['conditions'][0]['name'] == 'Influenza (flu)'
+    assert analysis['see_doctor']
+
+
+@pytest.mark.parametrize('extra, reason', [
+    (", my chest hurts", 'red_flag'),
+    (", lips look blue", 'red_flag'),
+    (" with a fever of 104F", 'high_temperature'),
+    (", temperature of 39.8C", 'high_temperature'),
+    (", temp is 103.5 F", 'high_temperature'),
+    (", 34.5 degrees", 'low_temperature'),
+    (" for 3 weeks", 'long_duration'),
+    (", going on for a month", 'long_duration'),
+    (", had it for two weeks", 'long_duration'),
+])
+def test_escalates(engine, app_module, extra, reason):
+    analysis, _, escalated = engine.triage(ROUTINE + extra)
+    assert analysis is None
+    assert escalated == reason
+    assert app_module.local_triage(ROUTINE + extra) is None
+
+
+@pytest.mark.parametrize('extra', [" for 2 days", ", since yesterday", ", temperature 38.2C", ", fever of 101"])
+def test_ordinary_numbers_do_not_escalate(engine, extra):
+    assert engine.triage(ROUTINE + extra)[2] is None
+
+
+@pytest.mark.parametrize('text', [
+    "I am 40 years old", "took 400 mg of ibuprofen", "weigh 104 kg", "for 10 days", "2 weeks old baby",
+    "headache at 10 pm", "blood pressure 140/90",
+])
+def test_numbers_that_are_not_measurements(text):
+    assert measurement_flag(text) is None
+
+
+def test_vague_text_goes_to_the_model(engine):
+    assert engine.triage("I just feel off")[2] in ('too_few_symptoms', 'low_confidence')
+
+
+def test_keyword_red_flags():
+    assert keyword_red_flag("my chest is sore")
+    assert not keyword_red_flag("runny nose and sneezing")
+
+
+def test_escalations_are_counted(engine):
+    before = engine.stats()
+    engine.triage(ROUTINE + " for 3 weeks")
+    after = engine.stats()
+    assert after['escalated'] == before['escalated'] + 1
+    assert after['escalated_long_duration'] == before.get('escalated_long_duration', 0) + 1
@@ -0,0 +1,164 @@
+from contextlib import contextmanager
+from datetime import datetime, time
+
+import pytest
+
+from database import Database
+from memory_db import MemoryDatabase
+
+
+class FakeCursor:
+    """Records statements; fetchone() answers from (sql fragment, row) pairs in order"""
+
+    def __init__(self, answers=()):
+        self.statements = []
+        self.answers = list(answers)
+        self.rowcount = 0
+        self._last = ''
+
+    def execute(self, sql, params=None):
+        self.statements.append((' '.join(sql.split()), params))
+        self._last = sql
+
+    def executemany(self, sql, rows):
+        for params in rows:
+            self.execute(sql, params)
+
+    def fetchone(self):
+        for i, (fragment, row) in enumerate(self.answers):
+            if fragment in self._last:
+                del self.answers[i]
+                return row
+        return None
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.commits = 0
+
+    def cursor(self, **kwargs):
+        return self._cursor
+
+    def commit(self):
+        self.commits += 1
+
+    def close(self):
+        pass
+
+
+def mysql_db(monkeypatch, cursor):
+    db = Database()
+    conn = FakeConnection(cursor)
+
+    @contextmanager
+    def connection():
+        yield conn
+    monkeypatch.setattr(db, 'connection', connection)
+    monkeypatch.setattr(db, 'get_connection', lambda: conn)
+    return db
+
+
+def statements(cursor, fragment):
+    return [params for sql, params in cursor.statements if fragment in sql]
+
+
+def test_mysql_writes_bump_the_counter_in_the_same_transaction(monkeypatch):
+    cursor = FakeCursor()
+    db = mysql_db(monkeypatch, cursor)
+    assert db.add_symptom_check(7, 'headache', {'severity': 'low'})['success']
+    sqls = [sql for sql, _ in cursor.statements]
+    assert sqls[0].startswith('INSERT INTO symptoms_history')
+    assert sqls[1].startswith('INSERT INTO user_stats (user_id, symptom_checks)')
+    assert 'GREATEST(symptom_checks + %s, 0)' in sqls[1]
+    assert cursor.statements[1][1] == (7, 1, 1)
+
+
+def test_mysql_bump_rejects_unknown_columns():
+    with pytest.raises(ValueError):
+        Database()._bump_user_stats(FakeCursor(), 1, 'password_hash')
+
+
+def test_mysql_migration_backfills_a_new_user_stats_table(monkeypatch):
+    db = mysql_db(monkeypatch, FakeCursor())
+    rebuilt = []
+    monkeypatch.setattr(db, 'rebuild_user_stats', lambda: rebuilt.append(True) or 3)
+    db.create_tables()
+    assert rebuilt == [True]
+
+
+def test_mysql_migration_leaves_an_existing_user_stats_table(monkeypatch):
+    db = mysql_db(monkeypatch, FakeCursor([("SHOW TABLES LIKE 'user_stats'", ('user_stats',))]))
+    rebuilt = []
+    monkeypatch.setattr(db, 'rebuild_user_stats', lambda: rebuilt.append(True) or 3)
+    db.create_tables()
+    assert rebuilt == []
+
+
+def test_mysql_read_backfills_a_missing_row(monkeypatch):
+    cursor = FakeCursor([
+        ('FROM symptoms_history', {'symptom_checks': 4}),
+        ('FROM ai_consultations', {'ai_consultations': 2}),
+        ('FROM medicine_reminders', {'active_reminders': 1}),
+    ])
+    db = mysql_db(monkeypatch, cursor)
+    stats = db.get_user_stats(7)
+    assert stats == {'symptom_checks': 4, 'ai_consultations': 2, 'active_reminders': 1, 'health_score': 93}
+    assert statements(cursor, 'INSERT IGNORE INTO user_stats') == [(7, 4, 2, 1)]
+
+
+def test_mysql_read_uses_the_counter_row(monkeypatch):
+    row = {'symptom_checks': 10, 'ai_consultations': 0, 'active_reminders': 0}
+    cursor = FakeCursor([('FROM user_stats', row)])
+    db = mysql_db(monkeypatch, cursor)
+    assert db.get_user_stats(7)['health_score'] == 100
+    assert not statements(cursor, 'COUNT(*)')
+
+
+def test_mysql_rebuild_adds_archived_rows(monkeypatch):
+    cursor = FakeCursor()
+    db = mysql_db(monkeypatch, cursor)
+    db.rebuild_user_stats(archived={7: {'symptom_checks': 5}})
+    assert statements(cursor, 'UPDATE user_stats') == [(5, 0, 7)]
+
+
+@pytest.fixture
+def db():
+    db = MemoryDatabase()
+    db.register_user('Test User', '1234567890', 'u@example.com', 'Passw0rd!')
+    return db
+
+
+def test_memory_counters_follow_writes(db):
+    db.add_symptom_checks(1, [('headache', {}), ('cough', {})])
+    db.add_ai_consultation(1, 'question', 'answer')
+    reminder = db.add_reminder(1, 'Aspirin', reminder_time=time(8, 0))
+    db.add_reminder(1, 'Paused', reminder_time=time(9, 0), is_active=False)
+    assert db.get_user_stats(1) == {
+        'symptom_checks': 2, 'ai_consultations': 1, 'active_reminders': 1, 'health_score': 89
+    }
+    db.update_reminder(1, reminder['id'], is_active=False)
+    assert db.get_user_stats(1)['active_reminders'] == 0
+    db.delete_reminder(1, reminder['id'])
+    assert db.get_user_stats(1)['active_reminders'] == 0
+
+
+def test_memory_rebuild_matches_the_bumped_counters(db):
+    db.add_history_batch([(1, 'headache', '{}', datetime.now())], [(1, None, 'q', 'a', datetime.now())])
+    db.add_reminder(1, 'Aspirin', reminder_time=time(8, 0))
+    bumped = db.get_user_stats(1)
+    db.user_stats = {}
+    assert db.get_user_stats(1)['symptom_checks'] == 0
+    assert db.rebuild_user_stats() == 1
+    assert db.get_user_stats(1) == bumped
+    db.rebuild_user_stats(archived={1: {'symptom_checks': 3}})
+    assert db.get_user_stats(1)['symptom_checks'] == 4
+
+
+def test_dashboard_reports_the_counters(client):
+    client.post('/api/reminders', json={'medicine_name': 'Aspirin', 'reminder_time': '08:00'})
+    stats = client.get('/api/user/stats').get_json()
+    assert stats['stats']['active_reminders'] == 1
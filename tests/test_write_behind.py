@@ -0,0 +1,94 @@
+import pytest
+
+from memory_db import MemoryDatabase
+from write_behind import HistoryWriter
+
+
+class FlakyDatabase(MemoryDatabase):
+    """Fails the next ``outages`` batch writes as if the server were unreachable"""
+
+    def __init__(self, outages=0):
+        super().__init__()
+        self.outages = outages
+
+    def add_history_batch(self, symptom_rows=(), consultation_rows=()):
+        if self.outages:
+            self.outages -= 1
+            raise ConnectionError("server has gone away")
+        super().add_history_batch(symptom_rows, consultation_rows)
+
+
+@pytest.fixture
+def db():
+    db = FlakyDatabase()
+    for n in (1, 2):
+        db.register_user(f'User {n}', '1234567890', f'u{n}@example.com', 'Passw0rd!')
+    return db
+
+
+def writer(db, **kwargs):
+    # A long interval keeps the background flusher out of the way; the tests flush themselves
+    return HistoryWriter(db, flush_interval=60, max_batch=1000, **kwargs)
+
+
+def test_rows_are_written_in_one_batch(db):
+    flushed = []
+    w = writer(db, on_flush=flushed.append)
+    w.add_symptom_checks(1, [('headache', {}), ('cough', {})])
+    w.add_ai_consultation(2, 'question', 'answer')
+    assert w.flush() == 3
+    assert len(db.symptoms_history) == 2 and len(db.ai_consultations) == 1
+    assert flushed == [{1, 2}]
+    assert w.stats()['isolated_batches'] == 0
+
+
+def test_a_bad_row_does_not_drop_the_batch(db):
+    flushed = []
+    w = writer(db, on_flush=flushed.append)
+    w.add_symptom_check(1, 'headache')
+    w.add_symptom_check(99, 'unknown user')
+    w.add_ai_consultation(2, 'question', 'answer')
+    w.add_symptom_check(1, 'cough')
+    assert w.flush() == 3
+    assert [r['symptoms'] for r in db.symptoms_history] == ['headache', 'cough']
+    assert len(db.ai_consultations) == 1
+    stats = w.stats()
+    assert stats['dropped'] == 1
+    assert stats['isolated_batches'] == 1
+    assert set().union(*flushed) == {1, 2}
+
+
+def test_bad_rows_of_one_user_are_isolated_row_by_row(db):
+    w = writer(db)
+    w.add_symptom_check(1, 'headache')
+    db.users.pop(2)
+    w.add_symptom_check(2, 'gone')
+    w.add_symptom_check(2, 'also gone')
+    assert w.flush() == 1
+    assert w.stats()['dropped'] == 2
+
+
+def test_an_outage_is_retried(db):
+    db.outages = 1
+    w = writer(db)
+    w.add_symptom_check(1, 'headache')
+    assert w.flush() == 0
+    assert w.stats()['dropped'] == 0
+    assert w.flush() == 1
+    assert len(db.symptoms_history) == 1
+
+
+def test_an_outage_drops_after_max_attempts(db):
+    db.outages = 5
+    w = writer(db, max_attempts=2)
+    w.add_symptom_check(1, 'headache')
+    w.flush()
+    w.flush()
+    assert w.stats()['dropped'] == 1
+    assert db.symptoms_history == []
+
+
+def test_disabled_writer_writes_synchronously(db):
+    w = writer(db, enabled=False)
+    w.add_symptom_check(1, 'headache')
+    assert len(db.symptoms_history) == 1
@@ -0,0 +1,438 @@
+import re
+import threading
+
+import numpy as np
+
+
+# Canonical symptom -> phrases that mean it. Matching is on whole words, longest phrase first.
+SYMPTOMS = {
+    'fever': ['fever', 'feverish', 'temperature', 'high temperature', 'pyrexia'],
+    'chills': ['chills', 'shivering', 'shivers'],
+    'fatigue': ['fatigue', 'tired', 'tiredness', 'exhausted', 'exhaustion', 'weakness', 'weak', 'lethargy', 'no energy'],
+    'headache': ['headache', 'headaches', 'head ache', 'head pain', 'head hurts', 'head is pounding'],
+    'body aches': ['body aches', 'body ache', 'body pain', 'muscle aches', 'muscle ache', 'muscle pain', 'aching',
+                   'aches', 'myalgia', 'sore muscles'],
+    'runny nose': ['runny nose', 'running nose', 'nose running', 'rhinorrhea', 'dripping nose'],
+    'stuffy nose': ['stuffy nose', 'blocked nose', 'nasal congestion', 'congestion', 'congested', 'stuffed nose'],
+    'sneezing': ['sneezing', 'sneeze', 'sneezes'],
+    'sore throat': ['sore throat', 'throat pain', 'throat hurts', 'scratchy throat', 'painful throat'],
+    'cough': ['cough', 'coughing', 'dry cough', 'tickly cough'],
+    'productive cough': ['productive cough', 'wet cough', 'phlegm', 'mucus', 'sputum', 'chesty cough'],
+    'itchy eyes': ['itchy eyes', 'watery eyes', 'eyes watering', 'itchy watery eyes'],
+    'red eye': ['red eye', 'red eyes', 'pink eye', 'eye discharge', 'sticky eyes', 'crusty eyes'],
+    'nausea': ['nausea', 'nauseous', 'nauseated', 'queasy', 'feel sick', 'feeling sick'],
+    'vomiting': ['vomiting', 'vomit', 'vomited', 'throwing up', 'threw up', 'puking'],
+    'diarrhea': ['diarrhea', 'diarrhoea', 'loose stools', 'loose motions', 'watery stools', 'runny stools'],
+    'stomach cramps': ['stomach cramps', 'abdominal cramps', 'cramps', 'cramping', 'stomach ache', 'stomachache',
+                       'tummy ache', 'belly ache', 'stomach pain'],
+    'bloating': ['bloating', 'bloated', 'gas', 'flatulence', 'wind'],
+    'heartburn': ['heartburn', 'acid reflux', 'reflux', 'acidity', 'burning in chest after eating', 'indigestion'],
+    'loss of appetite': ['loss of appetite', 'no appetite', 'not hungry', 'poor appetite'],
+    'constipation': ['constipation', 'constipated', 'hard stools', 'cannot poop'],
+    'sensitivity to light': ['sensitivity to light', 'light sensitivity', 'photophobia', 'light hurts my eyes'],
+    'throbbing pain': ['throbbing', 'pulsing', 'pounding'],
+    'aura': ['aura', 'flashing lights', 'zigzag lines', 'visual disturbance'],
+    'neck tension': ['neck tension', 'tight neck', 'neck pain', 'stiff shoulders', 'shoulder tension'],
+    'stress': ['stress', 'stressed', 'anxious', 'anxiety', 'tension'],
+    'poor sleep': ['poor sleep', 'insomnia', 'cant sleep', 'cannot sleep', 'trouble sleeping', 'sleepless'],
+    'dizziness': ['dizziness', 'dizzy', 'lightheaded', 'light headed', 'vertigo'],
+    'dry mouth': ['dry mouth', 'thirsty', 'thirst', 'dark urine'],
+    'burning urination': ['burning urination', 'burning when peeing', 'painful urination', 'burning pee',
+                          'pain when urinating', 'dysuria'],
+    'frequent urination': ['frequent urination', 'peeing often', 'urinating often', 'urgency', 'need to pee'],
+    'lower abdominal pain': ['lower abdominal pain', 'lower belly pain', 'pelvic pain', 'lower stomach pain'],
+    'itchy skin': ['itchy skin', 'itching', 'itchy', 'itch', 'pruritus'],
+    'rash': ['rash', 'hives', 'red patches', 'red spots', 'bumps', 'welts'],
+    'dry skin': ['dry skin', 'flaky skin', 'scaly skin', 'cracked skin'],
+    'ear pain': ['ear pain', 'earache', 'ear ache', 'ear hurts', 'blocked ear'],
+    'sinus pressure': ['sinus pressure', 'sinus pain', 'facial pain', 'face pressure', 'pressure behind eyes'],
+    'back pain': ['back pain', 'backache', 'lower back pain', 'back ache', 'sore back'],
+    'stiffness': ['stiffness', 'stiff back', 'stiff'],
+    'toothache': ['toothache', 'tooth pain', 'tooth ache', 'sensitive teeth'],
+    # Red flags: never answered locally
+    'chest pain': ['chest pain', 'chest tightness', 'tight chest', 'chest pressure', 'pain in chest'],
+    'shortness of breath': ['shortness of breath', 'short of breath', 'breathless', 'difficulty breathing',
+                            'trouble breathing', 'cant breathe', 'cannot breathe', 'wheezing'],
+    'confusion': ['confusion', 'confused', 'disoriented', 'slurred speech'],
+    'fainting': ['fainting', 'fainted', 'passed out', 'blackout', 'unconscious', 'collapsed'],
+    'seizure': ['seizure', 'seizures', 'convulsion', 'convulsions', 'fits'],
+    'stiff neck': ['stiff neck', 'neck stiffness'],
+    'blood': ['blood', 'bleeding', 'bloody', 'coughing blood', 'vomiting blood', 'blood in stool', 'blood in urine'],
+    'severe pain': ['severe pain', 'unbearable pain', 'worst pain', 'excruciating', 'worst headache'],
+    'numbness': ['numbness', 'numb', 'paralysis', 'cannot move', 'face drooping', 'tingling'],
+    'suicidal thoughts': ['suicidal', 'suicide', 'kill myself', 'self harm', 'want to die'],
+    'pregnancy': ['pregnant', 'pregnancy'],
+    'swelling of face': ['swollen face', 'swollen lips', 'swollen tongue', 'throat swelling', 'face swelling'],
+}
+
+RED_FLAGS = {
+    'chest pain', 'shortness of breath', 'confusion', 'fainting', 'seizure', 'stiff neck', 'blood',
+    'severe pain', 'numbness', 'suicidal thoughts', 'pregnancy', 'swelling of face'
+}
+
+# Red flags phrased in ways the phrase table misses ("lips are swollen", "neck is stiff", "feeling
+# faint"). Checked on single words anywhere in the text, ignoring negation ("not able to breathe"),
+# so a paraphrase escalates instead of lowering coverage a little.
+RED_FLAG_WORDS = {
+    'faint', 'faints', 'fainted', 'fainting', 'breathe', 'breathing', 'breath', 'breathless', 'choking',
+    'unconscious', 'unresponsive', 'collapse', 'collapsed', 'seizure', 'numb', 'paralysed', 'paralyzed',
+    'slurred', 'drooping', 'bleeding', 'overdose', 'anaphylaxis', 'stroke', 'suicidal'
+}
+# Pairs of word sets that are a red flag when a word from each appears anywhere in the text
+RED_FLAG_PAIRS = [
+    ({'swollen', 'swelling', 'swell', 'swells', 'swelled', 'puffy'},
+     {'lip', 'lips', 'tongue', 'face', 'throat', 'mouth', 'eyelids'}),
+    ({'neck'}, {'stiff', 'stiffness', 'rigid'}),
+    ({'chest'}, {'hurt', 'hurts', 'hurting', 'pain', 'painful', 'ache', 'aches', 'aching', 'sore', 'tight',
+                 'tightness', 'pressure', 'heavy', 'crushing', 'squeezing'}),
+    ({'lip', 'lips', 'face', 'skin', 'fingers'}, {'blue', 'grey', 'gray'}),
+]
+
+
+def keyword_red_flag(text):
+    """True if text mentions a red flag word or word pair, whatever the phrasing"""
+    words = set(_tokens(text))
+    return bool(words & RED_FLAG_WORDS) or any(words & a and words & b for a, b in RED_FLAG_PAIRS)
+
+
+# A temperature: 104, 103.5F, 39.8 C, 40°C, 102 degrees. Bare numbers only count next to a fever word
+_TEMPERATURE = re.compile(r"(?<![\d.])(\d{2,3}(?:\.\d+)?)"
+                          r"(?!\s*(?:years?|yrs?|yo|kg|lbs?|pounds|mg|ml|mins?|minutes?|hours?|hrs?|days?|weeks?|"
+                          r"months?|times|%|/))"
+                          r"\s*(°|º|degrees?|deg)?\s*(celsius|fahrenheit|c|f)?(?![a-z0-9])")
+_FEVER_WORDS = {'fever', 'feverish', 'temperature', 'temp', 'pyrexia'}
+# A duration: "3 weeks", "two months", "a week", "several days"
+_DURATION = re.compile(r"\b(\d+|an?|one|two|three|four|five|six|seven|eight|nine|ten|several|few|couple of)\s+"
+                       r"(day|week|month|year)s?\b(?!\s+old)")
+_COUNTS = {'a': 1, 'an': 1, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6, 'seven': 7,
+           'eight': 8, 'nine': 9, 'ten': 10, 'several': 3, 'few': 3, 'couple of': 2}
+_UNIT_DAYS = {'day': 1, 'week': 7, 'month': 30, 'year': 365}
+HIGH_TEMPERATURE_C = 39.5
+LOW_TEMPERATURE_C = 35.0
+LONG_DURATION_DAYS = 14
+
+
+def _temperatures_c(text):
+    """Temperatures mentioned in text, in °C; a bare number needs a fever word and a plausible range"""
+    text = text.lower()
+    fever_context = bool(_FEVER_WORDS & set(_tokens(text)))
+    temperatures = []
+    for value, degree, unit in _TEMPERATURE.findall(text):
+        value = float(value)
+        if not (degree or unit or fever_context):
+            continue
+        if unit:
+            celsius = unit.startswith('c')
+        elif 34 <= value <= 45:
+            celsius = True
+        elif 90 <= value <= 115:
+            celsius = False
+        else:
+            continue
+        temperatures.append(value if celsius else (value - 32) * 5 / 9)
+    return temperatures
+
+
+def measurement_flag(text):
+    """'high_temperature', 'low_temperature' or 'long_duration' when a number in text needs a clinician"""
+    for celsius in _temperatures_c(text):
+        # 39.4 °C is 103 °F
+        if celsius >= HIGH_TEMPERATURE_C - 0.15:
+            return 'high_temperature'
+        if celsius <= LOW_TEMPERATURE_C:
+            return 'low_temperature'
+    for count, unit in _DURATION.findall(text.lower()):
+        days = (int(count) if count.isdigit() else _COUNTS[count]) * _UNIT_DAYS[unit]
+        if days >= LONG_DURATION_DAYS:
+            return 'long_duration'
+    return None
+
+
+# Words that carry no symptom information; anything else left unmatched lowers coverage
+STOPWORDS = set("""
+a an the i im i've ive me my mine we our you your he she it its they them their have has had having am is are was
+were be been being do does did and or but with of in on at to for from since about for since this that these those
+feel feeling feels felt get getting got some little bit lot very really quite slightly slight mild mildly also too
+day days week weeks hour hours morning night evening yesterday today last past two three few couple since ago now
+still just keep keeps kept all over whole body both left right side a lot of kind sort like bad worse better
+started start starting begin began when after before during constant constantly sometimes often always again
+""".split())
+NEGATIONS = {'no', 'not', 'without', 'denies', 'dont', 'didnt', 'doesnt', 'never', 'nor', 'neither'}
+
+DISCLAIMER = "This is an automated first-pass assessment, not a diagnosis."
+
+# (name, severity, {symptom: weight}, recommendations, see_doctor, home_remedies)
+CONDITIONS = [
+    ('Common cold', 'Low',
+     {'runny nose': 1.0, 'stuffy nose': 1.0, 'sneezing': 0.9, 'sore throat': 0.8, 'cough': 0.7,
+      'headache': 0.3, 'fatigue': 0.3, 'fever': 0.2},
+     "Rest, drink plenty of fluids and use saline nasal drops or steam for congestion.",
+     "If symptoms last more than 10 days, fever goes above 39°C (102°F) or breathing becomes difficult.",
+     "Warm fluids, honey and lemon in warm water, steam inhalation and adequate sleep."),
+    ('Influenza (flu)', 'Medium',
+     {'fever': 1.0, 'chills': 0.8, 'body aches': 1.0, 'fatigue': 0.9, 'headache': 0.6, 'cough': 0.7,
+      'sore throat': 0.4, 'loss of appetite': 0.3, 'runny nose': 0.2},
+     "Rest at home, stay hydrated and use paracetamol or ibuprofen for fever and aches if suitable for you.",
+     "If you are over 65, pregnant, have a long-term condition, or symptoms worsen after 3-4 days.",
+     "Warm fluids, light meals, plenty of rest and a cool cloth for fever."),
+    ('Viral gastroenteritis', 'Medium',
+     {'diarrhea': 1.0, 'vomiting': 0.9, 'nausea': 0.9, 'stomach cramps': 0.8, 'fever': 0.3,
+      'loss of appetite': 0.4, 'fatigue': 0.2},
+     "Drink small, frequent sips of water or oral rehydration solution and eat bland food once vomiting settles.",
+     "If you cannot keep fluids down for 24 hours, see blood in stool or vomit, or have signs of dehydration.",
+     "Oral rehydration salts, bananas, rice, toast and plain crackers."),
+    ('Tension headache', 'Low',
+     {'headache': 1.0, 'neck tension': 0.8, 'stress': 0.7, 'poor sleep': 0.4, 'fatigue': 0.3},
+     "Take regular breaks, improve posture and sleep, and consider an over-the-counter pain reliever.",
+     "If headaches are frequent, wake you up at night, or come with vision changes or weakness.",
+     "Neck and shoulder stretches, a warm compress, hydration and relaxation techniques."),
+    ('Migraine', 'Medium',
+     {'headache': 1.0, 'throbbing pain': 0.9, 'sensitivity to light': 0.9, 'nausea': 0.7, 'aura': 0.8,
+      'vomiting': 0.3, 'dizziness': 0.2},
+     "Rest in a dark, quiet room and take your usual migraine or pain relief early in the attack.",
+     "If this is your first migraine, attacks become more frequent, or the pattern suddenly changes.",
+     "A cold compress on the forehead, hydration, regular meals and sleep, and a headache diary."),
+    ('Seasonal allergies (hay fever)', 'Low',
+     {'sneezing': 1.0, 'itchy eyes': 1.0, 'runny nose': 0.8, 'stuffy nose': 0.6, 'cough': 0.2},
+     "Limit exposure to pollen, keep windows closed on high-pollen days and consider an antihistamine.",
+     "If over-the-counter treatment does not help or symptoms interfere with sleep or breathing.",
+     "Saline nasal rinse, showering after being outdoors and wearing sunglasses outside."),
+    ('Acid reflux', 'Low',
+     {'heartburn': 1.0, 'bloating': 0.5, 'nausea': 0.3, 'sore throat': 0.2, 'cough': 0.2},
+     "Eat smaller meals, avoid lying down for 3 hours after eating and limit spicy, fatty food, alcohol and coffee.",
+     "If symptoms happen more than twice a week, swallowing is difficult, or you lose weight without trying.",
+     "Raise the head of the bed, chew gum after meals and try ginger or chamomile tea."),
+    ('Dehydration', 'Medium',
+     {'dry mouth': 1.0, 'dizziness': 0.8, 'fatigue': 0.6, 'headache': 0.5},
+     "Drink water or oral rehydration solution steadily over the next few hours and rest somewhere cool.",
+     "If you feel confused, stop passing urine, or dizziness continues after drinking fluids.",
+     "Small frequent sips of water, oral rehydration salts and water-rich fruit."),
+    ('Urinary tract infection', 'Medium',
+     {'burning urination': 1.0, 'frequent urination': 0.9, 'lower abdominal pain': 0.7, 'fever': 0.2},
+     "Drink plenty of water and see a pharmacist or doctor, as antibiotics are often needed.",
+     "Soon, and urgently if you have fever, back or side pain, or are pregnant.",
+     "Plenty of water, avoiding holding urine and a warm pad on the lower abdomen."),
+    ('Allergic skin reaction', 'Low',
+     {'rash': 1.0, 'itchy skin': 1.0, 'dry skin': 0.3},
+     "Avoid likely triggers such as new soaps, foods or plants, and consider an antihistamine or soothing cream.",
+     "If the rash spreads quickly, blisters, or comes with swelling of the face or trouble breathing.",
+     "Cool compresses, fragrance-free moisturiser and loose cotton clothing."),
+    ('Eczema flare', 'Low',
+     {'dry skin': 1.0, 'itchy skin': 0.9, 'rash': 0.5},
+     "Moisturise several times a day and avoid harsh soaps and long hot showers.",
+     "If the skin becomes infected (oozing, crusting) or the flare does not settle with moisturisers.",
+     "Thick emollients, lukewarm baths with colloidal oatmeal and keeping nails short."),
+    ('Conjunctivitis (pink eye)', 'Low',
+     {'red eye': 1.0, 'itchy eyes': 0.6},
+     "Keep the eyes clean, avoid touching them and do not share towels; avoid contact lenses until it clears.",
+     "If you have eye pain, changes in vision, sensitivity to light, or it does not improve within a week.",
+     "Clean the eyelids with cooled boiled water and use a cool compress."),
+    ('Sinusitis', 'Low',
+     {'sinus pressure': 1.0, 'stuffy nose': 0.8, 'headache': 0.5, 'runny nose': 0.4, 'fever': 0.2,
+      'productive cough': 0.3},
+     "Rest, stay hydrated and use saline nasal rinses or steam; most cases clear within 2-3 weeks.",
+     "If symptoms last more than 10 days, are severe, or come with swelling around the eyes.",
+     "Steam inhalation, a warm compress over the sinuses and sleeping with the head raised."),
+    ('Chest cold (acute bronchitis)', 'Medium',
+     {'productive cough': 1.0, 'cough': 0.8, 'fatigue': 0.4, 'sore throat': 0.3, 'fever': 0.3},
+     "Rest, drink fluids and avoid smoke; the cough can last up to 3 weeks.",
+     "If the cough lasts more than 3 weeks, you have a high fever, or you become short of breath.",
+     "Honey in warm water, steam inhalation and sleeping with the head raised."),
+    ('Ear infection', 'Medium',
+     {'ear pain': 1.0, 'fever': 0.4, 'headache': 0.2, 'sore throat': 0.2},
+     "Use pain relief if suitable for you; many ear infections clear on their own within 3 days.",
+     "If pain lasts more than 3 days, there is discharge from the ear, or hearing is affected.",
+     "A warm compress held against the ear and resting with the affected ear facing up."),
+    ('Muscle strain (lower back)', 'Low',
+     {'back pain': 1.0, 'stiffness': 0.7},
+     "Keep moving gently, avoid heavy lifting and use pain relief if suitable for you.",
+     "If pain spreads down the legs, you have numbness, or problems passing urine or stools.",
+     "Heat packs, gentle stretching and short walks."),
+    ('Constipation', 'Low',
+     {'constipation': 1.0, 'bloating': 0.6, 'stomach cramps': 0.4},
+     "Increase fibre and fluids gradually and stay active.",
+     "If it lasts more than 3 weeks, you see blood, or you lose weight without trying.",
+     "Prunes, whole grains, warm water in the morning and regular meal times."),
+    ('Dental problem', 'Low',
+     {'toothache': 1.0, 'headache': 0.2, 'ear pain': 0.2},
+     "Use pain relief if suitable for you and book a dental appointment.",
+     "See a dentist soon, and urgently if your face or jaw swells or you have a fever.",
+     "Rinse with warm salt water and apply a cold compress to the cheek."),
+]
+
+
+_CLAUSE_SPLIT = re.compile(r"[,;.!?\n]+|\bbut\b")
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def _tokens(text):
+    # "can't" -> "cant", "don't" -> "dont"
+    return _TOKEN.findall(text.lower().replace("'", '').replace('’', ''))
+
+
+class SymptomNormalizer:
+    """Maps free text to canonical symptom indices, skipping negated mentions.
+
+    Phrases are matched longest first on word boundaries. A negation word
+    ("no", "without", ...) earlier in the same clause negates every symptom
+    after it. Words that are neither symptoms nor stopwords are counted as
+    unknown, so the caller can tell how much of the text was understood.
+    """
+
+    def __init__(self, symptoms=SYMPTOMS):
+        self.names = list(symptoms)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.phrases = {}
+        for name, synonyms in symptoms.items():
+            for phrase in [name] + synonyms:
+                self.phrases[tuple(_tokens(phrase))] = self.index[name]
+        self.max_words = max(len(p) for p in self.phrases)
+
+    def parse(self, text):
+        """Returns (symptom indices, negated indices, matched word count, unknown word count)"""
+        found, negated = set(), set()
+        matched = unknown = 0
+        for clause in _CLAUSE_SPLIT.split(text):
+            words = _tokens(clause)
+            negate = False
+            i = 0
+            while i < len(words):
+                if words[i] in NEGATIONS:
+                    negate = True
+                    i += 1
+                    continue
+                for n in range(min(self.max_words, len(words) - i), 0, -1):
+                    symptom = self.phrases.get(tuple(words[i:i + n]))
+                    if symptom is not None:
+                        (negated if negate else found).add(symptom)
+                        matched += n
+                        i += n
+                        break
+                else:
+                    if words[i] not in STOPWORDS and not words[i].isdigit():
+                        unknown += 1
+                    i += 1
+        return found - negated, negated, matched, unknown
+
+
+class TriageEngine:
+    """Scores symptom text against a fixed condition table and answers confident, routine cases.
+
+    Conditions are columns of an L2-normalised symptom x condition weight
+    matrix, so scoring is one matrix product of the (normalised) symptom
+    indicator vector with it: the cosine similarity with every condition.
+    ``confidence`` is the best cosine scaled by the square root of the
+    share of words that were understood. A case is answered locally only when it has at least
+    ``min_symptoms`` recognised symptoms, no red flags (as phrases or as
+    keywords, see keyword_red_flag), no temperature at or above 39.5 °C
+    (103 °F) or symptoms lasting two weeks or more (see measurement_flag),
+    confidence at least
+    ``threshold`` and a clear ``min_margin`` over the runner-up condition.
+    Everything else is escalated to the model.
+    """
+
+    def __init__(self, threshold=0.75, min_margin=0.1, min_symptoms=2, conditions=CONDITIONS, symptoms=SYMPTOMS):
+        self.threshold = threshold
+        self.min_margin = min_margin
+        self.min_symptoms = min_symptoms
+        self.normalizer = SymptomNormalizer(symptoms)
+        self.conditions = conditions
+        self.red_flags = np.zeros(len(self.normalizer.names), dtype=bool)
+        for name in RED_FLAGS:
+            self.red_flags[self.normalizer.index[name]] = True
+
+        weights = np.zeros((len(self.normalizer.names), len(conditions)), dtype=np.float32)
+        for c, (_, _, symptom_weights, _, _, _) in enumerate(conditions):
+            for name, weight in symptom_weights.items():
+                weights[self.normalizer.index[name], c] = weight
+        self.weights = weights / np.linalg.norm(weights, axis=0, keepdims=True)
+
+        self._lock = threading.Lock()
+        self.answered = 0
+        self.escalated = {}
+
+    def vectorize(self, texts):
+        """Indicator matrix (len(texts) x symptoms) plus per-text (coverage, red flag) arrays"""
+        x = np.zeros((len(texts), len(self.normalizer.names)), dtype=np.float32)
+        coverage = np.zeros(len(texts), dtype=np.float32)
+        keyword_flag = np.zeros(len(texts), dtype=bool)
+        for row, text in enumerate(texts):
+            found, _, matched, unknown = self.normalizer.parse(text)
+            if found:
+                x[row, list(found)] = 1.0
+            coverage[row] = matched / (matched + unknown) if matched else 0.0
+            keyword_flag[row] = keyword_red_flag(text)
+        red_flag = (x[:, self.red_flags] > 0).any(axis=1) | keyword_flag
+        return x, coverage, red_flag
+
+    def score(self, x):
+        """Cosine similarity of each indicator row with every condition"""
+        norms = np.linalg.norm(x, axis=1, keepdims=True)
+        return (x / np.maximum(norms, 1e-9)) @ self.weights
+
+    def triage_many(self, texts):
+        """One (analysis or None, confidence, reason) tuple per text; reason says why it was escalated"""
+        x, coverage, red_flag = self.vectorize(texts)
+        scores = self.score(x)
+        counts = (x > 0).sum(axis=1)
+        order = np.argsort(-scores, axis=1)
+        rows = np.arange(len(texts))
+        best, second = scores[rows, order[:, 0]], scores[rows, order[:, 1]]
+        # Unknown words may be anything (including something serious), but a few are normal filler
+        confidence = best * np.sqrt(coverage)
+
+        results = []
+        for i in range(len(texts)):
+            measured = None if red_flag[i] else measurement_flag(texts[i])
+            if red_flag[i]:
+                reason = 'red_flag'
+            elif measured:
+                reason = measured
+            elif counts[i] < self.min_symptoms:
+                reason = 'too_few_symptoms'
+            elif confidence[i] < self.threshold:
+                reason = 'low_confidence'
+            elif best[i] - second[i] < self.min_margin:
+                reason = 'ambiguous'
+            else:
+                reason = None
+            analysis = None if reason else self._analysis(scores[i], order[i])
+            results.append((analysis, float(confidence[i]), reason))
+
+        with self._lock:
+            for _, _, reason in results:
+                if reason is None:
+                    self.answered += 1
+                else:
+                    self.escalated[reason] = self.escalated.get(reason, 0) + 1
+        return results
+
+    def triage(self, text):
+        return self.triage_many([text])[0]
+
+    def _analysis(self, scores, order):
+        # Softmax over the cosines, sharpened so a clear winner reads as a clear winner
+        top = [c for c in order[:3] if scores[c] > 0]
+        weights = np.exp(scores[top] * 5)
+        shares = weights / weights.sum()
+        _, severity, _, recommendations, see_doctor, home_remedies = self.conditions[top[0]]
+        return {
+            'conditions': [{'name': self.conditions[c][0], 'probability': f"{round(float(s) * 100)}%"}
+                           for c, s in zip(top, shares)],
+            'severity': severity,
+            'recommendations': f"{recommendations} {DISCLAIMER}",
+            'see_doctor': see_doctor,
+            'home_remedies': home_remedies
+        }
+
+    def stats(self):
+        with self._lock:
+            escalated = sum(self.escalated.values())
+            total = self.answered + escalated
+            return {
+                'answered': self.answered,
+                'escalated': escalated,
+                **{f"escalated_{reason}": count for reason, count in self.escalated.items()},
+                'answer_rate': round(self.answered / total, 3) if total else 0.0,
+                'threshold': self.threshold
+            }
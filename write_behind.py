@@ -0,0 +1,212 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+
+log = logging.getLogger(__name__)
+
+
+class HistoryWriter:
+    """Write-behind queue for symptoms_history and ai_consultations rows.
+
+    Request handlers enqueue rows and return immediately. A background thread
+    drains the queue and writes it with Database.add_history_batch, either when
+    ``max_batch`` rows are waiting or every ``flush_interval`` seconds. A
+    batch that fails because of its rows (the database's ROW_ERRORS, e.g. a
+    foreign key violation for a user deleted meanwhile) is split per user
+    and then per row; only the rows that still fail are logged and dropped.
+    A batch that fails otherwise is retried up to ``max_attempts`` times
+    before it is dropped.
+    Pending rows are flushed at interpreter exit, which is how gunicorn shuts
+    workers down gracefully. With ``enabled=False`` every write is synchronous.
+    """
+
+    def __init__(self, db, max_batch=200, flush_interval=0.5, max_queue=10000,
+                 max_attempts=3, enabled=True, on_flush=None):
+        self.db = db
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.max_attempts = max_attempts
+        self.enabled = enabled
+        # Called with the set of user ids whose history was just written
+        self.on_flush = on_flush
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._retry = []
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.failures = 0
+        self.isolated = 0
+        self.sync_fallbacks = 0
+        self.last_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+        atexit.register(self.close)
+
+    def _ensure_started(self):
+        pid = os.getpid()
+        if self._thread is None or self._pid != pid:
+            with self._lock:
+                if self._thread is None or self._pid != pid:
+                    # Fresh queue and thread per process; a forked child does not inherit the flusher
+                    self._queue = queue.Queue(maxsize=self.max_queue)
+                    self._retry = []
+                    self._stopping = False
+                    self._pid = pid
+                    self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+                    self._thread.start()
+
+    def add_symptom_check(self, user_id, symptoms, analysis_result=None):
+        if isinstance(analysis_result, dict):
+            analysis_result = json.dumps(analysis_result)
+        self._enqueue(('symptom', (user_id, symptoms, str(analysis_result), datetime.now())))
+
+    def add_symptom_checks(self, user_id, checks):
+        for symptoms, analysis_result in checks:
+            self.add_symptom_check(user_id, symptoms, analysis_result)
+
+    def add_ai_consultation(self, user_id, question, response, conversation_id=None):
+        self._enqueue(('consultation', (user_id, conversation_id, question, response, datetime.now())))
+
+    def _enqueue(self, item):
+        if not self.enabled:
+            self._write([item])
+            return
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            # Back-pressure: write this row in the request instead of losing it
+            with self._lock:
+                self.sync_fallbacks += 1
+            self._write([item])
+            return
+        with self._lock:
+            self.enqueued += 1
+        if self._queue.qsize() >= self.max_batch:
+            self._wakeup.set()
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def _drain(self):
+        items = []
+        while len(items) < self.max_batch:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def flush(self):
+        """Write everything queued so far; returns the number of rows written"""
+        if self._queue is None:
+            return 0
+        with self._flush_lock:
+            written_before = self.written
+            while True:
+                with self._lock:
+                    retry, self._retry = self._retry, []
+                failed = False
+                for attempts, items in retry:
+                    if failed:
+                        # Database is still failing: keep the rest for the next flush
+                        with self._lock:
+                            self._retry.append((attempts, items))
+                    elif not self._write(items, attempts):
+                        failed = True
+                if failed:
+                    break
+                items = self._drain()
+                if not items or not self._write(items):
+                    break
+            return self.written - written_before
+
+    def _write(self, items, attempts=0):
+        """Write items; False if some were queued for a retry because the database is failing"""
+        try:
+            self._insert(items)
+        except Exception as e:
+            row_error = isinstance(e, getattr(self.db, 'ROW_ERRORS', ()))
+            if row_error and len(items) > 1:
+                return self._isolate(items, attempts)
+            attempts += 1
+            with self._lock:
+                self.failures += 1
+                if not row_error and attempts < self.max_attempts and self.enabled:
+                    self._retry.append((attempts, items))
+                else:
+                    self.dropped += len(items)
+            log.error("history write failed: %s", e, extra={
+                'attempt': attempts, 'rows': len(items), 'user_ids': sorted({row[0] for _, row in items}),
+                'dropped': row_error or attempts >= self.max_attempts or not self.enabled})
+            return row_error
+        if self.on_flush is not None:
+            self.on_flush({row[0] for _, row in items})
+        return True
+
+    def _isolate(self, items, attempts):
+        """Write a batch rejected for its rows one user at a time, then one row at a time"""
+        by_user = {}
+        for item in items:
+            by_user.setdefault(item[1][0], []).append(item)
+        parts = list(by_user.values()) if len(by_user) > 1 else [[item] for item in items]
+        with self._lock:
+            self.isolated += 1
+        ok = True
+        for part in parts:
+            ok = self._write(part, attempts) and ok
+        return ok
+
+    def _insert(self, items):
+        symptom_rows = [row for kind, row in items if kind == 'symptom']
+        consultation_rows = [row for kind, row in items if kind == 'consultation']
+        started = time.perf_counter()
+        self.db.add_history_batch(symptom_rows, consultation_rows)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.written += len(items)
+            self.batches += 1
+            self.last_flush_ms = elapsed_ms
+            self.total_flush_ms += elapsed_ms
+
+    def close(self):
+        """Stop the flusher and write whatever is still queued"""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._stopping = True
+        self._wakeup.set()
+        self._thread.join(timeout=5)
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'queue_depth': self._queue.qsize() if self._queue is not None else 0,
+                'retry_batches': len(self._retry),
+                'enqueued': self.enqueued,
+                'written': self.written,
+                'dropped': self.dropped,
+                'batches': self.batches,
+                'failures': self.failures,
+                'isolated_batches': self.isolated,
+                'sync_fallbacks': self.sync_fallbacks,
+                'last_flush_ms': round(self.last_flush_ms, 3),
+                'avg_flush_ms': round(self.total_flush_ms / self.batches, 3) if self.batches else 0.0
+            }